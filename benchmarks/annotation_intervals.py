@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for getting the intervals covered by a type of annotation on a
+chromosome. Previously, the whole annotation zarr was read into a pandas
+DataFrame for each query, which was filtered by comparing the seqid and type
+strings. The intervals are now computed for all types on a chromosome at
+once, with integer-coded types, from only the rows and columns needed.
+
+We report the time taken for each query of the pandas method, and for the
+first and later queries using Annotation.get_annotation_intervals.
+
+Usage: PYTHONPATH=. python benchmarks/annotation_intervals.py --num-rows 2000000
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import numcodecs
+import numpy as np
+import zarr
+
+import stdpopsim
+from stdpopsim import annotations
+from stdpopsim import utils
+
+TYPES = [
+    "gene",
+    "mRNA",
+    "exon",
+    "CDS",
+    "five_prime_UTR",
+    "three_prime_UTR",
+    "ncRNA_gene",
+    "lnc_RNA",
+    "pseudogene",
+    "biological_region",
+]
+
+
+def make_annotations(path, num_rows, num_chromosomes, seed):
+    """
+    Writes random annotations, which are sorted by chromosome and position,
+    to a zarr in the specified zip file.
+    """
+    rng = np.random.default_rng(seed)
+    seqid = np.sort(rng.integers(1, num_chromosomes + 1, size=num_rows))
+    start = np.zeros(num_rows, dtype=np.int64)
+    for chrom in range(1, num_chromosomes + 1):
+        rows = seqid == chrom
+        start[rows] = np.sort(rng.integers(1, 10 ** 8, size=np.sum(rows)))
+    columns = {
+        "seqid": seqid.astype(str).astype(object),
+        "source": np.full(num_rows, "ensembl", dtype=object),
+        "type": rng.choice(TYPES, size=num_rows).astype(object),
+        "start": start,
+        "end": start + rng.integers(1, 10 ** 4, size=num_rows),
+        "score": np.zeros(num_rows),
+        "strand": rng.choice(["+", "-"], size=num_rows).astype(object),
+        "phase": np.full(num_rows, ".", dtype=object),
+    }
+    with zarr.ZipStore(str(path), mode="w") as store:
+        root = zarr.group(store=store)
+        for name, values in columns.items():
+            kwargs = {}
+            if values.dtype == object:
+                kwargs["object_codec"] = numcodecs.VLenUTF8()
+            root.array(name, values, **kwargs)
+
+
+def pandas_intervals(annotation, a_type, chrom_id):
+    bed = annotations.zarr_to_dataframe(str(annotation.cache_path))
+    chrom_annotations = bed[bed.seqid == chrom_id]
+    subset = chrom_annotations[chrom_annotations.type == a_type]
+    return subset[["start", "end"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-rows", type=int, default=2000000)
+    parser.add_argument("--num-chromosomes", type=int, default=22)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    queries = [(a_type, "1") for a_type in TYPES[:3]] + [("gene", "2")]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / "annotations.zip"
+        make_annotations(path, args.num_rows, args.num_chromosomes, args.seed)
+        stdpopsim.set_cache_dir(pathlib.Path(tmpdir) / "cache")
+        genome = stdpopsim.Genome(
+            chromosomes=[
+                stdpopsim.Chromosome(
+                    id=str(j),
+                    length=10 ** 8,
+                    recombination_rate=1e-8,
+                    mutation_rate=1e-8,
+                )
+                for j in range(1, args.num_chromosomes + 1)
+            ]
+        )
+        species = stdpopsim.Species(
+            id="BenSpe",
+            ensembl_id="benchmark_species",
+            name="Benchmark species",
+            common_name="Benchmark species",
+            genome=genome,
+        )
+        annotation = stdpopsim.Annotation(
+            species=species,
+            id="benchmark",
+            url=None,
+            zarr_url=path.resolve().as_uri(),
+            zarr_sha256=utils.sha256(path),
+            description="Random annotations",
+        )
+        annotation.download()
+        print(f"{args.num_rows} annotations on {args.num_chromosomes} chromosomes")
+
+        for a_type, chrom_id in queries:
+            start = time.perf_counter()
+            pandas_intervals(annotation, a_type, chrom_id)
+            elapsed = time.perf_counter() - start
+            print(f"{'pandas':>16} {a_type:>6} chr{chrom_id}: {elapsed:8.3f} s")
+        for a_type, chrom_id in queries:
+            start = time.perf_counter()
+            annotation.get_annotation_intervals(a_type, chrom_id)
+            elapsed = time.perf_counter() - start
+            print(f"{'intervals':>16} {a_type:>6} chr{chrom_id}: {elapsed:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
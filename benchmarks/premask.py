@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark for simulating a contig with a sparse inclusion mask using msprime.
+Previously, ancestry and mutations were simulated for the whole contig, and
+the mask was only applied to the simulated tree sequence. With the
+msprime_premask option, no mutations are simulated in masked regions, and
+the masked flanks before the first and after the last kept region are not
+simulated.
+
+We report the time taken to simulate each replicate with and without
+premasking, and the mean number of sites, which should agree.
+
+Usage: PYTHONPATH=. python benchmarks/premask.py --num-intervals 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+import stdpopsim
+
+
+def make_mask(left, right, num_intervals, interval_length, seed):
+    """
+    Returns a sorted inclusion mask of randomly placed intervals in
+    [left, right), such as the exons in a region of a chromosome.
+    """
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(left, right - interval_length, size=num_intervals))
+    return stdpopsim.utils.merge_intervals(
+        np.column_stack([starts, starts + interval_length])
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chromosome", default="chr22")
+    parser.add_argument("--num-intervals", type=int, default=200)
+    parser.add_argument("--interval-length", type=int, default=200)
+    parser.add_argument("--num-samples", type=int, default=100)
+    parser.add_argument("--num-replicates", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    species = stdpopsim.get_species("HomSap")
+    model = species.get_demographic_model("OutOfAfrica_3G09")
+    samples = model.get_samples(args.num_samples)
+    contig = species.get_contig(args.chromosome)
+    length = contig.recombination_map.sequence_length
+    # The mask is restricted to the middle third of the chromosome, so that
+    # there are large masked flanks.
+    contig.inclusion_mask = make_mask(
+        length // 3,
+        2 * length // 3,
+        args.num_intervals,
+        args.interval_length,
+        args.seed,
+    )
+    engine = stdpopsim.get_engine("msprime")
+    print(
+        f"{args.chromosome}: {contig.covered_length / length:.2%} of "
+        f"{length:.0f} bases in {len(contig.inclusion_mask)} intervals"
+    )
+
+    for premask in [False, True]:
+        times, num_sites = [], []
+        for j in range(args.num_replicates):
+            start = time.perf_counter()
+            ts = engine.simulate(
+                model, contig, samples, seed=args.seed + j, msprime_premask=premask
+            )
+            times.append(time.perf_counter() - start)
+            num_sites.append(ts.num_sites)
+        print(
+            f"premask={premask!s:>5}: {np.mean(times):8.3f} s per replicate, "
+            f"{np.mean(num_sites):8.1f} sites"
+        )
+
+
+if __name__ == "__main__":
+    main()
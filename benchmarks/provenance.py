@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark for adding the stdpopsim provenance record to the output of the CLI.
+Previously, the msprime engine always copied the tables and built a new tree
+sequence to add the provenance record, even if there was nothing to mask. The
+record is now only added by the engine if it copies the tables anyway to apply
+a mask, and otherwise it is added to the tables as the output is written,
+without building a new tree sequence.
+
+The CLI is run for msprime without a mask, and with an exclusion mask, as
+before ("engine") and as now ("write"). Each run is in a fresh process, and
+we report the minimum over the repeats of the time taken by the CLI and of the
+peak resident memory of the process.
+
+Usage: PYTHONPATH=. python benchmarks/provenance.py --num-samples 1000 --length 2e7
+"""
+import argparse
+import multiprocessing
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+import tskit
+
+import stdpopsim
+import stdpopsim.cli
+
+
+def run(method, cli_args):
+    if method == "engine":
+        # The provenance record is always added by the engine.
+        stdpopsim.engines._MsprimeEngine.records_provenance = lambda self, contig: True
+    start = time.perf_counter()
+    stdpopsim.cli.stdpopsim_main(cli_args)
+    return time.perf_counter() - start, stdpopsim.utils.max_rss() / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-samples", type=int, default=1000)
+    parser.add_argument("--length", type=float, default=2e7)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = pathlib.Path(tmpdir)
+        mask_file = tmpdir / "mask.bed"
+        # The simulated region of chr22, with a single masked interval of
+        # 100 kb in the middle.
+        left, right = 16_000_000, 16_000_000 + int(args.length)
+        middle = (left + right) // 2
+        with open(mask_file, "w") as f:
+            print(f"chr22\t{middle}\t{middle + 100_000}", file=f)
+        output = tmpdir / "out.trees"
+        cli_args = [
+            "-q",
+            "HomSap",
+            "-c",
+            "chr22",
+            "--left",
+            str(left),
+            "--right",
+            str(right),
+            "-s",
+            str(args.seed),
+            "-o",
+            str(output),
+            str(args.num_samples),
+        ]
+        for mask_args in [[], ["-e", str(mask_file)]]:
+            for method in ["engine", "write"]:
+                results = []
+                for _ in range(args.repeats):
+                    with context.Pool(1) as pool:
+                        results.append(pool.apply(run, (method, cli_args + mask_args)))
+                elapsed, memory = np.min(results, axis=0)
+                ts = tskit.load(output)
+                name = f"{'mask' if mask_args else 'no mask'}, {method}"
+                print(
+                    f"{name:>16}: {elapsed:8.2f} s {memory:8.1f} MiB "
+                    f"({ts.num_edges} edges, {ts.num_provenances} provenances)"
+                )
+
+
+if __name__ == "__main__":
+    main()
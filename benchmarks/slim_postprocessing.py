@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the post-processing of the tree sequence output by SLiM.
+Previously, the times were rescaled in a copy of the tables, the tree sequence
+was recapitated, then simplified to the remembered individuals, and each of
+these steps and the two mutation overlays built a new pyslim.SlimTreeSequence.
+The tree sequence is now simplified before recapitation, in the same copy of
+the tables as the rescaling, and only the final result is a SlimTreeSequence.
+
+SLiM is not needed: its output is mimicked by an msprime simulation that is
+stopped before coalescence, annotated with pyslim. We report the total time
+taken by each method, and the time taken by each stage of the new method.
+
+Usage: PYTHONPATH=. python benchmarks/slim_postprocessing.py --length 5e7
+"""
+import argparse
+import logging
+import random
+import time
+import warnings
+
+import msprime
+import numpy as np
+import pyslim
+
+import stdpopsim
+
+
+def slim_like_ts(num_individuals, length, generations, num_remembered, seed):
+    """
+    Returns a tree sequence that looks like the output of a SLiM simulation of
+    the specified number of generations, in which the specified number of
+    individuals were remembered.
+    """
+    ts = msprime.sim_ancestry(
+        samples=num_individuals,
+        population_size=num_individuals,
+        sequence_length=length,
+        recombination_rate=1e-8,
+        end_time=generations,
+        random_seed=seed,
+    )
+    tables = pyslim.annotate_defaults(
+        ts, model_type="WF", slim_generation=generations
+    ).dump_tables()
+    flags = np.full(tables.individuals.num_rows, pyslim.INDIVIDUAL_ALIVE)
+    rng = np.random.default_rng(seed)
+    remembered = rng.choice(num_individuals, size=num_remembered, replace=False)
+    flags[remembered] |= pyslim.INDIVIDUAL_REMEMBERED
+    tables.individuals.flags = flags.astype(np.uint32)
+    return pyslim.SlimTreeSequence.load_tables(tables)
+
+
+def old_recap_and_rescale(ts, seed, population_size, contig, scaling_factor):
+    """
+    The previous implementation, with all of the SLiM mutations neutral.
+    """
+    tables = ts.dump_tables()
+    for table in (tables.nodes, tables.migrations, tables.mutations):
+        table.time *= scaling_factor
+    ts_metadata = tables.metadata
+    ts_metadata["SLiM"]["generation"] *= scaling_factor
+    tables.metadata = ts_metadata
+    ts = pyslim.SlimTreeSequence.load_tables(tables)
+    rng = random.Random(seed)
+    s1, s2 = rng.randrange(1, 2 ** 32), rng.randrange(1, 2 ** 32)
+    ts = ts.recapitate(
+        recombination_rate=contig.recombination_map.mean_rate,
+        population_configurations=[
+            msprime.PopulationConfiguration(initial_size=population_size)
+        ],
+        random_seed=s1,
+    )
+    nodes = [
+        node
+        for ind in ts.individuals()
+        if ind.flags & pyslim.INDIVIDUAL_REMEMBERED
+        for node in ind.nodes
+    ]
+    ts = ts.simplify(samples=nodes, filter_populations=False)
+    ts = pyslim.SlimTreeSequence(
+        msprime.mutate(
+            ts,
+            rate=contig.mutation_rate,
+            keep=True,
+            random_seed=s2,
+            end_time=ts.slim_generation,
+        )
+    )
+    s3 = rng.randrange(1, 2 ** 32)
+    ts = pyslim.SlimTreeSequence(
+        msprime.mutate(
+            ts,
+            rate=contig.mutation_rate,
+            keep=True,
+            random_seed=s3,
+            start_time=ts.slim_generation,
+        )
+    )
+    return ts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-individuals", type=int, default=5000)
+    parser.add_argument("--length", type=float, default=5e7)
+    parser.add_argument("--generations", type=int, default=1000)
+    parser.add_argument("--num-remembered", type=int, default=100)
+    parser.add_argument("--scaling-factor", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ts = slim_like_ts(
+        args.num_individuals,
+        args.length,
+        args.generations,
+        args.num_remembered,
+        args.seed,
+    )
+    print(
+        f"{ts.num_nodes} nodes, {ts.num_edges} edges, {ts.num_trees} trees, "
+        f"{args.num_remembered} remembered individuals"
+    )
+    model = stdpopsim.PiecewiseConstantSize(args.num_individuals)
+    contig = stdpopsim.Contig(
+        recombination_map=msprime.RateMap.uniform(ts.sequence_length, 1e-8),
+        mutation_rate=1e-8,
+    )
+    # The SlimTreeSequence attributes used by the old method are deprecated.
+    warnings.simplefilter("ignore", FutureWarning)
+
+    start = time.perf_counter()
+    old_recap_and_rescale(
+        ts, args.seed, args.num_individuals, contig, args.scaling_factor
+    )
+    print(f"{'old':>6}: {time.perf_counter() - start:8.3f} s")
+
+    logging.basicConfig(format="        %(message)s", level=logging.WARNING)
+    logging.getLogger("stdpopsim.slim_engine").setLevel(logging.INFO)
+    engine = stdpopsim.get_engine("slim")
+    start = time.perf_counter()
+    engine.recap_and_rescale(
+        ts,
+        model,
+        contig,
+        model.get_samples(2 * args.num_remembered),
+        slim_scaling_factor=args.scaling_factor,
+        seed=args.seed,
+    )
+    print(f"{'new':>6}: {time.perf_counter() - start:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
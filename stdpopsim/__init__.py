@@ -20,8 +20,9 @@ from .engines import *  # NOQA
 from .warning_categories import *  # NOQA
 
 # We import catalog here, but the internal functions
-# defined are not part of the external API.
-from .catalog import *  # NOQA
+# defined are not part of the external API. Species definitions are
+# loaded lazily from the catalog by get_species().
+from . import catalog  # NOQA
 
 from . import qc  # NOQA
 
@@ -1,9 +1,13 @@
 """
 Infrastructure for defining information about genome annotation.
 """
+import json
 import logging
+import os
+import tempfile
 
 import attr
+import numpy as np
 import pandas
 import zarr
 
@@ -11,26 +15,94 @@ import stdpopsim
 
 logger = logging.getLogger(__name__)
 
+# The columns of the GFF3 file stored in the zarr cache.
+COLUMNS = ["seqid", "source", "type", "start", "end", "score", "strand", "phase"]
 
-def zarr_to_dataframe(path):
+
+def zarr_to_dataframe(path, columns=None, rows=None):
     """
     converts zarr annotation file to
-    pandas dataframe for manipulations
+    pandas dataframe for manipulations.
+    Only the specified columns are read, or all columns if None.
+    If rows is a non-empty list of (start, stop) pairs, only these ranges
+    of rows are read, and the dataframe is indexed by row number.
+    """
+    if columns is None:
+        columns = COLUMNS
+    z = zarr.open(path, mode="r")
+    if rows is None:
+        return pandas.DataFrame({col: z[col][:] for col in columns})
+    data = {
+        col: np.concatenate([z[col][start:stop] for start, stop in rows])
+        for col in columns
+    }
+    index = np.concatenate([np.arange(start, stop) for start, stop in rows])
+    return pandas.DataFrame(data, index=index)
+
+
+def build_seqid_index(path):
+    """
+    Returns a dict mapping each seqid in the zarr annotation file to the
+    list of (start, stop) ranges of rows with this seqid. Annotations are
+    usually sorted by seqid, so there is one range for most seqids.
+    The seqid column is read one chunk at a time.
+    """
+    seqid = zarr.open(path, mode="r")["seqid"]
+    index = {}
+    chunk_size = seqid.chunks[0]
+    current, run_start = None, 0
+    for offset in range(0, seqid.shape[0], chunk_size):
+        chunk = seqid[offset : offset + chunk_size]
+        changes = np.flatnonzero(chunk[1:] != chunk[:-1]) + 1
+        if len(chunk) > 0 and chunk[0] != current:
+            changes = np.concatenate([[0], changes])
+        for j in changes.tolist():
+            if current is not None:
+                index.setdefault(str(current), []).append([run_start, offset + j])
+            current, run_start = chunk[j], offset + j
+    if current is not None:
+        index.setdefault(str(current), []).append([run_start, seqid.shape[0]])
+    return index
+
+
+def build_type_intervals(df):
+    """
+    Returns a dict mapping each type in the specified dataframe of
+    annotations to the merged intervals covered by annotations of this type,
+    as a sorted (N, 2) int64 array of half-open, zero-based [left, right)
+    intervals. GFF3 coordinates are one-based and inclusive.
+    The types are integer-coded, and the intervals for all types are sorted
+    together, so that the type strings are compared only once.
+    """
+    codes, types = pandas.factorize(df["type"], sort=True)
+    left = df["start"].to_numpy(dtype=np.int64) - 1
+    right = df["end"].to_numpy(dtype=np.int64)
+    order = np.lexsort((left, codes))
+    codes = codes[order]
+    intervals = np.column_stack([left[order], right[order]])
+    bounds = np.searchsorted(codes, np.arange(len(types) + 1))
+    type_intervals = {}
+    for j, a_type in enumerate(types):
+        merged = stdpopsim.utils.merge_intervals(intervals[bounds[j] : bounds[j + 1]])
+        # The arrays are shared through the memory cache.
+        merged.flags.writeable = False
+        type_intervals[a_type] = merged
+    return type_intervals
+
+
+def type_intervals_nbytes(type_intervals):
+    """
+    Returns the approximate memory used by the specified dict of intervals,
+    in bytes.
+    """
+    return sum(intervals.nbytes for intervals in type_intervals.values())
+
+
+def dataframe_nbytes(df):
+    """
+    Returns the approximate memory used by the specified DataFrame, in bytes.
     """
-    z = zarr.open(path)
-    df = pandas.DataFrame(
-        {
-            "seqid": z["seqid"],
-            "source": z["source"],
-            "type": z["type"],
-            "start": z["start"],
-            "end": z["end"],
-            "score": z["score"],
-            "strand": z["strand"],
-            "phase": z["phase"],
-        }
-    )
-    return df
+    return int(df.memory_usage(deep=True).sum())
 
 
 @attr.s(kw_only=True)
@@ -69,6 +141,17 @@ class Annotation:
     def cache_path(self):
         return self._cache.cache_path
 
+    @property
+    def index_file(self):
+        """
+        The path to the index of the rows for each chromosome in the cached
+        annotations. This is keyed on the SHA256 of the annotations, so that
+        the index is rebuilt when the annotations change.
+
+        :type: pathlib.Path
+        """
+        return self._cache.derived_path / f"index_{self.zarr_sha256}.json"
+
     def __str__(self):
         s = "GTF Annotation:\n"
         s += "\tspecies   = {}\n".format(self.species.name)
@@ -91,25 +174,71 @@ class Annotation:
         """
         self._cache.download()
 
-    def get_chromosome_annotations(self, id):
+    def _get_index(self):
         """
-        Returns the pandas dataframe for the chromosome with the specified id.
+        Returns the dict mapping each seqid to its ranges of rows, reading
+        the index from the cache if available. Otherwise, the index is built
+        and written to the cache.
         """
-        chrom = self.species.genome.get_chromosome(id)
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring bad annotation index {self.index_file}: {err}")
+        logger.info(f"Indexing annotations {self.species.id}/{self.id}")
+        index = build_seqid_index(str(self.cache_path))
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file and rename, so that concurrent
+            # readers never see a partially written file.
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_file.parent)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, self.index_file)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as err:
+            logger.warning(f"Could not write annotation index: {err}")
+        return index
+
+    def _build_chromosome_annotations(self, chrom, columns):
         if not self.is_cached():
             self.download()
-        bed = zarr_to_dataframe(str(self.cache_path))
-        assert type(bed) == pandas.DataFrame
-        ret = bed[bed.seqid == chrom.id]
-        if len(ret) == 0:
-            raise ValueError(f"No annotations found for {id}")
-        return ret
+        rows = self._get_index().get(chrom.id, [])
+        if len(rows) == 0:
+            raise ValueError(f"No annotations found for {chrom.id}")
+        return zarr_to_dataframe(str(self.cache_path), columns=columns, rows=rows)
+
+    def get_chromosome_annotations(self, id, columns=None):
+        """
+        Returns the pandas dataframe for the chromosome with the specified id.
+        Only the rows for this chromosome, and the specified columns (or all
+        columns, if None) are read from the cached annotations.
+        """
+        chrom = self.species.genome.get_chromosome(id)
+        columns = COLUMNS if columns is None else list(columns)
+        # The annotations are kept in memory, as they are often requested
+        # repeatedly.
+        key = ("annotations", self.species.id, self.id, self.zarr_sha256, chrom.id)
+        key += tuple(columns)
+        df = stdpopsim.get_memory_cache().get(
+            key,
+            lambda: self._build_chromosome_annotations(chrom, columns),
+            dataframe_nbytes,
+        )
+        # The cached dataframe must not be modified.
+        return df.copy()
 
     def get_annotation_type_from_chromomosome(self, a_type, chrom_id, full_table=False):
         """
         Returns all elements of type a_type from chromosome specified
         """
-        annots = self.get_chromosome_annotations(chrom_id)
+        columns = None if full_table else ["type", "start", "end"]
+        annots = self.get_chromosome_annotations(chrom_id, columns=columns)
         subset = annots[annots.type == a_type]
         if subset.empty:
             raise ValueError(
@@ -120,6 +249,39 @@ class Annotation:
         else:
             return subset[["start", "end"]]
 
+    def _get_type_intervals(self, chrom):
+        key = ("annotation_intervals", self.species.id, self.id, self.zarr_sha256)
+        key += (chrom.id,)
+        return stdpopsim.get_memory_cache().get(
+            key,
+            lambda: build_type_intervals(
+                self.get_chromosome_annotations(
+                    chrom.id, columns=["type", "start", "end"]
+                )
+            ),
+            type_intervals_nbytes,
+        )
+
+    def get_annotation_intervals(self, a_type, chrom_id):
+        """
+        Returns the intervals covered by elements of type a_type on the
+        chromosome specified, as a sorted (N, 2) int64 numpy array of
+        disjoint [left, right) intervals in zero-based coordinates, in which
+        overlapping and adjacent elements are merged. This is the format
+        used for the masks of a :class:`.Contig`.
+
+        The intervals for every type on a chromosome are computed together
+        the first time they are requested, and are kept in memory. The
+        returned array is read-only.
+        """
+        chrom = self.species.genome.get_chromosome(chrom_id)
+        intervals = self._get_type_intervals(chrom).get(a_type)
+        if intervals is None:
+            raise ValueError(
+                f"annotation type '{a_type}' not found on chrom {chrom_id}"
+            )
+        return intervals
+
     def get_genes_from_chromosome(self, chrom_id, full_table=False):
         """
         Returns all elements of type gene from annotation
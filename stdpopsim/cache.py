@@ -1,9 +1,15 @@
 """
-Cache handling for downloaded data.
+Cache handling for downloaded data, and for objects built from it in memory.
 """
+import collections
+import concurrent.futures
 import pathlib
 import logging
 import os
+import re
+import socket
+import threading
+import time
 import urllib.parse
 import tempfile
 import warnings
@@ -11,11 +17,12 @@ import warnings
 import appdirs
 import attr
 
+import stdpopsim
 from . import utils
 
 logger = logging.getLogger(__name__)
 
-_cache_dir = None
+_cache_dirs = []
 
 
 def set_cache_dir(cache_dir=None):
@@ -27,15 +34,40 @@ def set_cache_dir(cache_dir=None):
     the environment variable `STDPOPSIM_CACHE` if it exists, or set to the
     default location using the :mod:`appdirs` module.
 
+    Several cache directories may be layered, by separating them with
+    :data:`os.pathsep` (e.g., ``/local/cache:/shared/cache`` on Unix flavours),
+    or by passing a list of directories. Cached data are looked for in each
+    directory in turn, and are used from the first directory in which they
+    match their checksum. Data are downloaded to, and files derived from
+    cached data are written to, the first writable directory (see
+    :func:`.get_cache_dir`). This allows a pre-populated, read-only cache to
+    be shared, with a writable cache for anything that is missing from it.
+
     No checks for existance, writability, etc. are performed by this function.
     """
     if cache_dir is None:
         cache_dir = os.environ.get("STDPOPSIM_CACHE", None)
     if cache_dir is None:
         cache_dir = appdirs.user_cache_dir("stdpopsim", "popgensims")
-    global _cache_dir
-    _cache_dir = pathlib.Path(cache_dir)
-    logger.info(f"Set cache_dir to {_cache_dir}")
+    if isinstance(cache_dir, str):
+        cache_dir = [d for d in cache_dir.split(os.pathsep) if len(d) > 0]
+    elif not isinstance(cache_dir, (list, tuple)):
+        cache_dir = [cache_dir]
+    if len(cache_dir) == 0:
+        raise ValueError("No cache directory specified")
+    global _cache_dirs
+    _cache_dirs = [pathlib.Path(d) for d in cache_dir]
+    logger.info(f"Set cache_dir to {os.pathsep.join(str(d) for d in _cache_dirs)}")
+
+
+def _is_writable(path):
+    """
+    Returns True if the specified directory is writable, or can be created.
+    """
+    path = pathlib.Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return os.access(path, os.W_OK)
 
 
 def get_cache_dir():
@@ -44,13 +76,190 @@ def get_cache_dir():
     pathlib.Path instance. Defaults to a directory 'stdpopsim' in a user cache directory
     (e.g., ~/.cache/stdopsim on Unix flavours). See the :func:`.set_cache_dir` function
     for how this value can be set.
+
+    If several cache directories are layered, this is the first writable
+    directory, to which data are downloaded. If none of the directories are
+    writable, this is the first directory.
     """
-    return _cache_dir
+    if len(_cache_dirs) > 1:
+        for cache_dir in _cache_dirs:
+            if _is_writable(cache_dir):
+                return cache_dir
+    return _cache_dirs[0]
+
+
+def get_cache_dirs():
+    """
+    Returns the list of cache directories, in the order in which they are
+    searched for cached data. See the :func:`.set_cache_dir` function for how
+    these can be set.
+    """
+    return list(_cache_dirs)
 
 
 set_cache_dir()
 
 
+class FileLock:
+    """
+    A lock shared between processes, which is held by creating the lock
+    file exclusively. This works for processes on different machines sharing
+    the cache on a network file system.
+
+    The lock file records the host and process ID of the holder, and its
+    modification time is regularly updated while the lock is held. A lock
+    is considered stale, and is broken, if the holder is a process on this
+    host which no longer exists, or if the lock file has not been updated
+    for ``stale_after`` seconds.
+
+    :ivar path: The path of the lock file.
+    :vartype path: pathlib.Path
+    :ivar float timeout: The number of seconds to wait for the lock before
+        raising a :class:`TimeoutError`. If None, wait indefinitely.
+    :ivar float stale_after: The number of seconds after which a lock that
+        has not been updated is considered stale.
+    :ivar bool waited: True if another process held the lock when it was
+        last acquired.
+    """
+
+    def __init__(self, path, timeout=None, stale_after=600, poll_interval=0.1):
+        self.path = pathlib.Path(path)
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.waited = False
+        self._owner = f"{socket.gethostname()} {os.getpid()}\n"
+        self._stop_heartbeat = None
+
+    def acquire(self):
+        """
+        Acquires the lock, waiting for any other process holding it.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        start = time.monotonic()
+        self.waited = False
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, "w") as f:
+                    f.write(self._owner)
+                break
+            state = self._read_state(self.path)
+            if state is not None and self._is_stale(state):
+                self._break(state)
+                continue
+            self.waited = True
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(
+                    f"Timed out after {self.timeout} seconds waiting for the lock "
+                    f"{self.path}, held by {self._read_owner()}"
+                )
+            time.sleep(self.poll_interval)
+        self._start_heartbeat()
+
+    def release(self):
+        """
+        Releases the lock.
+        """
+        self._stop_heartbeat.set()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            logger.warning(f"Lock {self.path} was removed while it was held")
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def _start_heartbeat(self):
+        stop = threading.Event()
+        self._stop_heartbeat = stop
+
+        def heartbeat():
+            while not stop.wait(self.stale_after / 4):
+                try:
+                    os.utime(self.path)
+                except FileNotFoundError:
+                    # The lock file may be briefly renamed by another process
+                    # which then finds that it isn't stale (see _break).
+                    pass
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+
+    def _read_owner(self):
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _read_state(self, path):
+        """
+        Returns the owner and modification time (in nanoseconds) of the
+        specified lock file, or None if it doesn't exist.
+        """
+        try:
+            with open(path) as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _is_stale(self, state):
+        owner, mtime_ns = state
+        if time.time() - mtime_ns / 1e9 > self.stale_after:
+            return True
+        if len(owner.split()) != 2:
+            # The holder may not have written to the lock file yet.
+            return False
+        host, pid = owner.split()
+        # os.kill() terminates the process on Windows, so we can only check
+        # for dead processes on POSIX systems.
+        if os.name == "posix" and host == socket.gethostname():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except (OSError, ValueError):
+                pass
+        return False
+
+    def _break(self, state):
+        # Renaming the lock file first ensures that only one of the processes
+        # finding a stale lock removes it.
+        broken = self.path.with_name(f"{self.path.name}.{os.getpid()}.stale")
+        try:
+            os.rename(self.path, broken)
+        except FileNotFoundError:
+            return
+        # The stale lock may have been broken by another process, and the
+        # lock acquired or refreshed by a live holder, after it was inspected
+        # and before it was renamed. If so, we put it back.
+        if self._read_state(broken) != state:
+            try:
+                os.link(broken, self.path)
+            except FileExistsError:
+                logger.warning(f"Lock {self.path} was replaced while it was held")
+            except OSError:
+                # Not all file systems support hard links.
+                os.rename(broken, self.path)
+                return
+            os.unlink(broken)
+            return
+        logger.warning(f"Breaking stale lock {self.path}")
+        os.unlink(broken)
+
+
+# The name of the zip file holding the files in a tarball that are extracted
+# on demand.
+_ARCHIVE_NAME = "_archive.zip"
+
+
 @attr.s(kw_only=True)
 class CachedData:
     """
@@ -72,28 +281,117 @@ class CachedData:
     :ivar str sha256: The SHA256 checksum of the downloaded file.
     :ivar bool extract: True if the downloaded file is a tarball that should be
         extracted into the cached namespace, False otherwise.
+    :ivar bool extract_on_demand: If True, a tarball is not extracted when it is
+        downloaded. Instead, its files are stored in a zip file, from which each
+        file is extracted the first time it is requested with
+        :meth:`.get_member`. Only used if ``extract`` is True.
     """
 
     namespace = attr.ib(type=str)
     url = attr.ib(type=str)
     sha256 = attr.ib(type=str)
     extract = attr.ib(type=bool)
+    extract_on_demand = attr.ib(type=bool, default=False)
 
     def __attrs_post_init__(self):
         u = urllib.parse.urlparse(self.url)
         self._basename = pathlib.PurePath(u.path).name
 
+    def _paths(self, cache_dir):
+        """
+        Returns the cache path and checksum file in the specified cache
+        directory.
+        """
+        path = cache_dir / self.namespace
+        sha256_file = path / f"{self._basename}.sha256"
+        if not self.extract:
+            path = path / self._basename
+        return path, sha256_file
+
+    def _find_cache_dir(self):
+        """
+        Returns the first cache directory holding a copy of the data that
+        matches the checksum, or None if there is no such directory.
+        """
+        for cache_dir in _cache_dirs:
+            path, sha256_file = self._paths(cache_dir)
+            try:
+                with open(sha256_file, "r") as f:
+                    cached_sha256 = f.read().strip()
+            except OSError:
+                continue
+            if cached_sha256 == self.sha256 and path.exists():
+                return cache_dir
+        return None
+
+    def _cache_dir(self):
+        cache_dir = self._find_cache_dir()
+        if cache_dir is None:
+            cache_dir = get_cache_dir()
+        return cache_dir
+
     @property
     def sha256_file(self):
-        return get_cache_dir() / self.namespace / f"{self._basename}.sha256"
+        return self._paths(self._cache_dir())[1]
+
+    @property
+    def archive_file(self):
+        """
+        The zip file holding the files in the tarball, if these are extracted
+        on demand.
+
+        :type: pathlib.Path
+        """
+        return self.cache_path / _ARCHIVE_NAME
+
+    @property
+    def lock_file(self):
+        """
+        The lock file used to ensure that only one process downloads the data
+        at a time.
+
+        :type: pathlib.Path
+        """
+        name = self.namespace.replace("/", ".")
+        return get_cache_dir() / "locks" / f"{name}.lock"
+
+    @property
+    def partial_download_file(self):
+        """
+        The file to which the data are downloaded, if they are not extracted.
+        This is kept if the download is interrupted, so that the download can
+        be resumed.
+
+        :type: pathlib.Path
+        """
+        return get_cache_dir() / "downloads" / f"{self.sha256}.part"
 
     @property
     def cache_path(self):
-        # the cache path could be a folder or a file, depending on self.extract
-        path = get_cache_dir() / self.namespace
-        if not self.extract:
-            path = path / self._basename
-        return path
+        """
+        The path of the cached data, which is a directory if the data are
+        extracted, or a file otherwise. This is in the first cache directory
+        holding valid data, or in the directory returned by
+        :func:`.get_cache_dir` if there are none.
+
+        :type: pathlib.Path
+        """
+        return self._paths(self._cache_dir())[0]
+
+    @property
+    def derived_path(self):
+        """
+        The directory in which files derived from the cached data are stored,
+        such as files extracted on demand. This is the directory of the
+        cached data if it is writable. Otherwise, a directory specific to the
+        checksum of the data in the writable cache directory is used.
+
+        :type: pathlib.Path
+        """
+        cache_dir = self._cache_dir()
+        if cache_dir == get_cache_dir() or _is_writable(cache_dir):
+            return cache_dir / self.namespace
+        return get_cache_dir() / "derived" / self.namespace / self.sha256
 
     def is_cached(self):
         """
@@ -105,27 +403,61 @@ class CachedData:
         """
         Returns True if the cached data matches the checksum.
         """
-        is_valid = False
-        if self.is_cached() and self.sha256_file.exists():
-            with open(self.sha256_file, "r") as f:
-                cached_sha256 = f.read().strip()
-            is_valid = self.sha256 == cached_sha256
-        return is_valid
+        return self._find_cache_dir() is not None
+
+    def get_member(self, name):
+        """
+        Returns the path to the file ``name`` extracted from the downloaded
+        tarball, or None if the tarball does not contain this file. If the
+        file is extracted on demand, and has not been requested before, it is
+        extracted now.
+
+        :param str name: The path of the file within the tarball.
+        :rtype: pathlib.Path
+        """
+        for path in [self.cache_path / name, self.derived_path / name]:
+            if path.exists():
+                return path
+        if self.extract_on_demand and self.archive_file.exists():
+            logger.debug(f"Extracting {name} from {self.archive_file}")
+            return utils.extract_zip_member(self.archive_file, name, self.derived_path)
+        return None
 
-    def download(self):
+    def download(self, lock_timeout=3600):
         """
         Downloads the file from the source URL and stores it in the cache.
-        If the local cache already exists, it is first removed.
+        If the local cache already exists, it is first removed. The SHA256
+        checksum is computed as the file is downloaded. Tarballs are extracted
+        as they are downloaded, and the extracted files are only moved into
+        the cache if the checksum matches. Otherwise, if a previous download
+        was interrupted, it is resumed where possible.
+
+        Only one process downloads the data at a time. If another process is
+        already downloading the data, we wait for it to finish and then use
+        its download, rather than downloading the data again.
+
+        :param float lock_timeout: The number of seconds to wait for another
+            process that is downloading the data. If None, wait indefinitely.
         """
-        if self.is_cached():
-            logger.info(f"Clearing cache {self.cache_path}")
+        lock = FileLock(self.lock_file, timeout=lock_timeout)
+        with lock:
+            if lock.waited and self.is_valid():
+                logger.info(f"{self.url} was downloaded by another process")
+                return
+            self._download()
+
+    def _download(self):
+        # Data are always downloaded to the writable cache directory.
+        cache_path, sha256_file = self._paths(get_cache_dir())
+        if cache_path.exists():
+            logger.info(f"Clearing cache {cache_path}")
             with tempfile.TemporaryDirectory(dir=get_cache_dir()) as tempdir:
                 # Atomically move to a temporary directory, which will be automatically
                 # deleted on exit.
                 dest = pathlib.Path(tempdir) / "will_be_deleted"
-                os.rename(self.cache_path, dest)
+                os.rename(cache_path, dest)
 
-        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
 
         logger.info(f"Downloading {self.url}")
         # os.rename will not work on some Unixes if the source and dest are on
@@ -133,29 +465,32 @@ class CachedData:
         # the destination to ensure it's on the same file system.
         with tempfile.TemporaryDirectory(dir=get_cache_dir()) as tempdir:
             tempdir = pathlib.Path(tempdir)
-            local_path = tempdir / "downloaded"
-            utils.download(self.url, local_path)
-
-            logger.debug("Checking SHA256")
-            download_sha256 = utils.sha256(local_path)
-            if download_sha256 != self.sha256:
-                # TODO: use a more appropriate exception here.
-                raise ValueError(
-                    f"Expected SHA256={self.sha256}, but downloaded file has"
-                    f"{download_sha256}."
-                )
-
             if self.extract:
-                extract_dir = tempdir / "extracted"
-                extract_dir.mkdir()
-                logger.debug(f"Extracting {local_path}")
-                utils.untar(local_path, extract_dir)
-                local_path = extract_dir
+                # The tarball is extracted as it is downloaded, so it is never
+                # stored on disk. Such downloads cannot be resumed.
+                local_path = tempdir / "extracted"
+                local_path.mkdir()
+                if self.extract_on_demand:
+                    download_sha256 = utils.download_tar_as_zip(
+                        self.url, local_path / _ARCHIVE_NAME
+                    )
+                else:
+                    download_sha256 = utils.download_and_untar(self.url, local_path)
+                self._check_sha256(download_sha256)
+            else:
+                partial_file = self.partial_download_file
+                partial_file.parent.mkdir(parents=True, exist_ok=True)
+                download_sha256 = utils.download(self.url, partial_file, resume=True)
+                if download_sha256 != self.sha256:
+                    os.unlink(partial_file)
+                self._check_sha256(download_sha256)
+                local_path = tempdir / "downloaded"
+                os.replace(partial_file, local_path)
 
             # If this has all gone OK up to here we can now move the
             # data into the cache location. This should minimise the
             # chances of having malformed data in the cache.
-            logger.info(f"Saving to {self.cache_path}")
+            logger.info(f"Saving to {cache_path}")
             # os.rename is atomic, and will raise an OSError if the destination
             # is a directory and already exists. Therefore, if we see the map
             # exists we assume that some other process has already downloaded
@@ -164,7 +499,7 @@ class CachedData:
             # self.extract==False), the destination will be silently replaced
             # on unix systems, but FileExistsError will be raised on windows.
             try:
-                os.rename(local_path, self.cache_path)
+                os.rename(local_path, cache_path)
             except (OSError, FileExistsError):
                 warnings.warn(
                     "Error occured renaming map directory. Are multiple processes"
@@ -173,5 +508,435 @@ class CachedData:
                 return
 
             # Write out the checksum.
-            with open(self.sha256_file, "w") as f:
+            with open(sha256_file, "w") as f:
                 print(self.sha256, file=f)
+
+    def _check_sha256(self, download_sha256):
+        if download_sha256 != self.sha256:
+            # TODO: use a more appropriate exception here.
+            raise ValueError(
+                f"Expected SHA256={self.sha256}, but downloaded file has"
+                f"{download_sha256}."
+            )
+
+
+@attr.s(kw_only=True)
+class CacheEntry:
+    """
+    An item stored in the cache directory, as returned by :func:`.list_cache`.
+
+    :ivar str kind: The kind of data: ``"genetic_map"`` or ``"annotation"``
+        for downloaded data, ``"compiled_map"`` for the binary chromosome maps
+        made from a genetic map, ``"derived"`` for files derived from data in
+        a read-only cache directory, ``"partial_download"`` for an interrupted
+        download, or ``"unknown"`` for other downloaded data.
+    :ivar path: The path of the cached file or directory.
+    :vartype path: pathlib.Path
+    :ivar int size: The number of bytes used by the entry. Files belonging
+        to other entries, such as the compiled maps within the directory of a
+        genetic map, are not included.
+    :ivar float last_access: The most recent access time of any file in the
+        entry, or in entries within it, in seconds since the epoch. This is
+        as recorded by the file system, which may only update access times
+        infrequently.
+    :ivar cached_data: The catalog data stored in this entry, or None if
+        the entry is not in the catalog.
+    :vartype cached_data: :class:`.CachedData`
+    """
+
+    kind = attr.ib(type=str)
+    path = attr.ib()
+    size = attr.ib(type=int)
+    last_access = attr.ib(type=float)
+    cached_data = attr.ib(default=None)
+    sha256_file = attr.ib(default=None)
+
+    @property
+    def name(self):
+        """
+        The path of the entry relative to the cache directory.
+        """
+        return self.path.relative_to(get_cache_dir()).as_posix()
+
+    @property
+    def lock_file(self):
+        """
+        The lock file used when downloading the data in this entry.
+
+        :type: pathlib.Path
+        """
+        if self.cached_data is not None:
+            return self.cached_data.lock_file
+        # Compiled maps, and downloaded files that are not extracted, are
+        # stored within the namespace directory.
+        namespace = self.path.relative_to(get_cache_dir())
+        if self.kind == "derived":
+            namespace = self.path.relative_to(get_cache_dir() / "derived").parent
+        elif self.path.is_file() or self.kind == "compiled_map":
+            namespace = namespace.parent
+        name = namespace.as_posix().replace("/", ".")
+        return get_cache_dir() / "locks" / f"{name}.lock"
+
+    def verify(self):
+        """
+        Checks the cached data, returning None if no problems are found, or
+        a string describing the problem otherwise. Downloaded files are
+        compared against the checksum stored when they were downloaded, and
+        against the checksum in the catalog. The checksums of extracted
+        tarballs cannot be recomputed, but the files stored in the zip file
+        of a tarball that is extracted on demand are checked for corruption.
+        """
+        stored_sha256 = None
+        if self.sha256_file is not None:
+            with open(self.sha256_file) as f:
+                stored_sha256 = f.read().strip()
+        if self.cached_data is not None and stored_sha256 != self.cached_data.sha256:
+            return "checksum does not match the catalog"
+        if self.path.is_file() and self.kind != "partial_download":
+            if utils.sha256(self.path) != stored_sha256:
+                return "file does not match its checksum"
+        elif self.path.is_dir():
+            archive_file = self.path / _ARCHIVE_NAME
+            if archive_file.exists():
+                bad_member = utils.check_zip(archive_file)
+                if bad_member is not None:
+                    return f"corrupted file {bad_member} in {archive_file.name}"
+        return None
+
+    def remove(self, lock_timeout=0):
+        """
+        Removes the entry from the cache. The lock used when downloading
+        the data is held while the entry is removed, so that a download in
+        progress is not removed. The data are first moved atomically out of
+        the cache, so that other processes never see a partial entry.
+        Processes that are already reading files in the entry may continue to
+        do so, on systems that allow open files to be deleted.
+
+        :param float lock_timeout: The number of seconds to wait for a process
+            which is downloading the data.
+        :return: True if the entry was removed, or False if it was locked, or
+            has already been removed.
+        :rtype: bool
+        """
+        if self.kind == "partial_download":
+            # The downloading process holds the lock for its namespace, which
+            # we don't know. An active download updates the file regularly.
+            if time.time() - os.path.getmtime(self.path) < 600:
+                return False
+            lock = None
+        else:
+            lock = FileLock(self.lock_file, timeout=lock_timeout)
+            try:
+                lock.acquire()
+            except TimeoutError:
+                logger.warning(f"Not removing {self.name}, which is in use")
+                return False
+        try:
+            with tempfile.TemporaryDirectory(dir=get_cache_dir()) as tempdir:
+                try:
+                    os.rename(self.path, pathlib.Path(tempdir) / "will_be_deleted")
+                except FileNotFoundError:
+                    return False
+                if self.sha256_file is not None and self.sha256_file.exists():
+                    os.unlink(self.sha256_file)
+            logger.info(f"Removed {self.name} from the cache")
+        finally:
+            if lock is not None:
+                lock.release()
+        return True
+
+
+def _catalog_cached_data():
+    """
+    Returns a dict mapping the paths of the catalog data in the writable
+    cache directory, and of the files derived from them, to their
+    :class:`.CachedData`.
+    """
+    cache_dir = get_cache_dir()
+    cached_data = {}
+    for item in list(stdpopsim.all_genetic_maps()) + list(stdpopsim.all_annotations()):
+        cache = item._cache
+        cached_data[cache._paths(cache_dir)[0]] = cache
+        path = cache_dir / "derived" / cache.namespace / cache.sha256
+        cached_data[path] = cache
+    return cached_data
+
+
+def _disk_usage(path, exclude=()):
+    """
+    Returns the total size and most recent access time of the files
+    within the specified path, skipping the excluded directories.
+    """
+    size = 0
+    last_access = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) not in exclude]
+        for filename in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                continue
+            size += st.st_size
+            last_access = max(last_access, st.st_atime, st.st_mtime)
+    return size, last_access
+
+
+def list_cache():
+    """
+    Returns a list of :class:`.CacheEntry` objects describing the data stored
+    in the cache directory, sorted by name. If several cache directories are
+    layered, only the writable directory returned by :func:`.get_cache_dir`
+    is listed.
+
+    :rtype: list
+    """
+    cache_dir = get_cache_dir()
+    if not cache_dir.exists():
+        return []
+    catalog = _catalog_cached_data()
+    entries = []
+    derived_dir = cache_dir / "derived"
+    for path in sorted(derived_dir.glob("**/*")):
+        if path.is_dir() and re.fullmatch("[0-9a-f]{64}", path.name):
+            size, last_access = _disk_usage(path)
+            entries.append(
+                CacheEntry(
+                    kind="derived",
+                    path=path,
+                    size=size,
+                    last_access=last_access,
+                    cached_data=catalog.get(path),
+                )
+            )
+    # Sort by depth, so that directories are found before the files within them.
+    sha256_files = sorted(
+        cache_dir.glob("**/*.sha256"), key=lambda p: (len(p.parts), p)
+    )
+    for sha256_file in sha256_files:
+        if derived_dir in sha256_file.parents:
+            continue
+        path = sha256_file.with_suffix("")
+        if not path.exists():
+            # The checksum is stored within the directory of extracted data.
+            path = sha256_file.parent
+        if any(entry.path in path.parents for entry in entries):
+            # This is a file extracted from a tarball.
+            continue
+        cached_data = catalog.get(path)
+        top = path.relative_to(cache_dir).parts[0]
+        kind = {"genetic_maps": "genetic_map", "annotations": "annotation"}.get(
+            top, "unknown"
+        )
+        compiled_maps = []
+        if path.is_dir():
+            compiled_maps = [p for p in path.glob("compiled_*") if p.is_dir()]
+        size, last_access = _disk_usage(path, exclude={str(p) for p in compiled_maps})
+        if path.is_file():
+            st = os.stat(path)
+            size, last_access = st.st_size, max(st.st_atime, st.st_mtime)
+        for compiled_map in compiled_maps:
+            compiled_size, compiled_access = _disk_usage(compiled_map)
+            last_access = max(last_access, compiled_access)
+            entries.append(
+                CacheEntry(
+                    kind="compiled_map",
+                    path=compiled_map,
+                    size=compiled_size,
+                    last_access=compiled_access,
+                    cached_data=cached_data,
+                )
+            )
+        entries.append(
+            CacheEntry(
+                kind=kind,
+                path=path,
+                size=size,
+                last_access=last_access,
+                cached_data=cached_data,
+                sha256_file=sha256_file,
+            )
+        )
+    for path in (cache_dir / "downloads").glob("*.part"):
+        st = os.stat(path)
+        entries.append(
+            CacheEntry(
+                kind="partial_download",
+                path=path,
+                size=st.st_size,
+                last_access=max(st.st_atime, st.st_mtime),
+            )
+        )
+    return sorted(entries, key=lambda entry: entry.name)
+
+
+def verify_cache(entries=None, num_threads=4):
+    """
+    Checks the data stored in the cache using :meth:`.CacheEntry.verify`.
+    Several entries are checked at once in threads, as computing checksums is
+    mostly limited by reading from the disk.
+
+    :param list entries: The entries to check. If None, check all entries
+        returned by :func:`.list_cache`.
+    :param int num_threads: The number of entries to check at the same time.
+    :return: A list of ``(entry, problem)`` tuples in the same order as the
+        entries, in which ``problem`` is None if the entry is valid.
+    :rtype: list
+    """
+    if entries is None:
+        entries = list_cache()
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as executor:
+        problems = list(executor.map(lambda entry: entry.verify(), entries))
+    return list(zip(entries, problems))
+
+
+def evict_cache(max_size=None, max_age=None, dry_run=False):
+    """
+    Removes data from the cache, in order of their last access time. Entries
+    that are in use by another process are not removed.
+
+    :param int max_size: Remove the least recently used entries until the
+        total size of the cache is at most this many bytes.
+    :param float max_age: Remove entries that have not been accessed within
+        this many seconds.
+    :param bool dry_run: If True, return the entries that would be removed
+        without removing them.
+    :return: The list of removed :class:`.CacheEntry` objects.
+    :rtype: list
+    """
+    # Entries within a directory are accessed no later than the directory, and
+    # are removed first if they were accessed at the same time.
+    entries = sorted(
+        list_cache(), key=lambda entry: (entry.last_access, -len(entry.path.parts))
+    )
+    total_size = sum(entry.size for entry in entries)
+    now = time.time()
+    removed = []
+    for entry in entries:
+        if any(r.path in entry.path.parents for r in removed):
+            # This was within a directory that has already been removed.
+            continue
+        too_big = max_size is not None and total_size > max_size
+        too_old = max_age is not None and now - entry.last_access > max_age
+        if (too_big or too_old) and (dry_run or entry.remove()):
+            # Entries within a directory are removed with it.
+            contained = [
+                e for e in entries if entry.path in e.path.parents and e not in removed
+            ]
+            total_size -= entry.size + sum(e.size for e in contained)
+            removed.append(entry)
+    return removed
+
+
+class MemoryCache:
+    """
+    A bounded, least-recently-used cache of objects that are expensive to
+    build, such as the recombination maps for chromosomes. The total size of
+    the cached objects, as reported when they are added, is kept below
+    ``max_size`` bytes by discarding the least recently used objects.
+
+    Cached objects must not be modified. Warnings raised while an object is
+    built are not recorded, as :func:`warnings.catch_warnings` is not thread
+    safe. If the warnings must be raised each time an object is retrieved,
+    they should be returned with the object by the function that builds it.
+
+    :ivar int max_size: The maximum total size of the cached objects, in bytes.
+    :ivar int hits: The number of times an object was found in the cache.
+    :ivar int misses: The number of times an object was not found in the cache.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """
+        The total size of the cached objects, in bytes.
+        """
+        return self._size
+
+    def clear(self):
+        """
+        Removes all objects from the cache, and resets the hit and miss counts.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def resize(self, max_size):
+        """
+        Sets the maximum total size of the cached objects, discarding the
+        least recently used objects as needed.
+        """
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_size:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def get(self, key, build, size):
+        """
+        Returns the cached object for the specified key. If the object is not
+        in the cache, it is built by calling ``build()`` and then cached.
+
+        :param key: A hashable key identifying the object.
+        :param build: A function with no arguments that builds the object.
+        :param size: A function returning the size of an object in bytes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            value = build()
+            entry = (value, size(value))
+            with self._lock:
+                if key not in self._entries and entry[1] <= self.max_size:
+                    self._entries[key] = entry
+                    self._size += entry[1]
+                    self._evict()
+        return entry[0]
+
+
+_memory_cache = MemoryCache(max_size=512 * 1024 ** 2)
+
+
+def get_memory_cache():
+    """
+    Returns the :class:`.MemoryCache` used to keep the recombination maps
+    and contigs built by :meth:`.Species.get_contig`, so that they are not
+    rebuilt on each call.
+    """
+    return _memory_cache
+
+
+def set_memory_cache_size(max_size):
+    """
+    Sets the maximum total size, in bytes, of the objects kept in memory by
+    the cache returned by :func:`.get_memory_cache`. A size of zero disables
+    this cache.
+    """
+    _memory_cache.resize(max_size)
+
+
+def clear_memory_cache():
+    """
+    Removes all objects kept in memory by the cache returned by
+    :func:`.get_memory_cache`.
+    """
+    _memory_cache.clear()
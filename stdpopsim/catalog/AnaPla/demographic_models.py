@@ -66,4 +66,4 @@ def _mallard_black_split():
     )
 
 
-_species.add_demographic_model(_mallard_black_split())
+_species.add_demographic_model_factory("MallardBlackDuck_2L19", _mallard_black_split)
@@ -499,4 +499,4 @@ def _GAS_sp():
     )
 
 
-_species.add_demographic_model(_GAS_sp())
+_species.add_demographic_model_factory("GAS_1A17", _GAS_sp)
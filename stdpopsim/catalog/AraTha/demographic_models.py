@@ -135,7 +135,7 @@ def _sma_1pop():
     )
 
 
-_species.add_demographic_model(_sma_1pop())
+_species.add_demographic_model_factory("SouthMiddleAtlas_1D17", _sma_1pop)
 
 
 def _afr_2epoch():
@@ -182,7 +182,7 @@ def _afr_2epoch():
     )
 
 
-_species.add_demographic_model(_afr_2epoch())
+_species.add_demographic_model_factory("African2Epoch_1H18", _afr_2epoch)
 
 
 def _afr_3epoch():
@@ -237,4 +237,4 @@ def _afr_3epoch():
     )
 
 
-_species.add_demographic_model(_afr_3epoch())
+_species.add_demographic_model_factory("African3Epoch_1H18", _afr_3epoch)
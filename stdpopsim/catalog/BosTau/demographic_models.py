@@ -92,4 +92,4 @@ def _HolsteinFriesian_1M13():
     )
 
 
-_species.add_demographic_model(_HolsteinFriesian_1M13())
+_species.add_demographic_model_factory("HolsteinFriesian_1M13", _HolsteinFriesian_1M13)
@@ -82,7 +82,7 @@ def _afr_3epoch():
     )
 
 
-_species.add_demographic_model(_afr_3epoch())
+_species.add_demographic_model_factory("African3Epoch_1S16", _afr_3epoch)
 
 
 def _ooa_2():
@@ -141,4 +141,4 @@ def _ooa_2():
     )
 
 
-_species.add_demographic_model(_ooa_2())
+_species.add_demographic_model_factory("OutOfAfrica_2L06", _ooa_2)
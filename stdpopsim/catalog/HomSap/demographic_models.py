@@ -132,7 +132,7 @@ def _ooa_3():
     )
 
 
-_species.add_demographic_model(_ooa_3())
+_species.add_demographic_model_factory("OutOfAfrica_3G09", _ooa_3)
 
 
 def _ooa_2():
@@ -230,7 +230,7 @@ def _ooa_2():
     )
 
 
-_species.add_demographic_model(_ooa_2())
+_species.add_demographic_model_factory("OutOfAfrica_2T12", _ooa_2)
 
 
 def _african():
@@ -286,7 +286,7 @@ def _african():
     )
 
 
-_species.add_demographic_model(_african())
+_species.add_demographic_model_factory("Africa_1T12", _african)
 
 
 def _america():
@@ -420,7 +420,7 @@ def _america():
     )
 
 
-_species.add_demographic_model(_america())
+_species.add_demographic_model_factory("AmericanAdmixture_4B11", _america)
 
 
 def _ooa_archaic():
@@ -596,7 +596,7 @@ def _ooa_archaic():
     )
 
 
-_species.add_demographic_model(_ooa_archaic())
+_species.add_demographic_model_factory("OutOfAfricaArchaicAdmixture_5R19", _ooa_archaic)
 
 
 def _zigzag():
@@ -674,7 +674,7 @@ def _zigzag():
     )
 
 
-_species.add_demographic_model(_zigzag())
+_species.add_demographic_model_factory("Zigzag_1S14", _zigzag)
 
 
 def _kamm_ancient_eurasia():
@@ -922,7 +922,7 @@ def _kamm_ancient_eurasia():
     )
 
 
-_species.add_demographic_model(_kamm_ancient_eurasia())
+_species.add_demographic_model_factory("AncientEurasia_9K19", _kamm_ancient_eurasia)
 
 
 def _papuans_10j19():
@@ -1242,7 +1242,7 @@ def _papuans_10j19():
     )
 
 
-_species.add_demographic_model(_papuans_10j19())
+_species.add_demographic_model_factory("PapuansOutOfAfrica_10J19", _papuans_10j19)
 
 
 def _AJ():
@@ -1384,7 +1384,7 @@ def _AJ():
     )
 
 
-_species.add_demographic_model(_AJ())
+_species.add_demographic_model_factory("AshkSub_7G19", _AJ)
 
 
 def _ooa_4pop():
@@ -1547,4 +1547,4 @@ def _ooa_4pop():
     )
 
 
-_species.add_demographic_model(_ooa_4pop())
+_species.add_demographic_model_factory("OutOfAfrica_4J17", _ooa_4pop)
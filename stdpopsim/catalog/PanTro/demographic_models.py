@@ -273,7 +273,7 @@ def _bcen_4D16():
         demographic_events=demographic_events,
     )
     
-_species.add_demographic_model(_bcen_4D16())
+_species.add_demographic_model_factory("BCEN_4D16", _bcen_4D16)
 
 def _bcew_4D16():
     
@@ -496,7 +496,7 @@ def _bcew_4D16():
         demographic_events=demographic_events,
     )
     
-_species.add_demographic_model(_bcew_4D16())
+_species.add_demographic_model_factory("BCEW_4D16", _bcew_4D16)
 
 def _bonobo_archaic_admixture_4K19():
     
@@ -684,4 +684,6 @@ def _bonobo_archaic_admixture_4K19():
         demographic_events=demographic_events,
     )
 
-_species.add_demographic_model(_bonobo_archaic_admixture_4K19())
\ No newline at end of file
+_species.add_demographic_model_factory(
+    "BonoboArchaicAdmixture_4K19", _bonobo_archaic_admixture_4K19
+)
\ No newline at end of file
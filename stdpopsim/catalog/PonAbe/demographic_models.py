@@ -100,4 +100,4 @@ def _orangutan():
     )
 
 
-_species.add_demographic_model(_orangutan())
+_species.add_demographic_model_factory("TwoSpecies_2L11", _orangutan)
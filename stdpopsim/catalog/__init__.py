@@ -1,10 +1,19 @@
+import importlib
 import pathlib
 
 from . import ensembl_info  # noqa: F401
 
-# Import all species definitions in the catalog.
+# List all species definitions in the catalog. The species packages are
+# imported on demand (see stdpopsim.get_species()), so that importing stdpopsim
+# does not build the definitions for every species.
 __all__ = []
-for path in pathlib.Path(__path__[0]).glob("*"):
+for path in sorted(pathlib.Path(__path__[0]).glob("*")):
     module_name = path.parts[-1]
     if module_name[0].isupper():
         __all__.append(module_name)
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
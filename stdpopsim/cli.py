@@ -3,18 +3,16 @@ The command line interface for stdpopsim. Provides standard simulations
 at the command line and methods to manage resources used by stdpopsim.
 """
 import argparse
-import json
+import concurrent.futures
 import logging
 import warnings
 import platform
 import sys
 import textwrap
-import tempfile
-import pathlib
-import shutil
 import os
 import re
 import inspect
+import time
 
 import msprime
 import tskit
@@ -111,7 +109,7 @@ def get_models_help(species_id, model_id):
     species = stdpopsim.get_species(species_id)
     if model_id is None:
         models_text = f"\nAll simulation models for {species.name}\n\n"
-        models = [model.id for model in species.demographic_models]
+        models = species.demographic_model_ids
     else:
         models = [model_id]
         models_text = "\nModel description\n\n"
@@ -239,27 +237,32 @@ def get_provenance_dict():
     return document
 
 
-def write_output(ts, args):
+def write_output(ts, args, replicate=None, provenance=None):
     """
-    Adds provenance information to the specified tree sequence (ensuring that the
-    output is reproducible) and write the resulting tree sequence to output.
+    Writes the specified tree sequence to output. If ``provenance`` is
+    specified, the provenance information (ensuring that the output is
+    reproducible) is added as the tree sequence is written. Otherwise, it
+    has been added by the engine, and the tables are not copied here. If
+    ``replicate`` is specified, the output is a template for the file name
+    of each replicate.
     """
-    tables = ts.dump_tables()
-    logger.debug("Updating provenance")
-    provenance = get_provenance_dict()
-    tables.provenances.add_row(json.dumps(provenance))
-    ts = tables.tree_sequence()
-    if args.output is None:
-        # There's no way to get tskit to write directly to stdout, so we write
-        # to a tempfile first.
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpfile = pathlib.Path(tmpdir) / "tmp.trees"
-            ts.dump(tmpfile)
-            with open(tmpfile, "rb") as f:
-                shutil.copyfileobj(f, sys.stdout.buffer)
+    output = args.output
+    if replicate is not None:
+        output = output.format(replicate=replicate)
+    if output is None:
+        logger.debug("Writing to stdout")
+        stdpopsim.utils.dump_tree_sequence(
+            ts, sys.stdout.buffer, args.compress, provenance=provenance
+        )
+    elif args.compress or provenance is not None:
+        logger.debug(f"Writing to {output}")
+        with open(output, "wb") as f:
+            stdpopsim.utils.dump_tree_sequence(
+                ts, f, compress=args.compress, provenance=provenance
+            )
     else:
-        logger.debug(f"Writing to {args.output}")
-        ts.dump(args.output)
+        logger.debug(f"Writing to {output}")
+        ts.dump(output)
 
 
 def get_citations(engine, model, contig, species):
@@ -419,6 +422,19 @@ def add_simulate_species_parser(parser, species):
         ),
     )
 
+    species_parser.add_argument(
+        "--all-autosomes",
+        action="store_true",
+        default=False,
+        help=(
+            "Simulate each of the autosomes independently, using the "
+            "chromosome-specific recombination and mutation rates (or the "
+            "genetic map). One tree sequence file per chromosome is written "
+            "to the directory given by --output, along with a manifest file "
+            "(manifest.json). Chromosomes are simulated in parallel if "
+            "--num-workers is given."
+        ),
+    )
     species_parser.add_argument(
         "-L",
         "--length",
@@ -426,6 +442,26 @@ def add_simulate_species_parser(parser, species):
         type=float,
         help="Simulate a default contig of given length.",
     )
+    species_parser.add_argument(
+        "--left",
+        default=None,
+        type=float,
+        help=(
+            "Simulate only the region of the chromosome starting at this "
+            "position. Coordinates in the output are those of the chromosome. "
+            "Default=0."
+        ),
+    )
+    species_parser.add_argument(
+        "--right",
+        default=None,
+        type=float,
+        help=(
+            "Simulate only the region of the chromosome ending at this "
+            "position. Coordinates in the output are those of the chromosome. "
+            "Default=the length of the chromosome."
+        ),
+    )
     species_parser.add_argument(
         "-i",
         "--inclusion-mask",
@@ -460,10 +496,13 @@ def add_simulate_species_parser(parser, species):
         ),
     )
 
+    # We use the model IDs here, so that the models themselves are only
+    # built when they are simulated or their help is requested.
+    model_ids = species.demographic_model_ids
     model_help = (
         "Specify a simulation model. If no model is specified, a single population"
         "constant size model is used. Available models:"
-        f"{', '.join(model.id for model in species.demographic_models)}"
+        f"{', '.join(model_ids)}"
         ". Please see --help-models for details of these models."
     )
     species_parser.add_argument(
@@ -471,7 +510,7 @@ def add_simulate_species_parser(parser, species):
         "--demographic-model",
         default=None,
         metavar="",
-        choices=[model.id for model in species.demographic_models],
+        choices=model_ids,
         help=model_help,
     )
     species_parser.add_argument(
@@ -483,6 +522,38 @@ def add_simulate_species_parser(parser, species):
         ),
     )
 
+    species_parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help=(
+            "Compress the output tree sequence with gzip. The output is written "
+            "directly to the file (or stdout), without using temporary files. "
+            "Use e.g. 'gunzip -c' to decompress the output."
+        ),
+    )
+
+    species_parser.add_argument(
+        "--num-replicates",
+        default=1,
+        type=int,
+        help=(
+            "The number of independent replicates to simulate. When simulating "
+            "more than one replicate, --output must be given and must contain "
+            "'{replicate}', which is replaced by the replicate number in the "
+            "file name of each replicate. Default=1."
+        ),
+    )
+    species_parser.add_argument(
+        "--num-workers",
+        default=1,
+        type=int,
+        help=(
+            "The number of processes used to simulate replicates, or "
+            "chromosomes with --all-autosomes. Default=1."
+        ),
+    )
+
     species_parser.add_argument(
         "samples",
         type=int,
@@ -515,7 +586,15 @@ def add_simulate_species_parser(parser, species):
                 f"Cannot sample from more than {model.num_sampling_populations} "
                 "populations"
             )
+        if args.num_replicates > 1 and (
+            args.output is None or "{replicate}" not in args.output
+        ):
+            exit("The --output must contain '{replicate}' when simulating replicates")
         samples = model.get_samples(*args.samples)
+        engine = stdpopsim.get_engine(args.engine)
+        if args.all_autosomes:
+            run_all_autosomes(args, species, model, samples, engine, qc_complete)
+            return
         contig = species.get_contig(
             args.chromosome,
             genetic_map=args.genetic_map,
@@ -524,8 +603,9 @@ def add_simulate_species_parser(parser, species):
             inclusion_mask=args.inclusion_mask,
             exclusion_mask=args.exclusion_mask,
             mutation_rate=model.mutation_rate,
+            left=args.left,
+            right=args.right,
         )
-        engine = stdpopsim.get_engine(args.engine)
         logger.info(
             f"Running simulation model {model.id} for {species.id} on "
             f"{contig} with {len(samples)} samples using {engine.id}."
@@ -535,29 +615,41 @@ def add_simulate_species_parser(parser, species):
             engine=engine, model=model, contig=contig, samples=samples, seed=args.seed
         )
         if not qc_complete:
-            warnings.warn(
-                stdpopsim.QCMissingWarning(
-                    f"{model.id} has not been QCed. Use at your own risk! "
-                    "Demographic models that have not undergone stdpopsim's "
-                    "Quality Control procedure may contain implementation "
-                    "errors, leading to differences between simulations "
-                    "and the model described in the original publication. "
-                    "More information about the QC process can be found in "
-                    "the developer documentation. "
-                    "https://stdpopsim.readthedocs.io/en/latest/development.html"
-                    "#demographic-model-review-process"
-                )
-            )
+            warn_qc_missing(model)
 
-        # extract simulate() parameters from CLI args
-        accepted_params = inspect.signature(engine.simulate).parameters.keys()
-        kwargs = {k: v for k, v in vars(args).items() if k in accepted_params}
+        # The provenance is added by the engine if it copies the tables
+        # anyway, and otherwise as the output is written.
+        provenance = get_provenance_dict()
+        add_provenance = engine.records_provenance(contig)
+        kwargs = get_simulate_kwargs(engine, args)
         kwargs.update(demographic_model=model, contig=contig, samples=samples)
-        ts = engine.simulate(**kwargs)
-
-        summarise_usage()
-        if ts is not None:
-            write_output(ts, args)
+        if add_provenance:
+            kwargs["provenance"] = provenance
+        if args.num_replicates > 1 and not args.dry_run:
+            del kwargs["dry_run"]
+            replicates = engine.simulate_replicates(
+                num_replicates=args.num_replicates,
+                num_workers=args.num_workers,
+                **kwargs,
+            )
+            for replicate, ts in enumerate(replicates):
+                if ts is not None:
+                    replicate_provenance = None
+                    if not add_provenance:
+                        replicate_provenance = stdpopsim.utils.replicate_provenance(
+                            provenance, replicate
+                        )
+                    write_output(
+                        ts, args, replicate=replicate, provenance=replicate_provenance
+                    )
+            summarise_usage()
+        else:
+            ts = engine.simulate(**kwargs)
+            summarise_usage()
+            if ts is not None:
+                write_output(
+                    ts, args, provenance=None if add_provenance else provenance
+                )
         # Non-QCed models shouldn't be used in publications, so we skip the
         # "If you use this simulation in published work..." citation request.
         if qc_complete:
@@ -568,6 +660,86 @@ def add_simulate_species_parser(parser, species):
     species_parser.set_defaults(runner=run_simulation)
 
 
+def warn_qc_missing(model):
+    warnings.warn(
+        stdpopsim.QCMissingWarning(
+            f"{model.id} has not been QCed. Use at your own risk! "
+            "Demographic models that have not undergone stdpopsim's "
+            "Quality Control procedure may contain implementation "
+            "errors, leading to differences between simulations "
+            "and the model described in the original publication. "
+            "More information about the QC process can be found in "
+            "the developer documentation. "
+            "https://stdpopsim.readthedocs.io/en/latest/development.html"
+            "#demographic-model-review-process"
+        )
+    )
+
+
+def get_simulate_kwargs(engine, args):
+    """
+    Returns the arguments for the engine's simulate() method from the CLI args.
+    """
+    accepted_params = inspect.signature(engine.simulate).parameters.keys()
+    return {k: v for k, v in vars(args).items() if k in accepted_params}
+
+
+def run_all_autosomes(args, species, model, samples, engine, qc_complete):
+    """
+    Simulates all autosomes of the species, writing the output to the
+    directory given by args.output.
+    """
+    for option, is_set in [
+        ("--chromosome", args.chromosome is not None),
+        ("--length", args.length is not None),
+        ("--length-multiplier", args.length_multiplier != 1),
+        ("--left", args.left is not None),
+        ("--right", args.right is not None),
+        ("--num-replicates", args.num_replicates != 1),
+        ("--compress", args.compress),
+        ("--slim-script", getattr(args, "slim_script", False)),
+    ]:
+        if is_set:
+            exit(f"Cannot use {option} with --all-autosomes")
+    if args.output is None:
+        exit("Must specify the --output directory with --all-autosomes")
+    genetic_map = None
+    if args.genetic_map is not None:
+        genetic_map = get_genetic_map_wrapper(species, args.genetic_map)
+    logger.info(
+        f"Running simulation model {model.id} for all autosomes of {species.id} "
+        f"with {len(samples)} samples using {engine.id}."
+    )
+    if not qc_complete:
+        warn_qc_missing(model)
+
+    kwargs = get_simulate_kwargs(engine, args)
+    for key in ["demographic_model", "contig", "samples"]:
+        kwargs.pop(key, None)
+    dry_run = kwargs.pop("dry_run", False)
+    if not dry_run:
+        engine.simulate_autosomes(
+            model,
+            species,
+            samples,
+            args.output,
+            genetic_map=args.genetic_map,
+            mutation_rate=model.mutation_rate,
+            inclusion_mask=args.inclusion_mask,
+            exclusion_mask=args.exclusion_mask,
+            num_workers=args.num_workers,
+            provenance=get_provenance_dict(),
+            **kwargs,
+        )
+    summarise_usage()
+    # The citations only depend on the genetic map, and not on the contig.
+    contig = stdpopsim.Contig(genetic_map=genetic_map)
+    if qc_complete:
+        write_citations(engine, model, contig, species)
+    if args.bibtex_file is not None:
+        write_bibtex(engine, model, contig, species, args.bibtex_file)
+
+
 def write_simulation_summary(engine, model, contig, samples, seed=None):
     indent = " " * 4
     # Header
@@ -613,23 +785,150 @@ def write_simulation_summary(engine, model, contig, samples, seed=None):
     logger.warning(dry_run_text)
 
 
+def get_species_ids():
+    """
+    Returns the IDs of the species in the catalog and of any other registered
+    species, without loading the species from the catalog.
+    """
+    species_ids = list(stdpopsim.catalog.__all__)
+    for species_id in stdpopsim.species.registered_species.keys():
+        if species_id not in species_ids:
+            species_ids.append(species_id)
+    return species_ids
+
+
+def is_help_option(arg):
+    # Options can be abbreviated, e.g. --he for --help.
+    return arg == "-h" or (len(arg) > 2 and "--help".startswith(arg))
+
+
+def get_parsed_species_ids(arg_list):
+    """
+    Returns the IDs of the species whose subparsers are needed to parse the
+    specified command line arguments, or None if the top-level help may be
+    printed, which describes every species. Constructing a species subparser
+    requires loading the species from the catalog and generating its help
+    text, which we do not want to do for every species on each invocation.
+    """
+    all_species_ids = get_species_ids()
+    species_ids = []
+    subcommand = False
+    for arg in arg_list:
+        if arg in all_species_ids:
+            species_ids.append(arg)
+            subcommand = True
+        elif arg in ("download-genetic-maps", "cache"):
+            subcommand = True
+        elif not subcommand and is_help_option(arg):
+            return None
+    return species_ids
+
+
+def download_genetic_map(genetic_map, precompile):
+    species_id = genetic_map.species.id
+    logger.warning(f"Downloading map {species_id}/{genetic_map.id}")
+    genetic_map.download()
+    if precompile:
+        logger.warning(f"Precompiling map {species_id}/{genetic_map.id}")
+        genetic_map.precompile()
+
+
 def run_download_genetic_maps(args):
+    if args.num_threads < 1:
+        exit("Must have at least one download thread")
     species_names = [args.species]
     if args.species is None:
         species_names = [species.id for species in stdpopsim.all_species()]
+    genetic_maps = []
     for species_id in species_names:
         species = get_species_wrapper(species_id)
-        if len(args.genetic_maps) == 0:
-            genetic_maps = [gmap.id for gmap in species.genetic_maps]
+        genetic_map_ids = args.genetic_maps
+        if len(genetic_map_ids) == 0:
+            genetic_map_ids = [gmap.id for gmap in species.genetic_maps]
+        for genetic_map_id in genetic_map_ids:
+            genetic_maps.append(get_genetic_map_wrapper(species, genetic_map_id))
+
+    # Downloading is mostly waiting on the network, so we fetch several maps
+    # at once in threads.
+    with concurrent.futures.ThreadPoolExecutor(args.num_threads) as executor:
+        futures = [
+            executor.submit(download_genetic_map, genetic_map, args.precompile)
+            for genetic_map in genetic_maps
+        ]
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def parse_size(value):
+    """
+    Parses a size in bytes, which may have a suffix K, M, G or T for
+    kibibytes, mebibytes, etc.
+    """
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    match = re.fullmatch(r"([0-9.]+)\s*([KMGT]?)i?B?", value.strip(), re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    try:
+        return int(float(match.group(1)) * units[match.group(2).upper()])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+
+
+def format_cache_entry(entry):
+    last_access = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_access))
+    size = humanize.naturalsize(entry.size, binary=True)
+    return f"{entry.name}\t{entry.kind}\t{size}\t{last_access}"
+
+
+def run_cache_list(args):
+    entries = stdpopsim.list_cache()
+    for entry in entries:
+        print(format_cache_entry(entry))
+    total = humanize.naturalsize(sum(entry.size for entry in entries), binary=True)
+    print(f"Total size of {stdpopsim.get_cache_dir()}: {total}")
+
+
+def run_cache_verify(args):
+    if args.num_threads < 1:
+        exit("Must have at least one verification thread")
+    failed = 0
+    for entry, problem in stdpopsim.verify_cache(num_threads=args.num_threads):
+        if problem is None:
+            print(f"{entry.name}\tOK")
         else:
-            genetic_maps = args.genetic_maps
-        for genetic_map_id in genetic_maps:
-            genetic_map = get_genetic_map_wrapper(species, genetic_map_id)
-            logger.warning(f"Downloading map {species_id}/{genetic_map_id}")
-            genetic_map.download()
+            print(f"{entry.name}\tFAILED: {problem}")
+            failed += 1
+    if failed > 0:
+        exit(f"{failed} cache entries failed verification")
+
+
+def run_cache_evict(args):
+    if args.max_size is None and args.max_age is None:
+        exit("Must specify --max-size or --max-age")
+    max_age = None if args.max_age is None else args.max_age * 24 * 3600
+    removed = stdpopsim.evict_cache(
+        max_size=args.max_size, max_age=max_age, dry_run=args.dry_run
+    )
+    for entry in removed:
+        print(format_cache_entry(entry))
+    total = humanize.naturalsize(sum(entry.size for entry in removed), binary=True)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {len(removed)} cache entries ({total})")
 
 
-def stdpopsim_cli_parser():
+def stdpopsim_cli_parser(species_ids=None):
+    """
+    Returns the argument parser for the stdpopsim CLI. If ``species_ids`` is
+    specified, the subparsers are only constructed for these species. The
+    other species are subcommands without any arguments or help text, and
+    so the parser can't be used to parse their arguments or print the
+    top-level help.
+    """
+
     class QuietAction(argparse.Action):
         def __call__(self, parser, namespace, values, option_string=None):
             namespace.verbose = 0
@@ -719,6 +1018,15 @@ def stdpopsim_cli_parser():
         help="Change to the specified simulation MODEL at generation T. "
         "This option may provided multiple times.",
     )
+    msprime_parser.add_argument(
+        "--msprime-premask",
+        action="store_true",
+        default=False,
+        help="Apply the inclusion or exclusion mask during the simulation, "
+        "so that no mutations are simulated in masked regions, and masked "
+        "flanks are not simulated. This is faster for sparse masks, and "
+        "statistically identical, but gives different output for a given seed.",
+    )
 
     # SLiM is not available for windows.
     if not IS_WINDOWS:
@@ -741,7 +1049,9 @@ def stdpopsim_cli_parser():
             "--slim-script",
             action="store_true",
             default=False,
-            help="Write script to stdout and exit without running SLiM.",
+            help="Write script to stdout and exit without running SLiM. "
+            "The output file must be defined when running the script, "
+            "with slim -d 'trees_file=\"out.trees\"'.",
         )
         slim_parser.add_argument(
             "--slim-scaling-factor",
@@ -753,6 +1063,14 @@ def stdpopsim_cli_parser():
             "improve simulation performance`. "
             "[default=%(default)s].",
         )
+        slim_parser.add_argument(
+            "--slim-scratch-dir",
+            metavar="DIR",
+            default=None,
+            help="Directory in which SLiM writes its tree sequence before it "
+            "is loaded. By default, /dev/shm is used if it has enough free "
+            "space, so that the tree sequence is held in memory.",
+        )
         slim_parser.add_argument(
             "--slim-burn-in",
             metavar="X",
@@ -765,8 +1083,12 @@ def stdpopsim_cli_parser():
     subparsers = top_parser.add_subparsers(dest="subcommand")
     subparsers.required = True
 
-    for species in stdpopsim.all_species():
-        add_simulate_species_parser(subparsers, species)
+    for species_id in get_species_ids():
+        if species_ids is None or species_id in species_ids:
+            species = stdpopsim.get_species(species_id)
+            add_simulate_species_parser(subparsers, species)
+        else:
+            subparsers.add_parser(species_id)
 
     download_maps_parser = subparsers.add_parser(
         "download-genetic-maps",
@@ -795,9 +1117,83 @@ def stdpopsim_cli_parser():
             "are provided, download all maps for this species."
         ),
     )
+    download_maps_parser.add_argument(
+        "--precompile",
+        action="store_true",
+        default=False,
+        help=(
+            "Parse the downloaded maps for every chromosome and store them in "
+            "a binary format in the cache, which is faster to load when "
+            "simulating."
+        ),
+    )
+
+    download_maps_parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=4,
+        help="The number of genetic maps to download at the same time.",
+    )
 
     download_maps_parser.set_defaults(runner=run_download_genetic_maps)
 
+    cache_parser = subparsers.add_parser(
+        "cache",
+        help="Manage the cache directory",
+        description=(
+            "List, verify and remove the genetic maps, annotations and other "
+            "data stored in the cache directory. Please use the --cache-dir "
+            "option to manage a specific directory."
+        ),
+    )
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command")
+    cache_subparsers.required = True
+    cache_list_parser = cache_subparsers.add_parser(
+        "list",
+        help="List the cached data with their sizes and last access times.",
+    )
+    cache_list_parser.set_defaults(runner=run_cache_list)
+    cache_verify_parser = cache_subparsers.add_parser(
+        "verify", help="Check the cached data against their checksums."
+    )
+    cache_verify_parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=4,
+        help="The number of cache entries to check at the same time.",
+    )
+    cache_verify_parser.set_defaults(runner=run_cache_verify)
+    cache_evict_parser = cache_subparsers.add_parser(
+        "evict",
+        help="Remove the least recently used data.",
+        description=(
+            "Remove the least recently used data from the cache. Data that "
+            "are being downloaded by another process are not removed."
+        ),
+    )
+    cache_evict_parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        default=None,
+        help=(
+            "Remove the least recently used data until the cache is at most "
+            "this size, in bytes or with a suffix K, M, G or T (e.g. 10G)."
+        ),
+    )
+    cache_evict_parser.add_argument(
+        "--max-age",
+        type=float,
+        default=None,
+        help="Remove data that have not been used for this many days.",
+    )
+    cache_evict_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="List the data that would be removed, without removing them.",
+    )
+    cache_evict_parser.set_defaults(runner=run_cache_evict)
+
     return top_parser
 
 
@@ -808,7 +1204,9 @@ def run(args):
 
 
 def stdpopsim_main(arg_list=None):
-    parser = stdpopsim_cli_parser()
+    if arg_list is None:
+        arg_list = sys.argv[1:]
+    parser = stdpopsim_cli_parser(get_parsed_species_ids(arg_list))
     args = parser.parse_args(arg_list)
     setup_logging(args)
     if args.cache_dir is not None:
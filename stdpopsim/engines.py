@@ -1,4 +1,9 @@
+import collections
+import concurrent.futures
+import inspect
+import json
 import logging
+import pathlib
 import warnings
 
 import attr
@@ -74,6 +79,7 @@ class Engine:
         *,
         seed=None,
         dry_run=False,
+        provenance=None,
     ):
         """
         Simulates the model for the specified contig and samples. ``demographic_model``,
@@ -91,6 +97,10 @@ class Engine:
         :param dry_run: If True, the simulation engine will return None without
             running the simulation.
         :type dry_run: bool
+        :param dict provenance: If specified, a provenance record conforming to
+            the tskit provenance schema, which is added to the tree sequence
+            while its tables are built, rather than by copying the tables
+            afterwards.
         :return: A succinct tree sequence.
         :rtype: :class:`tskit.trees.TreeSequence` or None
         """
@@ -104,6 +114,294 @@ class Engine:
         """
         raise NotImplementedError()
 
+    def simulate_replicates(
+        self,
+        demographic_model,
+        contig,
+        samples,
+        num_replicates,
+        *,
+        seed=None,
+        num_workers=1,
+        output=None,
+        batch_size=None,
+        provenance=None,
+        **kwargs,
+    ):
+        """
+        Simulates ``num_replicates`` independent replicates of the model for the
+        specified contig and samples. Each replicate is simulated with its own
+        seed, derived from ``seed`` and the replicate number, so that the
+        output for a replicate does not depend on ``num_replicates``,
+        ``batch_size`` or the number of workers.
+
+        :param demographic_model: The demographic model to simulate.
+        :type demographic_model: :class:`.DemographicModel`
+        :param contig: The contig, defining the length, mutation rate,
+            and recombination rate(s).
+        :type contig: :class:`.Contig`
+        :param samples: The samples to be obtained from the simulation.
+        :type samples: list of :class:`msprime.simulations.Sample`
+        :param int num_replicates: The number of replicates to simulate.
+        :param seed: The seed from which the seed for each replicate is
+            derived.
+        :type seed: int
+        :param int num_workers: The number of processes in which replicates are
+            simulated. If 1 (the default), the replicates are simulated in the
+            current process.
+        :param str output: If specified, each replicate is written to the file
+            ``output.format(replicate=j)``, where ``j`` is the replicate number,
+            rather than being returned. The ``output`` string must therefore
+            contain ``{replicate}``.
+        :param int batch_size: The number of replicates simulated in each batch
+            by a worker. Engines may simulate a batch of replicates more
+            efficiently than the same number of replicates individually, while
+            smaller batches may be spread more evenly over the workers. If None,
+            the engine's default is used.
+        :param dict provenance: If specified, a provenance record which is added
+            to each replicate (see :meth:`.simulate`). The replicate number is
+            recorded as the ``replicate`` parameter of the record.
+        :param \\**kwargs: Further arguments passed to :meth:`.simulate`.
+        :return: If ``output`` is None, an iterator over the tree sequences for
+            each replicate, in order. At most a few replicates per worker are
+            held in memory at any time. Otherwise, the list of files to which
+            the replicates were written.
+        :rtype: iterator of :class:`tskit.trees.TreeSequence`, or list of str
+        """
+        if num_replicates < 1:
+            raise ValueError("Must simulate at least one replicate")
+        if num_workers < 1:
+            raise ValueError("Must have at least one worker")
+        if output is not None and "{replicate}" not in output:
+            raise ValueError("The output must contain '{replicate}'")
+        if batch_size is None:
+            batch_size = self._default_batch_size(num_replicates)
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least one")
+
+        # The replicates may be simulated in other processes, so the citations
+        # for the simulation are added here.
+        self._add_citations(self._simulation_citations(**kwargs))
+        num_batches = math.ceil(num_replicates / batch_size)
+        seeds = _replicate_seeds(seed, num_replicates)
+        batches = []
+        for j in range(num_batches):
+            replicates = range(
+                j * batch_size, min((j + 1) * batch_size, num_replicates)
+            )
+            batches.append((replicates, seeds[replicates.start : replicates.stop]))
+        logger.info(
+            f"Simulating {num_replicates} replicates in {num_batches} batches "
+            f"using {num_workers} worker(s)"
+        )
+        results = _simulate_batches(
+            self,
+            batches,
+            num_workers,
+            output,
+            provenance=provenance,
+            demographic_model=demographic_model,
+            contig=contig,
+            samples=samples,
+            **kwargs,
+        )
+        if output is not None:
+            results = list(results)
+        return results
+
+    def simulate_autosomes(
+        self,
+        demographic_model,
+        species,
+        samples,
+        output_dir,
+        *,
+        genetic_map=None,
+        mutation_rate=None,
+        inclusion_mask=None,
+        exclusion_mask=None,
+        seed=None,
+        num_workers=1,
+        provenance=None,
+        **kwargs,
+    ):
+        """
+        Simulates each of the autosomes of the specified species independently,
+        using the chromosome-specific mutation and recombination rates (or
+        the specified genetic map). The tree sequence for each chromosome is
+        written to the file ``{id}.trees`` in ``output_dir``, where ``id`` is
+        the chromosome ID, and a summary of the simulations is written to the
+        file ``manifest.json``.
+
+        The chromosomes are simulated in ``num_workers`` separate processes,
+        starting with the largest. Each worker holds a single chromosome in
+        memory at a time. Each chromosome is simulated with a seed derived
+        from ``seed``, so that the output does not depend on the number of
+        workers.
+
+        :param demographic_model: The demographic model to simulate.
+        :type demographic_model: :class:`.DemographicModel`
+        :param species: The species whose autosomes are simulated.
+        :type species: :class:`.Species`
+        :param samples: The samples to be obtained from the simulation.
+        :type samples: list of :class:`msprime.simulations.Sample`
+        :param output_dir: The directory in which to write the output, which is
+            created if it does not exist.
+        :type output_dir: str or pathlib.Path
+        :param str genetic_map: The ID of the genetic map to use.
+            See :meth:`.Species.get_contig`.
+        :param float mutation_rate: The mutation rate to use for all chromosomes.
+            If None, the chromosome-specific mutation rates are used.
+        :param str inclusion_mask: The path to a bed file giving the regions to
+            keep. See :meth:`.Species.get_contig`.
+        :param str exclusion_mask: The path to a bed file giving the regions to
+            remove. See :meth:`.Species.get_contig`.
+        :param seed: The seed from which the seed for each chromosome is derived.
+        :type seed: int
+        :param int num_workers: The number of processes in which chromosomes
+            are simulated. If 1 (the default), the chromosomes are simulated
+            in the current process.
+        :param dict provenance: If specified, a provenance record conforming to
+            the tskit provenance schema, which is added to each tree sequence.
+        :param \\**kwargs: Further arguments passed to :meth:`.simulate`.
+        :return: The manifest, which is also written to ``manifest.json``.
+        :rtype: dict
+        """
+        if num_workers < 1:
+            raise ValueError("Must have at least one worker")
+        output_dir = pathlib.Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        autosomes = species.genome.autosomes
+        rng = np.random.default_rng(seed)
+        seeds = rng.integers(1, 2 ** 31 - 1, size=len(autosomes))
+        tasks = [
+            dict(
+                chromosome=chrom.id,
+                output_file=output_dir / f"{chrom.id}.trees",
+                seed=int(chrom_seed),
+            )
+            for chrom, chrom_seed in zip(autosomes, seeds)
+        ]
+        # Simulating the largest chromosomes first keeps the workers busy
+        # until the end.
+        lengths = {chrom.id: chrom.length for chrom in autosomes}
+        tasks.sort(key=lambda task: -lengths[task["chromosome"]])
+        self._add_citations(self._simulation_citations(**kwargs))
+        kwargs.update(
+            demographic_model=demographic_model,
+            species=species,
+            samples=samples,
+            genetic_map=genetic_map,
+            mutation_rate=mutation_rate,
+            inclusion_mask=inclusion_mask,
+            exclusion_mask=exclusion_mask,
+            provenance=provenance,
+        )
+        logger.info(
+            f"Simulating {len(autosomes)} autosomes of {species.id} "
+            f"using {num_workers} worker(s)"
+        )
+
+        chromosomes = {}
+        if num_workers == 1:
+            for task in tasks:
+                chromosomes[task["chromosome"]] = _simulate_chromosome(
+                    self, **task, **kwargs
+                )
+        else:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers
+            ) as executor:
+                futures = [
+                    executor.submit(_simulate_chromosome, self, **task, **kwargs)
+                    for task in tasks
+                ]
+                try:
+                    for task, future in zip(tasks, futures):
+                        chromosomes[task["chromosome"]] = future.result()
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        manifest = {
+            "species": species.id,
+            "demographic_model": demographic_model.id,
+            "engine": self.id,
+            "genetic_map": genetic_map,
+            "seed": seed,
+            "chromosomes": [chromosomes[chrom.id] for chrom in autosomes],
+        }
+        with open(output_dir / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def _default_batch_size(self, num_replicates):
+        """
+        Returns the default number of replicates in each batch simulated by
+        :meth:`.simulate_replicates`.
+        """
+        return 1
+
+    def _simulation_citations(self, **kwargs):
+        """
+        Returns the citations, in addition to those for the engine, for a
+        simulation with the specified engine-specific arguments of
+        :meth:`.simulate`.
+        """
+        return []
+
+    def _add_citations(self, citations):
+        """
+        Adds the specified citations to this engine's citations, if they are
+        not already there. The list is replaced, rather than extended, as it
+        may be the class attribute.
+        """
+        new_citations = [c for c in citations if c not in self.citations]
+        if len(new_citations) > 0:
+            self.citations = self.citations + new_citations
+
+    def records_provenance(self, contig):
+        """
+        Returns True if a provenance record passed to :meth:`.simulate` for the
+        specified contig is added while the engine builds the tables of the
+        tree sequence, which it copies anyway (for instance, to apply a mask).
+        Otherwise, adding the record requires a copy of the tables and a new
+        tree sequence, and so it is best added as the tree sequence is
+        written, with :func:`stdpopsim.utils.dump_tree_sequence`.
+        Engines whose :meth:`.simulate` method does not take a ``provenance``
+        argument never record it.
+
+        :param contig: The contig to be simulated.
+        :type contig: :class:`.Contig`
+        :rtype: bool
+        """
+        if "provenance" not in inspect.signature(self.simulate).parameters:
+            return False
+        return contig.inclusion_mask is not None or contig.exclusion_mask is not None
+
+    def _simulate_batch(
+        self,
+        demographic_model,
+        contig,
+        samples,
+        *,
+        seeds,
+        provenances=None,
+        **kwargs,
+    ):
+        """
+        Returns an iterator over replicate simulations with the specified
+        ``seeds``, which are simulated as by :meth:`.simulate` with each seed.
+        If specified, ``provenances`` is the list of provenance records for
+        each replicate. Engines that can simulate replicates more efficiently
+        than by repeatedly calling :meth:`.simulate` should override this.
+        """
+        for j, seed in enumerate(seeds):
+            if provenances is not None:
+                # Only passed if needed, for engines which predate the argument.
+                kwargs["provenance"] = provenances[j]
+            yield self.simulate(demographic_model, contig, samples, seed=seed, **kwargs)
+
     def _warn_zigzag(self, demographic_model):
         if demographic_model.id == "Zigzag_1S14":
             warnings.warn(
@@ -127,6 +425,143 @@ class Engine:
             )
 
 
+def _replicate_seeds(seed, num_replicates):
+    """
+    Returns the seeds for the specified number of replicates. The seed for
+    replicate ``j`` is derived from ``seed`` and ``j`` only, so the first
+    replicates are the same whatever the number of replicates.
+    """
+    return [
+        int(np.random.default_rng(child).integers(1, 2 ** 31 - 1))
+        for child in np.random.SeedSequence(seed).spawn(num_replicates)
+    ]
+
+
+def _simulate_batch(engine, replicates, seeds, output, provenance=None, **kwargs):
+    """
+    Returns an iterator over the results for the specified batch of replicates,
+    which are either the tree sequences or the files they were written to.
+    """
+    logger.debug(f"Simulating replicates {replicates} with seeds {seeds}")
+    provenances = None
+    if provenance is not None:
+        provenances = [
+            stdpopsim.utils.replicate_provenance(provenance, replicate)
+            for replicate in replicates
+        ]
+    # If the replicates are written here, the provenance is only added by the
+    # engine if it copies the tables anyway.
+    add_provenance = output is None or engine.records_provenance(kwargs["contig"])
+    tree_sequences = engine._simulate_batch(
+        seeds=seeds,
+        provenances=provenances if add_provenance else None,
+        **kwargs,
+    )
+    for j, (replicate, ts) in enumerate(zip(replicates, tree_sequences)):
+        if output is None:
+            yield ts
+        else:
+            filename = output.format(replicate=replicate)
+            logger.debug(f"Writing replicate {replicate} to {filename}")
+            replicate_provenance = None
+            if provenances is not None and not add_provenance:
+                replicate_provenance = provenances[j]
+            with open(filename, "wb") as f:
+                stdpopsim.utils.dump_tree_sequence(
+                    ts, f, provenance=replicate_provenance
+                )
+            yield filename
+
+
+def _simulate_batch_worker(engine, replicates, seeds, output, **kwargs):
+    return list(_simulate_batch(engine, replicates, seeds, output, **kwargs))
+
+
+def _simulate_batches(engine, batches, num_workers, output, **kwargs):
+    """
+    Returns an iterator over the results for the specified batches of replicates,
+    in order, which are simulated using the specified number of processes.
+    """
+    if num_workers == 1:
+        for replicates, seeds in batches:
+            yield from _simulate_batch(engine, replicates, seeds, output, **kwargs)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        # We only submit batches a little ahead of the results that have been
+        # consumed, so that the number of results held in memory is bounded.
+        futures = collections.deque()
+        try:
+            for replicates, seeds in batches:
+                futures.append(
+                    executor.submit(
+                        _simulate_batch_worker,
+                        engine,
+                        replicates,
+                        seeds,
+                        output,
+                        **kwargs,
+                    )
+                )
+                if len(futures) >= 2 * num_workers:
+                    yield from futures.popleft().result()
+            while len(futures) > 0:
+                yield from futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _simulate_chromosome(
+    engine,
+    *,
+    demographic_model,
+    species,
+    chromosome,
+    samples,
+    output_file,
+    seed,
+    genetic_map,
+    mutation_rate,
+    inclusion_mask,
+    exclusion_mask,
+    provenance,
+    **kwargs,
+):
+    """
+    Simulates the specified chromosome and writes the output to ``output_file``,
+    returning the manifest entry for the chromosome.
+    """
+    contig = species.get_contig(
+        chromosome,
+        genetic_map=genetic_map,
+        mutation_rate=mutation_rate,
+        inclusion_mask=inclusion_mask,
+        exclusion_mask=exclusion_mask,
+    )
+    logger.info(f"Simulating chromosome {chromosome} with seed {seed}")
+    add_provenance = engine.records_provenance(contig)
+    if add_provenance:
+        kwargs["provenance"] = provenance
+    ts = engine.simulate(demographic_model, contig, samples, seed=seed, **kwargs)
+    logger.debug(f"Writing chromosome {chromosome} to {output_file}")
+    with open(output_file, "wb") as f:
+        stdpopsim.utils.dump_tree_sequence(
+            ts, f, provenance=None if add_provenance else provenance
+        )
+    return {
+        "id": chromosome,
+        "file": output_file.name,
+        "seed": seed,
+        "length": ts.sequence_length,
+        "mutation_rate": contig.mutation_rate,
+        "mean_recombination_rate": contig.recombination_map.mean_rate,
+        "num_samples": ts.num_samples,
+        "num_trees": ts.num_trees,
+        "num_sites": ts.num_sites,
+    }
+
+
 class _MsprimeEngine(Engine):
     id = "msprime"  #:
     description = "Msprime coalescent simulator"  #:
@@ -198,6 +633,12 @@ class _MsprimeEngine(Engine):
 
         return model, citations
 
+    def _simulation_citations(
+        self, *, msprime_model=None, msprime_change_model=None, **kwargs
+    ):
+        _, citations = self._convert_model_spec(msprime_model, msprime_change_model)
+        return citations
+
     def simulate(
         self,
         demographic_model,
@@ -207,7 +648,9 @@ class _MsprimeEngine(Engine):
         seed=None,
         msprime_model=None,
         msprime_change_model=None,
+        msprime_premask=False,
         dry_run=False,
+        provenance=None,
         **kwargs,
     ):
         """
@@ -222,15 +665,19 @@ class _MsprimeEngine(Engine):
         :param msprime_change_model: A list of (time, model) tuples, which
             changes the simulation model to the new model at the time specified.
         :type msprime_change_model: list of (float, str) tuples
+        :param msprime_premask: If True, the contig's masks are applied during
+            the simulation, rather than only to the simulated tree sequence.
+            No mutations are simulated in masked regions, and masked regions
+            before the first and after the last kept region are not simulated
+            at all (see :meth:`.Contig.masked_rate_maps`). The output is
+            statistically identical, but differs from that without this option
+            for a given seed. This saves work for sparse masks.
+        :type msprime_premask: bool
         :param dry_run: If True, ``end_time=0`` is passed to :meth:`msprime.simulate()`
             to initialise the simulation and then immediately return.
         :type dry_run: bool
         :param \\**kwargs: Further arguments passed to :meth:`msprime.sim_ancestry()`
         """
-
-        model, citations = self._convert_model_spec(msprime_model, msprime_change_model)
-        self.citations.extend(citations)
-
         if "random_seed" in kwargs.keys():
             if seed is None:
                 seed = kwargs["random_seed"]
@@ -238,38 +685,93 @@ class _MsprimeEngine(Engine):
             else:
                 raise ValueError("Cannot set both seed and random_seed")
 
-        # TODO: remove this after a release or two. See #745.
-        self._warn_zigzag(demographic_model)
-        self._warn_mutation_rate_mismatch(contig, demographic_model)
-
-        rng = np.random.default_rng(seed)
-        seeds = rng.integers(1, 2 ** 31 - 1, size=2)
-
-        ts = msprime.sim_ancestry(
-            samples=samples,
-            recombination_rate=contig.recombination_map,
-            demography=demographic_model.model,
-            ploidy=2,
-            random_seed=seeds[0],
-            model=model,
-            end_time=0 if dry_run else None,
-            **kwargs,
+        self._add_citations(
+            self._simulation_citations(
+                msprime_model=msprime_model, msprime_change_model=msprime_change_model
+            )
         )
-        ts = msprime.sim_mutations(
-            ts,
-            end_time=0 if dry_run else None,
-            random_seed=seeds[1],
-            rate=contig.mutation_rate,
+        (ts,) = self._simulate_batch(
+            demographic_model,
+            contig,
+            samples,
+            seeds=[seed],
+            msprime_model=msprime_model,
+            msprime_change_model=msprime_change_model,
+            msprime_premask=msprime_premask,
+            dry_run=dry_run,
+            provenances=None if provenance is None else [provenance],
+            **kwargs,
         )
+        return ts
 
-        if contig.inclusion_mask is not None:
-            ts = stdpopsim.utils.mask_tree_sequence(ts, contig.inclusion_mask, False)
-        if contig.exclusion_mask is not None:
-            ts = stdpopsim.utils.mask_tree_sequence(ts, contig.exclusion_mask, True)
+    def _default_batch_size(self, num_replicates):
+        # Simulating replicates in batches avoids the overhead of preparing
+        # the simulation, and of passing it to a worker, for each replicate.
+        # We aim for enough batches to keep many workers busy.
+        return min(max(1, num_replicates // 100), 100)
 
-        if dry_run:
-            ts = None
-        return ts
+    def _simulate_batch(
+        self,
+        demographic_model,
+        contig,
+        samples,
+        *,
+        seeds,
+        msprime_model=None,
+        msprime_change_model=None,
+        msprime_premask=False,
+        dry_run=False,
+        provenances=None,
+        **kwargs,
+    ):
+        if provenances is None:
+            provenances = [None] * len(seeds)
+        model, _ = self._convert_model_spec(msprime_model, msprime_change_model)
+
+        if "random_seed" in kwargs.keys():
+            raise ValueError("Cannot set both seed and random_seed")
+
+        # TODO: remove this after a release or two. See #745.
+        self._warn_zigzag(demographic_model)
+        self._warn_mutation_rate_mismatch(contig, demographic_model)
+
+        recombination_map = contig.recombination_map
+        mutation_rate = contig.mutation_rate
+        if msprime_premask:
+            recombination_map, mutation_rate = contig.masked_rate_maps()
+
+        # Each replicate has its own seed, so we don't use the num_replicates
+        # argument of msprime.sim_ancestry(), for which the replicates would
+        # depend on how many are simulated together.
+        for seed, provenance in zip(seeds, provenances):
+            rng = np.random.default_rng(seed)
+            ancestry_seed, mutation_seed = rng.integers(1, 2 ** 31 - 1, size=2)
+            ts = msprime.sim_ancestry(
+                samples=samples,
+                recombination_rate=recombination_map,
+                demography=demographic_model.model,
+                ploidy=2,
+                random_seed=ancestry_seed,
+                model=model,
+                end_time=0 if dry_run else None,
+                **kwargs,
+            )
+            ts = msprime.sim_mutations(
+                ts,
+                end_time=0 if dry_run else None,
+                random_seed=mutation_seed,
+                rate=mutation_rate,
+            )
+            if dry_run:
+                yield None
+                continue
+
+            yield stdpopsim.utils.finalise_tree_sequence(
+                ts,
+                inclusion_mask=contig.inclusion_mask,
+                exclusion_mask=contig.exclusion_mask,
+                provenance=provenance,
+            )
 
     def get_version(self):
         return msprime.__version__
@@ -1,6 +1,9 @@
 """
 Infrastructure for managing genetic maps.
 """
+import logging
+import os
+import tempfile
 import warnings
 
 import msprime
@@ -8,6 +11,16 @@ import numpy as np
 
 import stdpopsim
 
+logger = logging.getLogger(__name__)
+
+
+def rate_map_nbytes(rate_map):
+    """
+    Returns the approximate memory used by the specified RateMap, in bytes.
+    """
+    # The position, rate and (internal) cumulative mass arrays.
+    return rate_map.position.nbytes * 3
+
 
 # TODO change this to use attrs
 class GeneticMap:
@@ -45,11 +58,14 @@ class GeneticMap:
         self.description = description
         self.citations = citations
 
+        # Users often only need the maps for a few chromosomes, so these are
+        # only extracted when they are first used.
         self._cache = stdpopsim.CachedData(
             namespace=f"genetic_maps/{self.species.id}/{id}",
             url=url,
             sha256=sha256,
             extract=True,
+            extract_on_demand=True,
         )
 
     @property
@@ -82,6 +98,103 @@ class GeneticMap:
         """
         self._cache.download()
 
+    @property
+    def compiled_map_dir(self):
+        """
+        The path to the directory in which binary copies of the parsed
+        chromosome maps are stored. This is keyed on the SHA256 of the
+        downloaded map, so that the binary maps are invalidated when the
+        map changes.
+
+        :type: pathlib.Path
+        """
+        return self._cache.derived_path / f"compiled_{self.sha256}"
+
+    def _get_map_file(self, chrom_id):
+        """
+        Returns the path to the map file for the specified chromosome, which
+        is extracted from the downloaded map if needed, or None if there is
+        no map for this chromosome.
+        """
+        return self._cache.get_member(self.file_pattern.format(id=chrom_id))
+
+    def _compiled_map_files(self, chrom_id):
+        position_file = self.compiled_map_dir / f"{chrom_id}.position.npy"
+        rate_file = self.compiled_map_dir / f"{chrom_id}.rate.npy"
+        return position_file, rate_file
+
+    def _write_compiled_map(self, chrom_id, recomb_map):
+        self.compiled_map_dir.mkdir(exist_ok=True)
+        for path, array in zip(
+            self._compiled_map_files(chrom_id),
+            (recomb_map.position, recomb_map.rate),
+        ):
+            # Write to a temporary file and rename, so that concurrent
+            # readers never see a partially written file.
+            fd, tmp_path = tempfile.mkstemp(dir=self.compiled_map_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _load_compiled_map(self, chrom_id):
+        """
+        Returns the RateMap for the specified chromosome from the binary copy
+        in the cache, or None if there is no usable copy.
+        """
+        position_file, rate_file = self._compiled_map_files(chrom_id)
+        if not (position_file.exists() and rate_file.exists()):
+            return None
+        try:
+            return msprime.RateMap(
+                position=np.load(position_file), rate=np.load(rate_file)
+            )
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring bad compiled map {position_file}: {err}")
+            return None
+
+    def _read_chromosome_map(self, chrom_id):
+        """
+        Returns the RateMap for the specified chromosome, or None if there is
+        no map for this chromosome. The map is loaded from the binary copy in
+        the cache if available. Otherwise, the HapMap file is extracted from
+        the downloaded map if needed and parsed, and a binary copy is written
+        to the cache.
+        """
+        recomb_map = self._load_compiled_map(chrom_id)
+        if recomb_map is not None:
+            return recomb_map
+        map_file = self._get_map_file(chrom_id)
+        if map_file is None:
+            return None
+        logger.info(f"Compiling map for {self.id}/{chrom_id}")
+        recomb_map = msprime.RateMap.read_hapmap(
+            map_file,
+            rate_col=2,
+            # TODO: set the sequence length. Unfortunately, some of our
+            # maps are shorter than our chromosomes, so this will fail.
+            # sequence_length=chrom.length
+        )
+        try:
+            self._write_compiled_map(chrom_id, recomb_map)
+        except OSError as err:
+            logger.warning(f"Could not write compiled map for {chrom_id}: {err}")
+        return recomb_map
+
+    def precompile(self):
+        """
+        Parses the genetic map for each chromosome and stores a binary copy
+        in the cache, so that later calls to :meth:`.get_chromosome_map` do not
+        need to parse the map files. The map is downloaded if necessary.
+        """
+        if not self.is_cached():
+            self.download()
+        for chrom in self.species.genome.chromosomes:
+            self._read_chromosome_map(chrom.id)
+
     def get_chromosome_map(self, id):
         """
         Returns the genetic map for the chromosome with the specified ``id``.
@@ -92,27 +205,44 @@ class GeneticMap:
         :rtype: :class:`msprime.RateMap`
         :return: A :class:`msprime.RateMap` object.
         """
+        recomb_map, messages = self._get_chromosome_map(id)
+        for message in messages:
+            warnings.warn(message, stacklevel=2)
+        return recomb_map
+
+    def _get_chromosome_map(self, id):
+        """
+        Returns the genetic map for the chromosome with the specified ``id``,
+        and the list of warnings for it, which are returned rather than raised
+        so that they are raised each time the map is retrieved from memory.
+        """
         chrom = self.species.genome.get_chromosome(id)
+        # The maps are kept in memory, as they are often requested repeatedly.
+        key = ("rate_map", self.species.id, self.id, self.sha256, chrom.id)
+        return stdpopsim.get_memory_cache().get(
+            key,
+            lambda: self._build_chromosome_map(chrom),
+            lambda value: rate_map_nbytes(value[0]),
+        )
+
+    def _build_chromosome_map(self, chrom):
         if not self.is_cached():
             self.download()
         # We assume that if the map file does not exist this is a property of the
         # map itself and not a download error. If a failure occurs reading the map
         # this is propagated to the user, as this indicates a corrupted map which
         # needs to be redownloaded.
-        map_file = self.map_cache_dir / self.file_pattern.format(id=chrom.id)
-        if map_file.exists():
-            recomb_map = msprime.RateMap.read_hapmap(
-                map_file,
-                rate_col=2,
-                # TODO: set the sequence length. Unfortunately, some of our
-                # maps are shorter than our chromosomes, so this will fail.
-                # sequence_length=chrom.length
-            )
-        else:
-            warnings.warn(
-                "Recombination map not found for chromosome: '{}'"
-                " on map: '{}', substituting a flat map with chromosome "
-                "recombination rate {}".format(id, self.id, chrom.recombination_rate)
+        messages = []
+        recomb_map = self._read_chromosome_map(chrom.id)
+        if recomb_map is None:
+            messages.append(
+                UserWarning(
+                    "Recombination map not found for chromosome: '{}'"
+                    " on map: '{}', substituting a flat map with chromosome "
+                    "recombination rate {}".format(
+                        chrom.id, self.id, chrom.recombination_rate
+                    )
+                )
             )
             recomb_map = msprime.RateMap.uniform(chrom.length, chrom.recombination_rate)
         map_length = recomb_map.sequence_length
@@ -122,8 +252,10 @@ class GeneticMap:
             rates = np.append(recomb_map.rate, 0)
             recomb_map = msprime.RateMap(position=positions, rate=rates)
         elif map_length > chrom.length:
-            warnings.warn(
-                f"Recombination map has length {map_length}, which is longer than"
-                f" chromosome length {chrom.length}. The former will be used."
+            messages.append(
+                UserWarning(
+                    f"Recombination map has length {map_length}, which is longer "
+                    f"than chromosome length {chrom.length}. The former will be used."
+                )
             )
-        return recomb_map
+        return recomb_map, messages
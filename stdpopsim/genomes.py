@@ -2,6 +2,57 @@
 Infrastructure for defining information about species' genomes.
 """
 import attr
+import msprime
+import numpy as np
+
+import stdpopsim
+
+# TODO: add non-autosomal support. See
+# https://github.com/popsim-consortium/stdpopsim/issues/383 and
+# https://github.com/popsim-consortium/stdpopsim/issues/406
+# These are the lower case IDs of the non-autosomal chromosomes in the
+# catalog: sex chromosomes (X, Y, Z and W), mitochondrial genomes, and the
+# chloroplast genome (Pt).
+_non_autosomal_ids = {
+    "x",
+    "y",
+    "z",
+    "w",
+    "m",
+    "mt",
+    "mtdna",
+    "mitochondrion_genome",
+    "pt",
+    "chrx",
+    "chry",
+    "chrm",
+}
+
+
+def _overlap_length(intervals, left, right):
+    """
+    Returns the total length of the overlap between the specified
+    non-overlapping intervals and the disjoint intervals [left, right).
+    """
+    intervals = np.reshape(intervals, (-1, 2))
+    total = 0
+    for a, b in zip(left, right):
+        overlap = np.minimum(intervals[:, 1], b) - np.maximum(intervals[:, 0], a)
+        total += np.sum(np.maximum(overlap, 0))
+    return total
+
+
+def _contains(intervals, x):
+    """
+    Returns a boolean array indicating whether each of the positions x is
+    in the specified sorted, disjoint intervals.
+    """
+    j = np.searchsorted(intervals[:, 0], x, side="right") - 1
+    return (j >= 0) & (x < intervals[np.maximum(j, 0), 1])
+
+
+def _is_autosome(chrom_id):
+    return chrom_id.lower() not in _non_autosomal_ids
 
 
 @attr.s
@@ -60,6 +111,13 @@ class Genome:
     def length(self):
         return sum(chrom.length for chrom in self.chromosomes)
 
+    @property
+    def autosomes(self):
+        """
+        The list of :class:`.Chromosome` objects for the autosomes.
+        """
+        return [chrom for chrom in self.chromosomes if _is_autosome(chrom.id)]
+
     def __str__(self):
         s = "Chromosomes:\n"
         length_sorted = sorted(self.chromosomes, key=lambda x: -x.length)
@@ -153,6 +211,13 @@ class Contig:
     :ivar exclude: If True, ``mask_intervals`` specify regions to exclude. If False,
         ``mask_intervals`` specify regions in keep.
     :vartype exclude: bool
+    :ivar original_coordinates: The location of the contig on a named
+        chromosome, as a tuple of the form (chromosome ID, left, right).
+        If the contig is a subregion of the chromosome, the recombination
+        rate is missing outside of [left, right), unless the coordinates
+        were shifted, in which case position zero of the contig is
+        ``left`` on the chromosome. This is None for generic contigs.
+    :vartype original_coordinates: tuple
 
     .. note::
         To run stdpopsim simulations with alternative, user-specified mutation
@@ -174,6 +239,72 @@ class Contig:
     genetic_map = attr.ib(default=None, kw_only=True)
     inclusion_mask = attr.ib(default=None, kw_only=True)
     exclusion_mask = attr.ib(default=None, kw_only=True)
+    original_coordinates = attr.ib(default=None, kw_only=True)
+
+    @property
+    def covered_length(self):
+        """
+        The number of bases of the contig that are kept in simulated tree
+        sequences, which excludes those removed by the inclusion or exclusion
+        masks, and those at which the recombination rate is missing.
+
+        :type: float
+        """
+        rate_map = self.recombination_map
+        # The runs of adjacent intervals where the rate is not missing.
+        present = ~rate_map.missing
+        left = rate_map.left[present & ~np.append(False, present[:-1])]
+        right = rate_map.right[present & ~np.append(present[1:], False)]
+        total = np.sum(right - left)
+        if self.inclusion_mask is not None:
+            total = _overlap_length(self.inclusion_mask, left, right)
+        elif self.exclusion_mask is not None:
+            total -= _overlap_length(self.exclusion_mask, left, right)
+        return float(total)
+
+    def masked_rate_maps(self):
+        """
+        Returns the recombination map and mutation rate map with which the
+        contig can be simulated so that no work is done in the regions removed
+        by the inclusion or exclusion masks. The mutation rate is zero in the
+        masked regions, and the recombination rate is missing in the masked
+        flanks before the first and after the last kept region, which are
+        therefore not simulated. Ancestry and mutations in the kept regions
+        have the same distribution as in an unmasked simulation. Masked
+        regions between kept regions must still be simulated, as they affect
+        the linkage between the kept regions.
+
+        If there are no masks, the recombination map and mutation rate are
+        returned unchanged.
+
+        :return: The recombination map and mutation rate map.
+        :rtype: tuple(msprime.RateMap, msprime.RateMap)
+        """
+        recomb_map = self.recombination_map
+        if self.inclusion_mask is None and self.exclusion_mask is None:
+            return recomb_map, self.mutation_rate
+        L = recomb_map.sequence_length
+        masks = [
+            np.clip(stdpopsim.utils.merge_intervals(mask), 0, L)
+            for mask in (self.inclusion_mask, self.exclusion_mask)
+            if mask is not None
+        ]
+        position = np.unique(np.concatenate([[0, L]] + [m.ravel() for m in masks]))
+        midpoint = (position[:-1] + position[1:]) / 2
+        kept = np.ones(len(midpoint), dtype=bool)
+        if self.inclusion_mask is not None:
+            kept &= _contains(masks[0], midpoint)
+        if self.exclusion_mask is not None:
+            kept &= ~_contains(masks[-1], midpoint)
+        mutation_map = msprime.RateMap(
+            position=position, rate=np.where(kept, self.mutation_rate, 0)
+        )
+        if np.any(kept):
+            left = position[np.argmax(kept)]
+            right = position[len(kept) - np.argmax(kept[::-1])]
+            if left > 0 or right < L:
+                recomb_map = recomb_map.slice(left, right)
+        return recomb_map, mutation_map
 
     def __str__(self):
         gmap = "None" if self.genetic_map is None else self.genetic_map.id
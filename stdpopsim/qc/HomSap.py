@@ -86,7 +86,7 @@ def TennessenOnePopAfrica():
     )
 
 
-_species.get_demographic_model("Africa_1T12").register_qc(TennessenOnePopAfrica())
+_species.add_qc_model_factory("Africa_1T12", TennessenOnePopAfrica)
 
 
 def TennessenTwoPopOutOfAfrica():
@@ -202,9 +202,7 @@ def TennessenTwoPopOutOfAfrica():
     )
 
 
-_species.get_demographic_model("OutOfAfrica_2T12").register_qc(
-    TennessenTwoPopOutOfAfrica()
-)
+_species.add_qc_model_factory("OutOfAfrica_2T12", TennessenTwoPopOutOfAfrica)
 
 
 def BrowningAmerica():
@@ -328,7 +326,7 @@ def BrowningAmerica():
     )
 
 
-_species.get_demographic_model("AmericanAdmixture_4B11").register_qc(BrowningAmerica())
+_species.add_qc_model_factory("AmericanAdmixture_4B11", BrowningAmerica)
 
 
 def RagsdaleArchaic():
@@ -490,9 +488,7 @@ def RagsdaleArchaic():
     )
 
 
-_species.get_demographic_model("OutOfAfricaArchaicAdmixture_5R19").register_qc(
-    RagsdaleArchaic()
-)
+_species.add_qc_model_factory("OutOfAfricaArchaicAdmixture_5R19", RagsdaleArchaic)
 
 
 def KammAncientSamples():
@@ -703,7 +699,7 @@ def KammAncientSamples():
     )
 
 
-_species.get_demographic_model("AncientEurasia_9K19").register_qc(KammAncientSamples())
+_species.add_qc_model_factory("AncientEurasia_9K19", KammAncientSamples)
 
 
 def DenisovanAncestryInPapuans():
@@ -1010,9 +1006,7 @@ def DenisovanAncestryInPapuans():
     )
 
 
-_species.get_demographic_model("PapuansOutOfAfrica_10J19").register_qc(
-    DenisovanAncestryInPapuans()
-)
+_species.add_qc_model_factory("PapuansOutOfAfrica_10J19", DenisovanAncestryInPapuans)
 
 
 def GutenkunstOOA():
@@ -1097,7 +1091,7 @@ def GutenkunstOOA():
     )
 
 
-_species.get_demographic_model("OutOfAfrica_3G09").register_qc(GutenkunstOOA())
+_species.add_qc_model_factory("OutOfAfrica_3G09", GutenkunstOOA)
 
 
 def GladsteinAshkSubstructure():
@@ -1190,7 +1184,7 @@ def GladsteinAshkSubstructure():
     )
 
 
-_species.get_demographic_model("AshkSub_7G19").register_qc(GladsteinAshkSubstructure())
+_species.add_qc_model_factory("AshkSub_7G19", GladsteinAshkSubstructure)
 
 
 def ZigZag():
@@ -1255,4 +1249,4 @@ def ZigZag():
     )
 
 
-_species.get_demographic_model("Zigzag_1S14").register_qc(ZigZag())
+_species.add_qc_model_factory("Zigzag_1S14", ZigZag)
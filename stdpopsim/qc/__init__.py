@@ -1,4 +1,16 @@
-from . import AraTha  # NOQA
-from . import DroMel  # NOQA
-from . import HomSap  # NOQA
-from . import PonAbe  # NOQA
+import importlib
+import pathlib
+
+# QC models are registered by species ID, and the corresponding module is
+# imported when the species is loaded from the catalog.
+__all__ = []
+for path in sorted(pathlib.Path(__path__[0]).glob("*.py")):
+    module_name = path.stem
+    if module_name[0].isupper():
+        __all__.append(module_name)
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -38,17 +38,20 @@ How backwards-time demographic events are mapped to forwards-time SLiM code:
    occur over long time periods. In SLiM, we call `pop.setMigrationRates()`.
 """
 
+import io
 import os
 import sys
 import copy
+import pickle
+import shutil
+import hashlib
 import string
+import threading
+import concurrent.futures
 import tempfile
 import subprocess
 import functools
-import itertools
-import contextlib
 import random
-import textwrap
 import logging
 import warnings
 
@@ -75,11 +78,11 @@ initialize() {
     defineConstant("generation_time", $generation_time);
     defineConstant("mutation_rate", Q * $mutation_rate);
     defineConstant("chromosome_length", $chromosome_length);
-    defineConstant("trees_file", "$trees_file");
+    if (!exists("trees_file"))
+        $define_trees_file
     defineConstant("pop_names", $pop_names);
 
-    _recombination_rates = $recombination_rates;
-    _recombination_ends = $recombination_ends;
+$recombination_map
     defineConstant("recombination_rates", (1-(1-2*_recombination_rates)^Q)/2);
     defineConstant("recombination_ends", _recombination_ends);
 """
@@ -517,8 +520,210 @@ def msprime_rm_to_slim_rm(recombination_map):
     rates = recombination_map.rate.copy()
     # replace missing values with 0 recombination rate
     rates[recombination_map.missing] = 0
-    ends = [int(pos) - 1 for pos in recombination_map.position]
-    return rates, ends[1:]
+    ends = recombination_map.position[1:].astype(np.int64) - 1
+    return rates, ends
+
+
+def _format_vector(values, indent, width=80):
+    """
+    Returns the Eidos vector literal for the specified values, wrapped to
+    the specified width.
+    """
+    lines = []
+    line = []
+    line_width = len(indent)
+    for token in map(str, values.tolist()):
+        if line and line_width + len(token) + 1 > width:
+            lines.append(indent + " ".join(line))
+            line = []
+            line_width = len(indent)
+        line.append(token + ",")
+        line_width += len(token) + 2
+    if line:
+        line[-1] = line[-1][:-1]
+        lines.append(indent + " ".join(line))
+    return "c(\n" + "\n".join(lines) + ")"
+
+
+def recombination_map_text(recombination_map):
+    """
+    Returns the contents of the file from which the SLiM script reads the
+    recombination map, when it is not included in the script. The file has
+    two lines, which give the rates and the end positions of the intervals,
+    separated by spaces.
+    """
+    rates, ends = msprime_rm_to_slim_rm(recombination_map)
+    return (
+        " ".join(map(str, rates.tolist()))
+        + "\n"
+        + " ".join(map(str, ends.tolist()))
+        + "\n"
+    )
+
+
+# Reads the recombination map, from the file with the contents given by
+# recombination_map_text().
+_read_recombination_map = """\
+    // The recombination map is read from a file, so that the script does not
+    // grow with the number of intervals in the map.
+    if (!exists("recombination_map_file"))
+        stop("ERROR: recombination_map_file must be defined with -d");
+    _recombination_map = readFile(recombination_map_file);
+    if (size(_recombination_map) != 2)
+        stop("ERROR: Could not read the recombination map from " +
+             recombination_map_file);
+    _recombination_rates = asFloat(strsplit(_recombination_map[0]));
+    _recombination_ends = asInteger(strsplit(_recombination_map[1]));"""
+
+
+# The minimum free space in a memory-backed filesystem for it to be used
+# for the trees files written by SLiM.
+_MIN_SCRATCH_SPACE = 1 << 30
+
+
+def _default_scratch_dir():
+    """
+    Returns the directory in which the trees files written by SLiM are
+    stored, unless otherwise specified. This is the memory-backed ``/dev/shm``
+    if it is available and has at least 1 GiB of free space, so that the
+    trees files (which may be written and read repeatedly when conditioning
+    on allele frequencies) do not touch persistent storage. Otherwise, this is
+    the default directory for temporary files.
+    """
+    shm = "/dev/shm"
+    try:
+        if os.path.isdir(shm) and os.access(shm, os.W_OK | os.X_OK):
+            stat = os.statvfs(shm)
+            if stat.f_bavail * stat.f_frsize >= _MIN_SCRATCH_SPACE:
+                return shm
+    except (AttributeError, OSError):
+        pass
+    return tempfile.gettempdir()
+
+
+def contig_flanks(contig):
+    """
+    Returns the intervals of the contig that are outside of the region of the
+    chromosome that the contig is restricted to, as an array of shape (N, 2).
+    """
+    recombination_map = contig.recombination_map
+    flanks = []
+    if contig.original_coordinates is not None:
+        _, left, right = contig.original_coordinates
+        # If the coordinates were shifted there are no flanks. Otherwise,
+        # the recombination rate is missing in the flanks.
+        if recombination_map.sequence_length >= right:
+            for flank_left, flank_right in [
+                (0, left),
+                (right, recombination_map.sequence_length),
+            ]:
+                if flank_left < flank_right and np.isnan(
+                    recombination_map.get_rate(flank_left)
+                ):
+                    flanks.append((flank_left, flank_right))
+    return np.array(flanks).reshape((-1, 2))
+
+
+def slim_region(contig):
+    """
+    Returns the ``(left, right)`` interval of the contig that is simulated
+    by SLiM. This is the whole contig, unless the contig is restricted to a
+    region of a chromosome without shifting the coordinates, in which case
+    the flanks outside the region are not simulated.
+    """
+    left, right = 0, int(contig.recombination_map.sequence_length)
+    for flank_left, flank_right in contig_flanks(contig):
+        if flank_left == 0:
+            left = int(flank_right)
+        else:
+            right = int(flank_left)
+    return left, right
+
+
+def _slim_contig(contig):
+    """
+    Returns the contig for which the SLiM script is generated, which is
+    restricted to the :func:`slim_region` of the contig, with coordinates
+    shifted to start at zero. The tree sequence output by SLiM is shifted
+    back by :meth:`_SLiMEngine.recap_and_rescale`.
+    """
+    left, right = slim_region(contig)
+    if left == 0 and right == contig.recombination_map.sequence_length:
+        return contig
+    contig = copy.copy(contig)
+    contig.recombination_map = contig.recombination_map.slice(left, right, trim=True)
+    return contig
+
+
+def _odd_sample_warnings(demographic_model, samples):
+    """
+    Returns the warnings for the sample sets with an odd number of haploid
+    samples, for which an extra haploid is sampled.
+    """
+    ret = []
+    for sample_set in samples:
+        count = sample_set.num_samples
+        if count % 2 != 0:
+            pop = demographic_model.model[sample_set.population]
+            time = 0 if sample_set.time is None else sample_set.time
+            time = round(time * demographic_model.generation_time)
+            gen = time / demographic_model.generation_time
+            ret.append(
+                stdpopsim.SLiMOddSampleWarning(
+                    f"SLiM simulates diploid individuals, so {(count + 1) // 2} "
+                    f"individuals will be sampled for the {count} haploids "
+                    f"requested from population {pop.name} at time {gen}. "
+                    "See #464."
+                )
+            )
+    return ret
+
+
+def _eidos_string(s):
+    """
+    Returns the Eidos string literal for the specified string.
+    """
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _script_key(
+    demographic_model,
+    contig,
+    samples,
+    mutation_types,
+    extended_events,
+    scaling_factor,
+    burn_in,
+):
+    """
+    Returns a key identifying the SLiM script generated for the specified
+    parameters, which is a hash of their contents, or None if the parameters
+    cannot be hashed. This includes the model's id, description and
+    citations, which are written to the header of the script.
+    """
+    recombination_map = contig.recombination_map
+    try:
+        data = pickle.dumps(
+            (
+                demographic_model.id,
+                demographic_model.description,
+                demographic_model.citations,
+                demographic_model.model,
+                demographic_model.generation_time,
+                recombination_map.position,
+                recombination_map.rate,
+                contig.mutation_rate,
+                samples,
+                mutation_types,
+                extended_events,
+                scaling_factor,
+                burn_in,
+            ),
+            protocol=4,
+        )
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return ("slim_script", hashlib.sha256(data).hexdigest())
 
 
 def slim_makescript(
@@ -531,7 +736,17 @@ def slim_makescript(
     extended_events,
     scaling_factor,
     burn_in,
+    inline_recombination_map=True,
 ):
+    """
+    Writes the SLiM script for the specified parameters to ``script_file``,
+    and returns the epoch used for recapitation. If ``trees_file`` is None,
+    it must be defined with ``-d`` when running SLiM. If
+    ``inline_recombination_map`` is False, the recombination map is not
+    included in the script, but is read from the file given by the
+    ``recombination_map_file`` constant, which must be defined with ``-d``
+    (see :func:`recombination_map_text`).
+    """
 
     pop_names = [pop.name for pop in demographic_model.model.populations]
     # Use copies of these so that the time frobbing below doesn't have
@@ -728,28 +943,15 @@ def slim_makescript(
         printsc(" * " + str(citation))
     printsc(" */")
 
-    recomb_rates, recomb_ends = msprime_rm_to_slim_rm(contig.recombination_map)
-    indent = 8 * " "
-    recomb_rates_str = (
-        "c(\n"
-        + textwrap.fill(
-            ", ".join(map(str, recomb_rates)),
-            width=80,
-            initial_indent=indent,
-            subsequent_indent=indent,
-        )
-        + ")"
-    )
-    recomb_ends_str = (
-        "c(\n"
-        + textwrap.fill(
-            ", ".join(map(str, recomb_ends)),
-            width=80,
-            initial_indent=indent,
-            subsequent_indent=indent,
+    if inline_recombination_map:
+        recomb_rates, recomb_ends = msprime_rm_to_slim_rm(contig.recombination_map)
+        indent = 8 * " "
+        recombination_map = (
+            f"    _recombination_rates = {_format_vector(recomb_rates, indent)};\n"
+            f"    _recombination_ends = {_format_vector(recomb_ends, indent)};"
         )
-        + ")"
-    )
+    else:
+        recombination_map = _read_recombination_map
 
     pop_names_str = ", ".join(map(lambda x: f'"{x}"', pop_names))
 
@@ -758,11 +960,14 @@ def slim_makescript(
             scaling_factor=scaling_factor,
             burn_in=float(burn_in),
             chromosome_length=int(contig.recombination_map.sequence_length),
-            recombination_rates=recomb_rates_str,
-            recombination_ends=recomb_ends_str,
+            recombination_map=recombination_map,
             mutation_rate=contig.mutation_rate,
             generation_time=demographic_model.generation_time,
-            trees_file=trees_file,
+            define_trees_file=(
+                f'defineConstant("trees_file", {_eidos_string(trees_file)});'
+                if trees_file is not None
+                else 'stop("ERROR: trees_file must be defined with -d");'
+            ),
             pop_names=f"c({pop_names_str})",
         )
     )
@@ -967,17 +1172,9 @@ def slim_makescript(
         time = 0 if sample_set.time is None else sample_set.time
         time = round(time * demographic_model.generation_time)
         n_inds = (count + 1) // 2
-        if count % 2 != 0:
-            gen = time / demographic_model.generation_time
-            warnings.warn(
-                stdpopsim.SLiMOddSampleWarning(
-                    f"SLiM simulates diploid individuals, so {n_inds} "
-                    f"individuals will be sampled for the {count} haploids "
-                    f"requested from population {pop.name} at time {gen}. "
-                    "See #464."
-                )
-            )
         sampling_episodes.append((pop.id, n_inds, time))
+    for warning in _odd_sample_warnings(demographic_model, samples):
+        warnings.warn(warning)
 
     printsc("    // One row for each sampling episode.")
     printsc(
@@ -1007,14 +1204,37 @@ class _SLiMEngine(stdpopsim.Engine):
         ),
     ]
 
+    # The versions of the slim executables that have been run, keyed on the
+    # path, modification time and size of the executable, so that each
+    # executable is only run once to get its version.
+    _versions = {}
+    _versions_lock = threading.Lock()
+
     def slim_path(self):
         return os.environ.get("SLIM", "slim")
 
+    def records_provenance(self, contig):
+        # The tables are always copied by recap_and_rescale().
+        return True
+
     def get_version(self, slim_path=None):
         if slim_path is None:
             slim_path = self.slim_path()
+        executable = shutil.which(slim_path)
+        key = None
+        if executable is not None:
+            executable = os.path.realpath(executable)
+            stat = os.stat(executable)
+            key = (executable, stat.st_mtime_ns, stat.st_size)
+            with self._versions_lock:
+                if key in self._versions:
+                    return self._versions[key]
         s = subprocess.check_output([slim_path, "-v"])
-        return s.split()[2].decode("ascii").rstrip(",")
+        version = s.split()[2].decode("ascii").rstrip(",")
+        if key is not None:
+            with self._versions_lock:
+                self._versions[key] = version
+        return version
 
     def _assert_min_version(self, min_required_version, slim_path):
         def version_split(version):
@@ -1040,7 +1260,9 @@ class _SLiMEngine(stdpopsim.Engine):
         slim_script=False,
         slim_scaling_factor=1.0,
         slim_burn_in=10.0,
+        slim_scratch_dir=None,
         dry_run=False,
+        provenance=None,
     ):
         """
         Simulate the demographic model using SLiM.
@@ -1054,6 +1276,9 @@ class _SLiMEngine(stdpopsim.Engine):
         :type slim_path: str
         :param slim_script: If true, the simulation will not be executed.
             Instead the generated SLiM script will be printed to stdout.
+            The file that the tree sequence is written to is not defined in
+            the script, and must be given when running SLiM, e.g.
+            ``slim -d 'trees_file="out.trees"' script.slim``.
         :type slim_script: bool
         :param slim_scaling_factor: Rescale model parameters by the given value,
             to speed up simulation. Population sizes and generation times are
@@ -1065,9 +1290,17 @@ class _SLiMEngine(stdpopsim.Engine):
         :param slim_burn_in: Length of the burn-in phase, in units of N
             generations.
         :type slim_burn_in: float
+        :param slim_scratch_dir: The directory in which the tree sequence
+            written by SLiM is stored, until it is loaded. If None, the
+            memory-backed ``/dev/shm`` is used if it has at least 1 GiB of
+            free space, and otherwise the default directory for temporary
+            files.
+        :type slim_scratch_dir: str
         :param dry_run: If True, run the first generation setup and then end the
             simulation.
         :type dry_run: bool
+        :param dict provenance: If specified, a provenance record which is
+            added to the tree sequence. See :meth:`.Engine.simulate()`.
         """
 
         if slim_scaling_factor <= 0:
@@ -1095,29 +1328,107 @@ class _SLiMEngine(stdpopsim.Engine):
         # Ensure only "weighted" mutations are introduced by SLiM.
         mutation_rate = contig.mutation_rate
         slim_frac = stdpopsim.ext.slim_mutation_frac(mutation_types)
-        contig = stdpopsim.Contig(
-            recombination_map=contig.recombination_map,
-            mutation_rate=slim_frac * mutation_rate,
-            genetic_map=contig.genetic_map,
+        contig = copy.copy(contig)
+        contig.mutation_rate = slim_frac * mutation_rate
+        slim_contig = _slim_contig(contig)
+
+        if not run_slim:
+            # The script is run after we return, so the trees file isn't
+            # defined and must be given with -d when running SLiM.
+            slim_makescript(
+                sys.stdout,
+                None,
+                demographic_model,
+                slim_contig,
+                samples,
+                mutation_types,
+                extended_events,
+                slim_scaling_factor,
+                slim_burn_in,
+            )
+            sys.stdout.flush()
+            return None
+
+        if slim_scratch_dir is None:
+            slim_scratch_dir = _default_scratch_dir()
+        # The script is passed to SLiM on stdin, so only the trees file is
+        # written to the scratch directory.
+        with tempfile.TemporaryDirectory(
+            prefix="stdpopsim_slim_", dir=slim_scratch_dir
+        ) as tmpdir:
+            trees_file = os.path.join(tmpdir, "output.trees")
+
+            script, recombination_map, recap_epoch = self._get_script(
+                demographic_model,
+                slim_contig,
+                samples,
+                mutation_types,
+                extended_events,
+                slim_scaling_factor,
+                slim_burn_in,
+            )
+            recombination_map_file = os.path.join(tmpdir, "recombination_map.txt")
+            with open(recombination_map_file, "w") as f:
+                f.write(recombination_map)
+            with stdpopsim.utils.log_stage(logger, "Run SLiM"):
+                self._run_slim(
+                    script=script,
+                    slim_path=slim_path,
+                    seed=seed,
+                    dry_run=dry_run,
+                    constants={
+                        "trees_file": trees_file,
+                        "recombination_map_file": recombination_map_file,
+                    },
+                )
+
+            if dry_run:
+                return None
+
+            with stdpopsim.utils.log_stage(logger, "Load trees"):
+                ts = pyslim.load(trees_file)
+
+        ts = self._recap_and_rescale(
+            ts,
+            seed,
+            recap_epoch,
+            contig,
+            mutation_rate,
+            slim_frac,
+            slim_scaling_factor,
             inclusion_mask=contig.inclusion_mask,
             exclusion_mask=contig.exclusion_mask,
+            provenance=provenance,
         )
+        return ts
 
-        mktemp = functools.partial(tempfile.NamedTemporaryFile, mode="w")
-
-        @contextlib.contextmanager
-        def script_file_f():
-            f = mktemp(suffix=".slim") if not slim_script else sys.stdout
-            yield f
-            # Don't close sys.stdout.
-            if not slim_script:
-                f.close()
-
-        with script_file_f() as script_file, mktemp(suffix=".ts") as ts_file:
+    def _get_script(
+        self,
+        demographic_model,
+        contig,
+        samples,
+        mutation_types,
+        extended_events,
+        slim_scaling_factor,
+        slim_burn_in,
+    ):
+        """
+        Returns the SLiM script, the contents of the recombination map file
+        and the recapitation epoch for the specified parameters. The trees
+        file and recombination map file are not defined in the script, and
+        must be passed to SLiM with ``-d``, so that replicate simulations with
+        different seeds can share the script, and the size of the script does
+        not depend on the recombination map. Scripts are kept in memory, keyed
+        on a hash of the parameters. The warnings raised by
+        :func:`slim_makescript` are raised again if the script is retrieved
+        from memory.
+        """
 
+        def build():
+            script_file = io.StringIO()
             recap_epoch = slim_makescript(
                 script_file,
-                ts_file.name,
+                None,
                 demographic_model,
                 contig,
                 samples,
@@ -1125,36 +1436,130 @@ class _SLiMEngine(stdpopsim.Engine):
                 extended_events,
                 slim_scaling_factor,
                 slim_burn_in,
+                inline_recombination_map=False,
             )
-
-            script_file.flush()
-
-            if not run_slim:
-                return None
-
-            self._run_slim(
-                script_file.name, slim_path=slim_path, seed=seed, dry_run=dry_run
-            )
-
-            if dry_run:
-                return None
-
-            ts = pyslim.load(ts_file.name)
-
-        ts = self._recap_and_rescale(
-            ts, seed, recap_epoch, contig, mutation_rate, slim_frac, slim_scaling_factor
+            recombination_map = recombination_map_text(contig.recombination_map)
+            built[0] = True
+            return script_file.getvalue(), recombination_map, recap_epoch
+
+        built = [False]
+        key = _script_key(
+            demographic_model,
+            contig,
+            samples,
+            mutation_types,
+            extended_events,
+            slim_scaling_factor,
+            slim_burn_in,
         )
+        if key is None:
+            return build()
+        ret = stdpopsim.get_memory_cache().get(
+            key, build, lambda x: len(x[0]) + len(x[1])
+        )
+        if not built[0]:
+            # The warnings were issued when the script was generated.
+            for warning in _odd_sample_warnings(demographic_model, samples):
+                warnings.warn(warning)
+        return ret
 
-        if contig.inclusion_mask is not None:
-            ts = stdpopsim.utils.mask_tree_sequence(ts, contig.inclusion_mask, False)
-        if contig.exclusion_mask is not None:
-            ts = stdpopsim.utils.mask_tree_sequence(ts, contig.exclusion_mask, True)
+    def simulate_jobs(self, jobs, *, num_workers=1, slim_path=None, **kwargs):
+        """
+        Simulates each of the specified jobs, running up to ``num_workers``
+        SLiM processes at once. This is intended for many short simulations,
+        such as scans over many small contigs. The SLiM version is checked
+        once for all of the jobs.
+
+        Each job is a tuple of the form ``(demographic_model, contig, samples,
+        seed, mutation_types, extended_events)``, where the last two items may
+        be omitted. These are the arguments of :meth:`.simulate`.
+
+        Results are returned as they finish, which is not necessarily in the
+        order of the jobs. At most a few results per worker are held in
+        memory at any time. If a job fails, the exception is raised when its
+        result is reached and the remaining jobs are cancelled.
+
+        :param jobs: The jobs to simulate.
+        :type jobs: iterable of tuples
+        :param int num_workers: The number of SLiM processes to run at once.
+        :param str slim_path: The full path to the slim executable, or the name
+            of a command in the current PATH.
+        :param \\**kwargs: Further arguments passed to :meth:`.simulate` for
+            every job, such as ``slim_scaling_factor``.
+        :return: An iterator over ``(index, ts)`` pairs, where ``index`` is the
+            position of the job in ``jobs`` and ``ts`` is the simulated tree
+            sequence.
+        :rtype: iterator of (int, :class:`tskit.trees.TreeSequence`)
+        """
+        if num_workers < 1:
+            raise ValueError("Must have at least one worker")
+        for arg in ["slim_script", "dry_run"]:
+            if kwargs.get(arg, False):
+                raise ValueError(f"Cannot use {arg} with simulate_jobs")
+        if slim_path is None:
+            slim_path = self.slim_path()
+        self._assert_min_version("3.6", slim_path)
 
-        return ts
+        def run(job):
+            if not 4 <= len(job) <= 6:
+                raise ValueError(
+                    "Each job must be a tuple of (demographic_model, contig, "
+                    "samples, seed, mutation_types, extended_events)"
+                )
+            demographic_model, contig, samples, seed = job[:4]
+            mutation_types, extended_events = (tuple(job[4:]) + (None, None))[:2]
+            return self.simulate(
+                demographic_model,
+                contig,
+                samples,
+                seed=seed,
+                mutation_types=mutation_types,
+                extended_events=extended_events,
+                slim_path=slim_path,
+                **kwargs,
+            )
 
-    def _run_slim(self, script_file, slim_path=None, seed=None, dry_run=False):
+        # Each worker thread spends most of its time waiting for its SLiM
+        # process, so threads are used rather than processes, and the jobs
+        # do not need to be pickled.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # We only submit jobs a little ahead of the results that have been
+            # consumed, so that the number of results held in memory is bounded.
+            pending = {}
+            jobs = enumerate(jobs)
+            try:
+                while True:
+                    for index, job in jobs:
+                        pending[executor.submit(run, job)] = index
+                        if len(pending) >= 2 * num_workers:
+                            break
+                    if len(pending) == 0:
+                        break
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        index = pending.pop(future)
+                        yield index, future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _run_slim(
+        self,
+        script_file=None,
+        *,
+        script=None,
+        slim_path=None,
+        seed=None,
+        dry_run=False,
+        constants=None,
+    ):
         """
-        Run SLiM.
+        Run SLiM on the specified script file, or on the ``script`` string,
+        which is passed to SLiM on stdin. If specified, ``constants`` is a
+        dict of string constants to define on the command line, such as
+        ``trees_file``.
 
         We capture the output using Popen's line-oriented text buffering
         (bufsize=1, universal_newlines=True) and redirect all messages to
@@ -1177,15 +1582,29 @@ class _SLiMEngine(stdpopsim.Engine):
             slim_cmd.extend(["-s", f"{seed}"])
         if dry_run:
             slim_cmd.extend(["-d", "dry_run=T"])
-        slim_cmd.append(script_file)
+        if constants is not None:
+            for name, value in constants.items():
+                slim_cmd.extend(["-d", f"{name}={_eidos_string(value)}"])
+        if script_file is not None:
+            slim_cmd.append(script_file)
 
         with subprocess.Popen(
             slim_cmd,
             bufsize=1,
             universal_newlines=True,
+            stdin=None if script is None else subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         ) as proc:
+            if script is not None:
+                # SLiM reads the whole script before running it, so it can't
+                # be blocked on writing its output while we write the script.
+                try:
+                    proc.stdin.write(script)
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    # SLiM exited early, which is reported below.
+                    pass
             for line in proc.stdout:
                 line = line.rstrip()
                 if line.startswith("WARNING: "):
@@ -1207,15 +1626,16 @@ class _SLiMEngine(stdpopsim.Engine):
                 f"{slim_path} exited with code {proc.returncode}.\n{stderr}"
             )
 
-    def _simplify_remembered(self, ts):
+    def _remembered_nodes(self, tables):
         """
-        Remove all samples except those individuals that were explicity
-        sampled in SLiM with sim.treeSeqRememberIndividuals().
+        Returns the nodes of the individuals that were explicity sampled in
+        SLiM with sim.treeSeqRememberIndividuals(), ordered by individual.
         """
-        nodes = itertools.chain.from_iterable(
-            i.nodes for i in ts.individuals() if i.flags & pyslim.INDIVIDUAL_REMEMBERED
-        )
-        return ts.simplify(samples=list(nodes), filter_populations=False)
+        remembered = (tables.individuals.flags & pyslim.INDIVIDUAL_REMEMBERED) > 0
+        individual = tables.nodes.individual
+        nodes = np.flatnonzero(individual >= 0)
+        nodes = nodes[remembered[individual[nodes]]]
+        return nodes[np.argsort(individual[nodes], kind="stable")]
 
     def _recap_and_rescale(
         self,
@@ -1226,64 +1646,111 @@ class _SLiMEngine(stdpopsim.Engine):
         mutation_rate,
         slim_frac,
         slim_scaling_factor,
+        inclusion_mask=None,
+        exclusion_mask=None,
+        provenance=None,
     ):
         """
         Apply post-SLiM transformations to ``ts``. This rescales node times,
-        does recapitation, simplification, and adds neutral mutations.
+        does simplification, recapitation, and adds neutral mutations.
+        Finally, the unary nodes left by recapitation are simplified away,
+        the coordinates are shifted to the contig's region, the masks are
+        applied and the provenance is recorded, in a single pass over the
+        tables. The intermediate tree sequences are plain tskit
+        tree sequences, and only the result is a
+        :class:`pyslim.SlimTreeSequence`. The time taken by each stage is
+        logged at the INFO level.
         """
-        # Node times come from SLiM generation numbers, which may have been
-        # divided by a scaling factor for computational tractability.
-        tables = ts.dump_tables()
-        for table in (tables.nodes, tables.migrations, tables.mutations):
-            table.time *= slim_scaling_factor
-        ts_metadata = tables.metadata
-        ts_metadata["SLiM"]["generation"] *= slim_scaling_factor
-        tables.metadata = ts_metadata
-        ts = pyslim.SlimTreeSequence.load_tables(tables)
+        with stdpopsim.utils.log_stage(logger, "Rescale and simplify"):
+            tables = ts.dump_tables()
+            # Node times come from SLiM generation numbers, which may have been
+            # divided by a scaling factor for computational tractability.
+            for table in (tables.nodes, tables.migrations, tables.mutations):
+                table.time *= slim_scaling_factor
+            ts_metadata = tables.metadata
+            ts_metadata["SLiM"]["generation"] *= slim_scaling_factor
+            tables.metadata = ts_metadata
+            slim_generation = ts_metadata["SLiM"]["generation"]
+            # Simplifying first leaves less to recapitate. The roots of the
+            # trees, from which recapitation starts, must be kept.
+            tables.simplify(
+                samples=self._remembered_nodes(tables),
+                filter_populations=False,
+                keep_input_roots=True,
+            )
+            ts = tables.tree_sequence()
 
         rng = random.Random(seed)
         s1, s2 = rng.randrange(1, 2 ** 32), rng.randrange(1, 2 ** 32)
 
-        population_configurations = [
-            msprime.PopulationConfiguration(
-                initial_size=pop.start_size, growth_rate=pop.growth_rate
+        with stdpopsim.utils.log_stage(logger, "Recapitate"):
+            population_configurations = [
+                msprime.PopulationConfiguration(
+                    initial_size=pop.start_size, growth_rate=pop.growth_rate
+                )
+                for pop in recap_epoch.populations
+            ]
+            # As in pyslim's recapitate(), recombination is between the
+            # integer positions that SLiM uses.
+            recombination_map = msprime.RecombinationMap(
+                positions=[0, ts.sequence_length],
+                rates=[contig.recombination_map.mean_rate, 0],
+                num_loci=int(ts.sequence_length),
+            )
+            ts = msprime.simulate(
+                from_ts=ts,
+                start_time=slim_generation,
+                population_configurations=population_configurations,
+                migration_matrix=recap_epoch.migration_matrix,
+                recombination_map=recombination_map,
+                random_seed=s1,
             )
-            for pop in recap_epoch.populations
-        ]
-        ts = ts.recapitate(
-            recombination_rate=contig.recombination_map.mean_rate,
-            population_configurations=population_configurations,
-            migration_matrix=recap_epoch.migration_matrix,
-            random_seed=s1,
-        )
-
-        ts = self._simplify_remembered(ts)
 
-        if slim_frac < 1:
-            # Add mutations to SLiM part of trees.
-            rate = (1 - slim_frac) * mutation_rate
-            ts = pyslim.SlimTreeSequence(
-                msprime.mutate(
+        with stdpopsim.utils.log_stage(logger, "Add mutations"):
+            if slim_frac < 1:
+                # Add mutations to SLiM part of trees.
+                rate = (1 - slim_frac) * mutation_rate
+                ts = msprime.mutate(
                     ts,
                     rate=rate,
                     keep=True,
                     random_seed=s2,
-                    end_time=ts.slim_generation,
+                    end_time=slim_generation,
                 )
-            )
 
-        # Add mutations to recapitated part of trees.
-        s3 = rng.randrange(1, 2 ** 32)
-        ts = pyslim.SlimTreeSequence(
-            msprime.mutate(
+            # Add mutations to recapitated part of trees.
+            s3 = rng.randrange(1, 2 ** 32)
+            ts = msprime.mutate(
                 ts,
                 rate=mutation_rate,
                 keep=True,
                 random_seed=s3,
-                start_time=ts.slim_generation,
+                start_time=slim_generation,
             )
-        )
 
+        with stdpopsim.utils.log_stage(logger, "Finalise"):
+            tables = ts.dump_tables()
+            # The roots of the SLiM trees that were kept for recapitation
+            # are now unary nodes, which are removed.
+            tables.simplify(
+                samples=ts.samples(),
+                filter_populations=False,
+            )
+            left, right = slim_region(contig)
+            sequence_length = contig.recombination_map.sequence_length
+            if left != 0 or right != sequence_length:
+                # SLiM only simulates the region of the chromosome that the
+                # contig is restricted to, so the coordinates are shifted
+                # back. There are no edges in the flanks, as is the case for
+                # msprime where the recombination rate is missing.
+                stdpopsim.utils.shift_tables(tables, left, sequence_length)
+            stdpopsim.utils.finalise_tables(
+                tables,
+                inclusion_mask=inclusion_mask,
+                exclusion_mask=exclusion_mask,
+                provenance=provenance,
+            )
+            ts = pyslim.SlimTreeSequence(tables.tree_sequence())
         return ts
 
     def recap_and_rescale(
@@ -1300,7 +1767,7 @@ class _SLiMEngine(stdpopsim.Engine):
     ):
         """
         Apply post-SLiM transformations to ``ts``. This rescales node times,
-        does recapitation, simplification, and adds neutral mutations.
+        does simplification, recapitation, and adds neutral mutations.
 
         If the SLiM engine was used to output a SLiM script, and the script was
         run outside of stdpopsim, this function can be used to transform the
@@ -1324,18 +1791,15 @@ class _SLiMEngine(stdpopsim.Engine):
         # Only "weighted" mutations are introduced by SLiM.
         mutation_rate = contig.mutation_rate
         slim_frac = stdpopsim.ext.slim_mutation_frac(mutation_types)
-        contig = stdpopsim.Contig(
-            recombination_map=contig.recombination_map,
-            mutation_rate=slim_frac * mutation_rate,
-            genetic_map=contig.genetic_map,
-        )
+        contig = copy.copy(contig)
+        contig.mutation_rate = slim_frac * mutation_rate
 
         with open(os.devnull, "w") as script_file:
             recap_epoch = slim_makescript(
                 script_file,
                 "unused.trees",
                 demographic_model,
-                contig,
+                _slim_contig(contig),
                 samples,
                 mutation_types,
                 extended_events,
@@ -2,11 +2,15 @@
 Infrastructure for defining basic information about species and
 organising the species catalog.
 """
+import hashlib
+import importlib
 import logging
+import os
 import warnings
 
 import attr
 import msprime
+import numpy as np
 
 import stdpopsim
 import stdpopsim.utils
@@ -29,6 +33,18 @@ def register_species(species):
     registered_species[species.id] = species
 
 
+def _load_catalog_species(id):
+    """
+    Imports the catalog definitions for the species with the specified ``id``
+    (and the QC models for this species, if any), which registers the species.
+    Does nothing if there is no such species in the catalog.
+    """
+    if id in stdpopsim.catalog.__all__:
+        importlib.import_module(f"stdpopsim.catalog.{id}")
+        if id in stdpopsim.qc.__all__:
+            importlib.import_module(f"stdpopsim.qc.{id}")
+
+
 def get_species(id):
     """
     Returns a :class:`Species` object for the specified ``id``.
@@ -39,6 +55,8 @@ def get_species(id):
     :return: An object containing the species definition.
     :rtype: :class:`Species`
     """
+    if id not in registered_species:
+        _load_catalog_species(id)
     if id not in registered_species:
         # TODO we should probably have a custom exception here and standardise
         # on using these for all the catalog search functions.
@@ -54,6 +72,9 @@ def all_species():
     """
     Returns an iterator over all species in the catalog.
     """
+    for id in stdpopsim.catalog.__all__:
+        if id not in registered_species:
+            _load_catalog_species(id)
     for species in registered_species.values():
         yield species
 
@@ -76,6 +97,90 @@ def all_annotations():
             yield an
 
 
+def _mask_key(mask):
+    """
+    Returns a hashable key identifying the specified mask, which is either the
+    path to a bed file or a list of intervals.
+    """
+    if mask is None:
+        return None
+    if isinstance(mask, str):
+        stat = os.stat(mask)
+        return (os.path.abspath(mask), stat.st_mtime_ns, stat.st_size)
+    mask = np.ascontiguousarray(mask)
+    return (mask.dtype.str, mask.shape, hashlib.sha256(mask).hexdigest())
+
+
+def _read_bed_mask(mask, chromosome):
+    """
+    Returns the intervals for the specified chromosome in the bed file, as a
+    read-only array. The intervals are kept in memory, keyed on the path,
+    modification time and size of the file, so that each chromosome is only
+    parsed once for many contigs.
+    """
+    key = ("bed_mask", _mask_key(mask), chromosome)
+
+    def build():
+        logger.debug(f"Reading mask for {chromosome} from {mask}")
+        intervals = stdpopsim.utils.read_bed(mask, chromosome)
+        intervals.flags.writeable = False
+        return intervals
+
+    return stdpopsim.get_memory_cache().get(key, build, lambda a: a.nbytes)
+
+
+def _read_mask(mask, chromosome):
+    """
+    Returns the mask intervals as a read-only array.
+    """
+    if mask is None:
+        return None
+    if isinstance(mask, str):
+        return _read_bed_mask(mask, chromosome)
+    intervals = np.array(mask)
+    intervals.flags.writeable = False
+    return intervals
+
+
+def _clip_mask(intervals, left, right, shift_coordinates):
+    """
+    Returns the mask intervals clipped to the region [left, right), and
+    shifted so that left is at position zero if ``shift_coordinates`` is True.
+    """
+    intervals = np.clip(np.reshape(intervals, (-1, 2)), left, right)
+    intervals = intervals[intervals[:, 1] > intervals[:, 0]]
+    if shift_coordinates:
+        intervals = intervals - left
+    intervals.flags.writeable = False
+    return intervals
+
+
+def _check_annotation(annotation):
+    """
+    Checks that the specified annotation mask is an (annotation ID, type)
+    pair, and returns it as a tuple.
+    """
+    if annotation is None:
+        return None
+    if isinstance(annotation, str) or len(annotation) != 2:
+        raise ValueError(
+            "Annotation masks must be given as an (annotation ID, type) pair, "
+            f"e.g. ('ensembl_havana_104', 'exon'), not {annotation}"
+        )
+    return tuple(annotation)
+
+
+def _contig_nbytes(contig):
+    """
+    Returns the approximate memory used by the specified contig, in bytes.
+    """
+    nbytes = stdpopsim.genetic_maps.rate_map_nbytes(contig.recombination_map)
+    for mask in (contig.inclusion_mask, contig.exclusion_mask):
+        if mask is not None:
+            nbytes += mask.nbytes
+    return nbytes
+
+
 @attr.s()
 class Species:
     """
@@ -130,7 +235,7 @@ class Species:
     genome = attr.ib(type=int, kw_only=True)
     generation_time = attr.ib(default=0, kw_only=True)
     population_size = attr.ib(default=0, kw_only=True)
-    demographic_models = attr.ib(factory=list, kw_only=True)
+    _demographic_models = attr.ib(factory=list, kw_only=True)
     ensembl_id = attr.ib(type=str, kw_only=True)
     citations = attr.ib(factory=list, kw_only=True)
 
@@ -140,6 +245,25 @@ class Species:
     genetic_maps = attr.ib(factory=list, kw_only=True)
     annotations = attr.ib(factory=list, kw_only=True)
 
+    # Demographic models (and their QC models) registered by the catalog are
+    # not built until they are first requested. These map model IDs to
+    # functions returning a DemographicModel, and the registration order of
+    # model IDs so that demographic_models keeps the catalog ordering.
+    _demographic_model_factories = attr.ib(factory=dict, init=False, repr=False)
+    _qc_model_factories = attr.ib(factory=dict, init=False, repr=False)
+    _demographic_model_order = attr.ib(factory=dict, init=False, repr=False)
+
+    @property
+    def demographic_models(self):
+        """
+        The list of :class:`DemographicModel` instances in the catalog for
+        this species. Accessing this property builds all models that have not
+        yet been built.
+        """
+        for id in list(self._demographic_model_factories.keys()):
+            self._build_demographic_model(id)
+        return self._demographic_models
+
     def get_contig(
         self,
         chromosome=None,
@@ -149,6 +273,11 @@ class Species:
         mutation_rate=None,
         inclusion_mask=None,
         exclusion_mask=None,
+        left=None,
+        right=None,
+        shift_coordinates=False,
+        inclusion_annotation=None,
+        exclusion_annotation=None,
     ):
         """
         Returns a :class:`.Contig` instance describing a section of genome that
@@ -174,22 +303,48 @@ class Species:
             the mutation rate defaults to the rate specified by species chromosomes.
         :param inclusion_mask: If specified, simulated genomes are subset to only
             inlude regions given by the mask. The mask can be specified by the
-            path and file name of a bed file or as a list or array of intervals
-            given by the left and right end points of the intervals.
+            path and file name of a bed file (optionally compressed with gzip
+            or bgzip) or as a list or array of intervals given by the left and
+            right end points of the intervals. Overlapping intervals in a bed
+            file are merged.
         :param exclusion_mask: If specified, simulated genomes are subset to exclude
             regions given by the mask. The mask can be specified by the
-            path and file name of a bed file or as a list or array of intervals
-            given by the left and right end points of the intervals.
+            path and file name of a bed file (optionally compressed with gzip
+            or bgzip) or as a list or array of intervals given by the left and
+            right end points of the intervals. Overlapping intervals in a bed
+            file are merged.
+        :param tuple inclusion_annotation: If specified, simulated genomes are
+            subset to only include the regions covered by elements of a given
+            type in the species' annotations, given as an
+            ``(annotation ID, type)`` pair, e.g. ``("ensembl_havana_104", "exon")``
+            to simulate the exome. Overlapping elements are merged.
+            The mask is obtained with :meth:`.Annotation.get_annotation_intervals`.
+        :param tuple exclusion_annotation: If specified, simulated genomes are
+            subset to exclude the regions covered by elements of a given type
+            in the species' annotations, given as for ``inclusion_annotation``.
         :param float length: Used with a "generic" contig, specifies the
             length of genome sequence for this contig. For a generic contig, mutation
             and recombination rates are equal to the genome-wide average across all
             autosomal chromosomes.
+        :param float left: If specified, simulate only the region of the
+            chromosome to the right of this position (inclusive). (Default: 0)
+        :param float right: If specified, simulate only the region of the
+            chromosome to the left of this position (exclusive).
+            (Default: the length of the chromosome)
+        :param bool shift_coordinates: If True, the returned contig has
+            length ``right - left``, with position zero corresponding to ``left``
+            on the chromosome. If False (the default), the chromosome's
+            coordinates are kept, and the recombination rate outside the region
+            [``left``, ``right``) is marked as missing, so that nothing is
+            simulated there. In either case, the recombination map and any
+            masks are restricted to the region. This can be used, for instance,
+            to split a chromosome into windows that are simulated
+            independently.
         :rtype: :class:`.Contig`
         :return: A :class:`.Contig` describing the section of the genome.
         """
         # TODO: add non-autosomal support
-        non_autosomal_lower = ["x", "y", "m", "mt", "chrx", "chry", "chrm"]
-        if chromosome is not None and chromosome.lower() in non_autosomal_lower:
+        if chromosome is not None and not stdpopsim.genomes._is_autosome(chromosome):
             warnings.warn(
                 stdpopsim.NonAutosomalWarning(
                     "Non-autosomal simulations are not yet supported. See "
@@ -204,16 +359,19 @@ class Species:
                 raise ValueError("Cannot use length multiplier for generic contig")
             if inclusion_mask is not None or exclusion_mask is not None:
                 raise ValueError("Cannot use mask with generic contig")
+            if inclusion_annotation is not None or exclusion_annotation is not None:
+                raise ValueError("Cannot use annotation mask with generic contig")
+            if left is not None or right is not None:
+                raise ValueError("Cannot use left or right with generic contig")
             if length is None:
                 raise ValueError("Must specify sequence length of generic contig")
             L_tot = 0
             r_tot = 0
             u_tot = 0
-            for chrom_data in self.genome.chromosomes:
-                if chrom_data.id.lower() not in non_autosomal_lower:
-                    L_tot += chrom_data.length
-                    r_tot += chrom_data.length * chrom_data.recombination_rate
-                    u_tot += chrom_data.length * chrom_data.mutation_rate
+            for chrom_data in self.genome.autosomes:
+                L_tot += chrom_data.length
+                r_tot += chrom_data.length * chrom_data.recombination_rate
+                u_tot += chrom_data.length * chrom_data.mutation_rate
             if mutation_rate is None:
                 mutation_rate = u_tot / L_tot
             r = r_tot / L_tot
@@ -224,56 +382,190 @@ class Species:
         else:
             if length is not None:
                 raise ValueError("Cannot specify sequence length for named contig")
-            if inclusion_mask is not None and exclusion_mask is not None:
-                raise ValueError("Cannot specify both inclusion and exclusion masks")
-            chrom = self.genome.get_chromosome(chromosome)
-            if genetic_map is None:
-                logger.debug(f"Making flat chromosome {length_multiplier} * {chrom.id}")
-                gm = None
-                recomb_map = msprime.RateMap.uniform(
-                    round(chrom.length * length_multiplier), chrom.recombination_rate
+            inclusion_annotation = _check_annotation(inclusion_annotation)
+            exclusion_annotation = _check_annotation(exclusion_annotation)
+            num_masks = sum(
+                mask is not None
+                for mask in (
+                    inclusion_mask,
+                    exclusion_mask,
+                    inclusion_annotation,
+                    exclusion_annotation,
                 )
-            else:
-                if length_multiplier != 1:
+            )
+            if num_masks > 1:
+                raise ValueError(
+                    "Cannot specify more than one inclusion or exclusion mask"
+                )
+            chrom = self.genome.get_chromosome(chromosome)
+            if length_multiplier != 1:
+                if genetic_map is not None:
                     raise ValueError("Cannot use length multiplier with empirical maps")
-                logger.debug(f"Getting map for {chrom.id} from {genetic_map}")
-                gm = self.get_genetic_map(genetic_map)
-                recomb_map = gm.get_chromosome_map(chrom.id)
-
-            inclusion_intervals = None
-            exclusion_intervals = None
-            if inclusion_mask is not None:
-                if length_multiplier != 1:
-                    raise ValueError("Cannot use length multiplier with mask")
-                if isinstance(inclusion_mask, str):
-                    inclusion_intervals = stdpopsim.utils.read_bed(
-                        inclusion_mask, chromosome
-                    )
-                else:
-                    inclusion_intervals = inclusion_mask
-            if exclusion_mask is not None:
-                if length_multiplier != 1:
+                if num_masks > 0:
                     raise ValueError("Cannot use length multiplier with mask")
-                if isinstance(exclusion_mask, str):
-                    exclusion_intervals = stdpopsim.utils.read_bed(
-                        exclusion_mask, chromosome
+                if left is not None or right is not None:
+                    raise ValueError("Cannot use length multiplier with left or right")
+            if left is None and right is None:
+                # The whole chromosome, which is not shifted.
+                shift_coordinates = False
+            else:
+                left = 0 if left is None else left
+                right = chrom.length if right is None else right
+                if not 0 <= left < right <= chrom.length:
+                    raise ValueError(
+                        f"Invalid region [{left}, {right}) for chromosome "
+                        f"{chrom.id} of length {chrom.length}"
                     )
-                else:
-                    exclusion_intervals = exclusion_mask
-
             if mutation_rate is None:
                 mutation_rate = chrom.mutation_rate
 
-            ret = stdpopsim.Contig(
-                recombination_map=recomb_map,
-                mutation_rate=mutation_rate,
-                genetic_map=gm,
-                inclusion_mask=inclusion_intervals,
-                exclusion_mask=exclusion_intervals,
+            # Contigs are kept in memory, as they are often requested repeatedly.
+            # The checksums of the genetic map and annotations are part of the
+            # key, so that a contig isn't reused if they are replaced.
+            key = (
+                "contig",
+                self.id,
+                chromosome,
+                self._genetic_map_key(genetic_map),
+                length_multiplier,
+                mutation_rate,
+                _mask_key(inclusion_mask),
+                _mask_key(exclusion_mask),
+                self._annotation_key(inclusion_annotation),
+                self._annotation_key(exclusion_annotation),
+                left,
+                right,
+                shift_coordinates,
+            )
+            contig, messages = stdpopsim.get_memory_cache().get(
+                key,
+                lambda: self._make_contig(
+                    chromosome,
+                    genetic_map=genetic_map,
+                    length_multiplier=length_multiplier,
+                    mutation_rate=mutation_rate,
+                    inclusion_mask=inclusion_mask,
+                    exclusion_mask=exclusion_mask,
+                    inclusion_annotation=inclusion_annotation,
+                    exclusion_annotation=exclusion_annotation,
+                    left=left,
+                    right=right,
+                    shift_coordinates=shift_coordinates,
+                ),
+                lambda value: _contig_nbytes(value[0]),
             )
+            for message in messages:
+                warnings.warn(message, stacklevel=2)
+            # The cached contig is shared, so we return a copy that may be
+            # modified by the caller. The recombination map and masks are
+            # read-only, and so are not copied.
+            ret = attr.evolve(contig)
 
         return ret
 
+    def _make_contig(
+        self,
+        chromosome,
+        *,
+        genetic_map,
+        length_multiplier,
+        mutation_rate,
+        inclusion_mask,
+        exclusion_mask,
+        inclusion_annotation,
+        exclusion_annotation,
+        left,
+        right,
+        shift_coordinates,
+    ):
+        """
+        Returns the contig for the arguments of :meth:`.get_contig`, and the
+        list of warnings for its genetic map.
+        """
+        chrom = self.genome.get_chromosome(chromosome)
+        messages = []
+        if genetic_map is None:
+            logger.debug(f"Making flat chromosome {length_multiplier} * {chrom.id}")
+            gm = None
+            recomb_map = msprime.RateMap.uniform(
+                round(chrom.length * length_multiplier), chrom.recombination_rate
+            )
+        else:
+            logger.debug(f"Getting map for {chrom.id} from {genetic_map}")
+            gm = self.get_genetic_map(genetic_map)
+            recomb_map, messages = gm._get_chromosome_map(chrom.id)
+        inclusion_mask = _read_mask(inclusion_mask, chromosome)
+        exclusion_mask = _read_mask(exclusion_mask, chromosome)
+        if inclusion_annotation is not None:
+            inclusion_mask = self._get_annotation_mask(inclusion_annotation, chrom)
+        if exclusion_annotation is not None:
+            exclusion_mask = self._get_annotation_mask(exclusion_annotation, chrom)
+
+        original_coordinates = None
+        if length_multiplier == 1:
+            original_coordinates = (chrom.id, 0, chrom.length)
+        if left is not None:
+            logger.debug(f"Restricting {chrom.id} to [{left}, {right})")
+            original_coordinates = (chrom.id, left, right)
+            recomb_map = recomb_map.slice(left, right, trim=shift_coordinates)
+            if inclusion_mask is not None:
+                inclusion_mask = _clip_mask(
+                    inclusion_mask, left, right, shift_coordinates
+                )
+            if exclusion_mask is not None:
+                exclusion_mask = _clip_mask(
+                    exclusion_mask, left, right, shift_coordinates
+                )
+
+        contig = stdpopsim.Contig(
+            recombination_map=recomb_map,
+            mutation_rate=mutation_rate,
+            genetic_map=gm,
+            inclusion_mask=inclusion_mask,
+            exclusion_mask=exclusion_mask,
+            original_coordinates=original_coordinates,
+        )
+        if inclusion_annotation is not None or exclusion_annotation is not None:
+            total = contig.recombination_map.sequence_length
+            logger.info(
+                f"Masked contig for {chrom.id} covers {contig.covered_length:.0f} "
+                f"of {total:.0f} bases"
+            )
+        return contig, messages
+
+    def _genetic_map_key(self, genetic_map):
+        if genetic_map is None:
+            return None
+        return (genetic_map, self.get_genetic_map(genetic_map).sha256)
+
+    def _annotation_key(self, annotation):
+        if annotation is None:
+            return None
+        annotation_id, a_type = annotation
+        return (annotation_id, self.get_annotations(annotation_id).zarr_sha256, a_type)
+
+    def _get_annotation_mask(self, annotation, chrom):
+        """
+        Returns the intervals covered by elements of the specified type in
+        the specified annotations, as an (annotation ID, type) pair.
+        """
+        annotation_id, a_type = annotation
+        an = self.get_annotations(annotation_id)
+        logger.debug(f"Getting {a_type} intervals for {chrom.id} from {an.id}")
+        return an.get_annotation_intervals(a_type, chrom.id)
+
+    @property
+    def demographic_model_ids(self):
+        """
+        The IDs of the demographic models in the catalog for this species,
+        in catalog order. Unlike :attr:`.demographic_models`, this does not
+        require the models to be built.
+        """
+        ids = [m.id for m in self._demographic_models]
+        ids.extend(self._demographic_model_factories.keys())
+        n = len(self._demographic_model_order)
+        return sorted(ids, key=lambda id: self._demographic_model_order.get(id, n))
+
     def get_demographic_model(self, id):
         """
         Returns a demographic model with the specified ``id``.
@@ -285,17 +577,82 @@ class Species:
         :rtype: :class:`DemographicModel`
         :return: A :class:`DemographicModel` that defines the requested model.
         """
-        for model in self.demographic_models:
+        if id in self._demographic_model_factories:
+            return self._build_demographic_model(id)
+        for model in self._demographic_models:
             if model.id == id:
                 return model
         raise ValueError(f"DemographicModel '{self.id}/{id}' not in catalog")
 
+    def _has_demographic_model(self, id):
+        return id in self._demographic_model_factories or id in [
+            m.id for m in self._demographic_models
+        ]
+
+    def _build_demographic_model(self, id):
+        logger.debug(f"Building demographic model '{self.id}/{id}'")
+        model = self._demographic_model_factories[id]()
+        if model.id != id:
+            raise ValueError(
+                f"DemographicModel '{self.id}/{id}' was registered, but the "
+                f"factory returned a model with ID '{model.id}'."
+            )
+        qc_factory = self._qc_model_factories.get(id)
+        if qc_factory is not None:
+            model.register_qc(qc_factory())
+        # The factories are only removed once the model has been built, so
+        # that a model whose factory raised an error is still in the catalog.
+        del self._demographic_model_factories[id]
+        self._qc_model_factories.pop(id, None)
+        # Insert the model at its registration position.
+        order = self._demographic_model_order
+        index = len(self._demographic_models)
+        for j, other in enumerate(self._demographic_models):
+            if order.get(other.id, -1) > order[id]:
+                index = j
+                break
+        self._demographic_models.insert(index, model)
+        return model
+
     def add_demographic_model(self, model):
-        if model.id in [m.id for m in self.demographic_models]:
+        if self._has_demographic_model(model.id):
             raise ValueError(
                 f"DemographicModel '{self.id}/{model.id}' already in catalog."
             )
-        self.demographic_models.append(model)
+        self._demographic_model_order[model.id] = len(self._demographic_model_order)
+        self._demographic_models.append(model)
+
+    def add_demographic_model_factory(self, id, factory):
+        """
+        Registers a function that returns the demographic model with the
+        specified ``id``. The function is called when the model is first
+        requested, and the resulting model is kept for subsequent requests.
+
+        :param str id: The ID of the demographic model returned by ``factory``.
+        :param factory: A function taking no arguments and returning a
+            :class:`DemographicModel`.
+        """
+        if self._has_demographic_model(id):
+            raise ValueError(f"DemographicModel '{self.id}/{id}' already in catalog.")
+        self._demographic_model_order[id] = len(self._demographic_model_order)
+        self._demographic_model_factories[id] = factory
+
+    def add_qc_model_factory(self, model_id, factory):
+        """
+        Registers a function that returns the QC model for the demographic
+        model with the specified ID. The QC model is built along with the
+        demographic model.
+
+        :param str model_id: The ID of the demographic model to be QCed.
+        :param factory: A function taking no arguments and returning a
+            :class:`DemographicModel`.
+        """
+        if model_id in self._demographic_model_factories:
+            if model_id in self._qc_model_factories:
+                raise ValueError(f"QC model already registered for {model_id}.")
+            self._qc_model_factories[model_id] = factory
+        else:
+            self.get_demographic_model(model_id).register_qc(factory())
 
     def add_genetic_map(self, genetic_map):
         if genetic_map.id in [gm.id for gm in self.genetic_maps]:
@@ -1,15 +1,39 @@
 """
 Miscellaneous utilities.
 """
+import array
 import re
 import os
+import posixpath
 import hashlib
+import logging
+import urllib.error
 import urllib.request
 import shutil
 import tarfile
 import contextlib
+import copy
+import pathlib
+import gzip
+import json
+import tempfile
+import time
+import sys
+import zipfile
+import zlib
 import numpy as np
 
+# resource is from the standard library, but it's not available on Windows.
+_resource_module_available = False
+try:
+    import resource
+
+    _resource_module_available = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
 
 def is_valid_demographic_model_id(model_id):
     """
@@ -62,21 +86,105 @@ def is_valid_species_common_name(common_name):
     return regex.fullmatch(common_name) is not None
 
 
-def download(url, filename):
+def _check_remaining(url, f_in):
+    # An HTTP response ending early is not an error for read(amt), so we
+    # check that we got as many bytes as the server said it would send.
+    remaining = getattr(f_in, "length", None)
+    if remaining is not None and remaining > 0:
+        raise ConnectionError(
+            f"Download of {url} was interrupted with {remaining} bytes remaining"
+        )
+
+
+def download(url, filename, resume=False):
     """
-    Download url to the specified local file.
+    Download url to the specified local file, returning the SHA256 hex digest
+    of the file, which is computed as the data are downloaded.
+
+    If ``resume`` is True and the local file exists, it is assumed to hold the
+    start of an interrupted download of the url, and only the remaining data
+    are requested using an HTTP Range request. If the server does not support
+    range requests, the whole file is downloaded again.
     """
-    # TODO: what is a sensible timeout here?
-    with urllib.request.urlopen(url, timeout=30) as f_in:
-        with open(filename, "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
+    m = hashlib.sha256()
+    BUFLEN = 4096 * m.block_size  # 256 Kib
+    offset = 0
+    if resume and os.path.exists(filename):
+        offset = os.path.getsize(filename)
+    request = urllib.request.Request(url)
+    if offset > 0:
+        request.add_header("Range", f"bytes={offset}-")
+    try:
+        # TODO: what is a sensible timeout here?
+        f_in = urllib.request.urlopen(request, timeout=30)
+    except urllib.error.HTTPError as err:
+        if offset > 0 and err.code == 416:
+            # Range not satisfiable, so we already have the whole file.
+            logger.debug(f"Download of {url} to {filename} is already complete")
+            return sha256(filename)
+        raise
+    with f_in:
+        mode = "wb"
+        if offset > 0:
+            if getattr(f_in, "status", None) == 206:
+                logger.debug(f"Resuming download of {url} from byte {offset}")
+                _update_sha256(m, filename)
+                mode = "ab"
+            else:
+                logger.debug(f"Cannot resume download of {url}, restarting")
+        with open(filename, mode) as f_out:
+            while True:
+                buf = f_in.read(BUFLEN)
+                if len(buf) == 0:
+                    break
+                m.update(buf)
+                f_out.write(buf)
+        _check_remaining(url, f_in)
+    return m.hexdigest()
 
 
-def sha256(filename):
+class _HashingReader:
     """
-    Return the SHA256 hex digest for the specified file.
+    A read-only file object, which updates the hash ``m`` with the data read
+    from the file object ``f``.
+    """
+
+    def __init__(self, f, m):
+        self._f = f
+        self._m = m
+
+    def read(self, size=-1):
+        buf = self._f.read(size)
+        self._m.update(buf)
+        return buf
+
+
+def download_and_untar(url, path):
+    """
+    Download the optionally-gzipped tar file at url and extract it to the
+    specified path as it is downloaded, so that the tar file is never stored
+    on disk. Returns the SHA256 hex digest of the tar file, which is computed
+    as it is downloaded. As the checksum is only known once the files have
+    been extracted, the caller should extract to a temporary location, which
+    is discarded if the checksum does not match.
     """
     m = hashlib.sha256()
+    BUFLEN = 4096 * m.block_size  # 256 Kib
+    # TODO: what is a sensible timeout here?
+    with urllib.request.urlopen(url, timeout=30) as f_in:
+        reader = _HashingReader(f_in, m)
+        with tarfile.open(fileobj=reader, mode="r|*") as tf:
+            for info in tf:
+                _check_tar_member(info, path)
+                tf.extract(info, path)
+        # Include any data after the end of the tar archive in the checksum.
+        while len(reader.read(BUFLEN)) > 0:
+            pass
+        _check_remaining(url, f_in)
+    return m.hexdigest()
+
+
+def _update_sha256(m, filename):
     BUFLEN = 4096 * m.block_size  # 256 Kib
     with open(filename, "rb") as f:
         while True:
@@ -84,6 +192,14 @@ def sha256(filename):
             if len(buf) == 0:
                 break
             m.update(buf)
+
+
+def sha256(filename):
+    """
+    Return the SHA256 hex digest for the specified file.
+    """
+    m = hashlib.sha256()
+    _update_sha256(m, filename)
     return m.hexdigest()
 
 
@@ -100,42 +216,240 @@ def cd(path):
         os.chdir(old_dir)
 
 
+def max_rss():
+    """
+    Returns the peak resident memory of this process in bytes, or None if
+    this is not available (on Windows).
+    """
+    if not _resource_module_available:
+        return None
+    max_mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_mem *= 1024  # Linux and other OSs (e.g. freeBSD) report maxrss in kb
+    return max_mem
+
+
+@contextlib.contextmanager
+def log_stage(stage_logger, name):
+    """
+    Context manager that logs the time taken to run its body at the INFO
+    level, using the specified logger, along with the peak resident memory
+    of the process afterwards. The peak memory is for the whole process, so
+    an increase is only seen for stages that use more memory than any
+    earlier stage.
+    """
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    message = f"{name}: {elapsed:.2f}s"
+    max_mem = max_rss()
+    if max_mem is not None:
+        message += f"; max_rss={max_mem / 2 ** 20:.1f}MiB"
+    stage_logger.info(message)
+
+
+def download_tar_as_zip(url, filename):
+    """
+    Download the optionally-gzipped tar file at url and repackage its files
+    into the specified zip file as it is downloaded. Unlike a gzipped tar
+    file, individual files can be extracted from the zip file without
+    reading the whole archive (see :func:`.extract_zip_member`). Returns the
+    SHA256 hex digest of the tar file, which is computed as it is downloaded.
+    """
+    m = hashlib.sha256()
+    BUFLEN = 4096 * m.block_size  # 256 Kib
+    # TODO: what is a sensible timeout here?
+    with urllib.request.urlopen(url, timeout=30) as f_in:
+        reader = _HashingReader(f_in, m)
+        with tarfile.open(fileobj=reader, mode="r|*") as tf, zipfile.ZipFile(
+            filename, "w", compression=zipfile.ZIP_DEFLATED
+        ) as zf:
+            for info in tf:
+                _check_tar_member(info, filename)
+                if info.isfile():
+                    name = posixpath.normpath(info.name)
+                    with tf.extractfile(info) as src, zf.open(name, "w") as dest:
+                        shutil.copyfileobj(src, dest, BUFLEN)
+        # Include any data after the end of the tar archive in the checksum.
+        while len(reader.read(BUFLEN)) > 0:
+            pass
+        _check_remaining(url, f_in)
+    return m.hexdigest()
+
+
+def extract_zip_member(filename, name, path):
+    """
+    Extract the file ``name`` from the specified zip file to the same relative
+    path within ``path``, and return the path of the extracted file. If the
+    zip file does not contain ``name``, return None. The extracted file is
+    written atomically, so that concurrent readers never see a partial file.
+    """
+    name = posixpath.normpath(name)
+    if name.startswith("/") or name.startswith(".."):
+        raise ValueError(f"Refusing to extract {name} outside of {path}")
+    with zipfile.ZipFile(filename) as zf:
+        try:
+            info = zf.getinfo(name)
+        except KeyError:
+            return None
+        dest = pathlib.Path(path) / name
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dest.parent)
+        try:
+            with os.fdopen(fd, "wb") as f_out, zf.open(info) as f_in:
+                shutil.copyfileobj(f_in, f_out)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return dest
+
+
+def check_zip(filename):
+    """
+    Checks the CRC of every file in the specified zip file, returning the
+    name of the first corrupted file, or None if there are no problems.
+    """
+    with zipfile.ZipFile(filename) as zf:
+        for info in zf.infolist():
+            try:
+                with zf.open(info) as f:
+                    while len(f.read(1 << 20)) > 0:
+                        pass
+            except (zipfile.BadZipFile, zlib.error):
+                return info.filename
+    return None
+
+
 def untar(filename, path):
     """
     Extract the optionally-gzipped tar file to the specifed path.
     """
     with tarfile.open(filename, "r") as tf:
         for info in tf.getmembers():
-            # Due to security concerns, we only extract tarballs containing a
-            # very restrictive set of file types. See the warning here:
-            # https://docs.python.org/3/library/tarfile.html#tarfile.TarFile.extractall
-            if not (info.isfile() or info.isdir()):
-                raise ValueError(f"Tarball format error: member {info.name} not a file")
-            if info.name.startswith("/") or info.name.startswith(".."):
-                raise ValueError(f"Refusing to extract {info.name} outside of {path}")
+            _check_tar_member(info, path)
         with cd(path):
             tf.extractall()
 
 
+def _check_tar_member(info, path):
+    # Due to security concerns, we only extract tarballs containing a
+    # very restrictive set of file types. See the warning here:
+    # https://docs.python.org/3/library/tarfile.html#tarfile.TarFile.extractall
+    # In particular, symbolic and hard links are rejected, as are names such
+    # as "a/../../b" which resolve to a path outside of the destination.
+    if not (info.isfile() or info.isdir()):
+        raise ValueError(f"Tarball format error: member {info.name} not a file")
+    root = os.path.realpath(path)
+    dest = os.path.realpath(os.path.join(root, info.name))
+    if os.path.commonpath([root, dest]) != root:
+        raise ValueError(f"Refusing to extract {info.name} outside of {path}")
+
+
+# The number of bytes of a bed file that are read at once.
+_BED_BLOCK_SIZE = 1 << 22
+
+
+def open_bed(mask_fpath):
+    """
+    Opens the specified bed file for reading in binary mode. Files that are
+    compressed with gzip or bgzip are decompressed as they are read.
+    """
+    f = open(mask_fpath, "rb")
+    try:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    if is_gzip:
+        # Bgzip files are a series of gzip members, which GzipFile reads
+        # in turn.
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    return f
+
+
 def read_bed(mask_fpath, chrom):
     """
     Returns intervals to keep based on a bed file specified by the mask_fpath.
     The mask must be in bed format (columns specify chrom, left, right) and
-    additional columns are ignored. Intervals must be non-overlapping.
+    additional columns are ignored. Columns must be separated by tabs. The file
+    may be compressed with gzip or bgzip. Header lines (starting with "#",
+    "track" or "browser") and empty lines are skipped.
+
+    The file is read in blocks, and only the lines for the specified
+    chromosome are parsed. Overlapping and adjacent intervals are merged, and
+    the intervals are returned as a sorted (N, 2) int64 array of disjoint
+    intervals.
 
     Note that the chromosome name must match exactly (i.e. "22" is not equivalent
     to "chr22").
     """
-    lines = np.loadtxt(
-        mask_fpath,
-        dtype={"names": ("chrom", "left", "right"), "formats": (object, int, int)},
-        delimiter="\t",
-        usecols=(0, 1, 2),
-    )
-    in_chrom = lines["chrom"] == f"{chrom}"
-    lines = lines.compress(in_chrom)
-    intervals = np.array([lines["left"], lines["right"]]).T
-    return intervals
+    # Lines for the chromosome are found by searching for the chromosome
+    # name at the start of a line, so that the lines for other chromosomes
+    # are skipped without being split into fields.
+    key = b"\n" + str(chrom).encode() + b"\t"
+    # The intervals are stored compactly, as genome-wide masks may have
+    # millions of lines.
+    coords = array.array("q")
+    num_lines = 0
+    # A newline is prepended, so that the first line can also be found.
+    remainder = b"\n"
+    with open_bed(mask_fpath) as f:
+        while True:
+            block = f.read(_BED_BLOCK_SIZE)
+            data = remainder + block
+            if block:
+                # The last line may continue in the next block, so it is kept
+                # (with the newline before it) for the next block.
+                end = data.rfind(b"\n")
+                data, remainder = data[:end], data[end:]
+            pos = data.find(key)
+            while pos >= 0:
+                end = data.find(b"\n", pos + 1)
+                if end < 0:
+                    end = len(data)
+                fields = data[pos + 1 : end].split(b"\t", 3)
+                try:
+                    left, right = int(fields[1]), int(fields[2])
+                    if left < 0 or right < left:
+                        raise ValueError(f"invalid interval [{left}, {right})")
+                except (IndexError, ValueError) as err:
+                    line_num = num_lines + data.count(b"\n", 0, pos + 1)
+                    line = data[pos + 1 : end].decode(errors="replace")
+                    raise ValueError(
+                        f"{mask_fpath}:{line_num}: expected chrom, left and right "
+                        f"columns, got {line!r}: {err}"
+                    )
+                coords.append(left)
+                coords.append(right)
+                pos = data.find(key, end)
+            if not block:
+                break
+            num_lines += data.count(b"\n")
+    intervals = np.frombuffer(coords, dtype=np.int64).reshape(-1, 2)
+    intervals = intervals[intervals[:, 1] > intervals[:, 0]]
+    return merge_intervals(intervals)
+
+
+def merge_intervals(intervals):
+    """
+    Returns the union of the specified half-open intervals, given as an (N, 2)
+    array of [left, right) pairs, as a sorted (M, 2) int64 array of disjoint
+    intervals. Overlapping and adjacent intervals are merged.
+    """
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    if len(intervals) == 0:
+        return intervals.copy()
+    intervals = intervals[np.lexsort((intervals[:, 1], intervals[:, 0]))]
+    # The furthest right end of the intervals seen so far.
+    right = np.maximum.accumulate(intervals[:, 1])
+    # An interval starts a new merged interval if it is beyond all previous ones.
+    first = np.ones(len(intervals), dtype=bool)
+    first[1:] = intervals[1:, 0] > right[:-1]
+    first_index = np.flatnonzero(first)
+    last_index = np.append(first_index[1:] - 1, len(intervals) - 1)
+    return np.column_stack([intervals[first_index, 0], right[last_index]])
 
 
 def mask_tree_sequence(ts, mask_intervals, exclude):
@@ -150,6 +464,124 @@ def mask_tree_sequence(ts, mask_intervals, exclude):
     return ts
 
 
+def finalise_tree_sequence(
+    ts, *, flanks=None, inclusion_mask=None, exclusion_mask=None, provenance=None
+):
+    """
+    Deletes the flanking intervals, applies the inclusion and exclusion masks
+    and records the provenance for the tree sequence. This is done with a
+    single copy of the tables, and the tree sequence is returned unchanged if
+    there is nothing to do.
+
+    :param flanks: Intervals to remove from the tree sequence, without
+        simplifying.
+    :param inclusion_mask: Intervals to keep (see :func:`.mask_tree_sequence`).
+    :param exclusion_mask: Intervals to remove (see :func:`.mask_tree_sequence`).
+    :param dict provenance: A provenance record to add to the tree sequence.
+    """
+    if (
+        (flanks is None or len(flanks) == 0)
+        and inclusion_mask is None
+        and exclusion_mask is None
+        and provenance is None
+    ):
+        return ts
+    tables = ts.dump_tables()
+    finalise_tables(
+        tables,
+        flanks=flanks,
+        inclusion_mask=inclusion_mask,
+        exclusion_mask=exclusion_mask,
+        provenance=provenance,
+    )
+    return tables.tree_sequence()
+
+
+def finalise_tables(
+    tables, *, flanks=None, inclusion_mask=None, exclusion_mask=None, provenance=None
+):
+    """
+    Does the work of :func:`.finalise_tree_sequence`, modifying the specified
+    tables in place.
+    """
+    if flanks is not None and len(flanks) > 0:
+        tables.delete_intervals(flanks, simplify=False)
+    if inclusion_mask is not None:
+        tables.keep_intervals(inclusion_mask)
+    if exclusion_mask is not None:
+        tables.delete_intervals(exclusion_mask)
+    if provenance is not None:
+        tables.provenances.add_row(json.dumps(provenance))
+
+
+def shift_tables(tables, offset, sequence_length):
+    """
+    Shifts the coordinates of the specified tables to the right by
+    ``offset``, in place, and sets the sequence length. There are no edges
+    in the first ``offset`` units of the shifted sequence.
+    """
+    tables.sequence_length = sequence_length
+    for table in (tables.edges, tables.migrations):
+        table.left += offset
+        table.right += offset
+    tables.sites.position += offset
+
+
+def _anonymous_file():
+    """
+    Returns a file object for scratch data that is held in memory, where
+    possible, rather than on disk.
+    """
+    if hasattr(os, "memfd_create"):
+        return open(os.memfd_create("stdpopsim"), "w+b")
+    return tempfile.TemporaryFile()
+
+
+def replicate_provenance(provenance, replicate):
+    """
+    Returns a copy of the provenance record with the replicate number added
+    to its parameters.
+    """
+    provenance = copy.deepcopy(provenance)
+    provenance.setdefault("parameters", {})["replicate"] = replicate
+    return provenance
+
+
+def dump_tree_sequence(ts, file, compress=False, provenance=None):
+    """
+    Writes the tree sequence to the specified binary file-like object, such as
+    ``sys.stdout.buffer``. If ``compress`` is True, the output is gzip
+    compressed. If ``provenance`` is specified, the provenance record is
+    added to the output. This copies the tables, but does not build a new
+    tree sequence from them.
+
+    If the file has a file descriptor and the output is not compressed, the
+    tree sequence is written to it directly. Otherwise, as tskit can only
+    write to a file descriptor, the tree sequence is first written to an
+    in-memory file (on Linux), and then copied into the file object.
+    """
+    if provenance is not None:
+        ts = ts.dump_tables()
+        ts.provenances.add_row(json.dumps(provenance))
+    if not compress:
+        try:
+            file.fileno()
+        except (AttributeError, OSError):
+            pass
+        else:
+            file.flush()
+            ts.dump(file)
+            return
+    with _anonymous_file() as scratch:
+        ts.dump(scratch)
+        scratch.seek(0)
+        if compress:
+            with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6) as gz_file:
+                shutil.copyfileobj(scratch, gz_file)
+        else:
+            shutil.copyfileobj(scratch, file)
+
+
 def append_common_synonyms(genome):
     """
     For common chromosome IDs, add their obvious synonyms if they do not exist already.
@@ -1,6 +1,10 @@
 """
 Package definition for tests. Defined to allow cross-importing.
 """
+import http.server
+import re
+import threading
+import time
 import unittest
 import tempfile
 
@@ -44,3 +48,70 @@ class CacheWritingTest(unittest.TestCase):
     def tearDown(self):
         stdpopsim.set_cache_dir(self.saved_cache_dir)
         del self.tmp_cache_dir
+
+
+class LocalHTTPServer:
+    """
+    A local HTTP server, standing in for the remote servers from which data
+    are downloaded. The ``files`` dict maps paths (such as "/foo.tgz") to their
+    contents. Range requests are supported unless ``ranges`` is False, and
+    if ``truncate`` is set, only the first ``truncate`` bytes of the response
+    body are sent before the connection is closed. Responses are sent after
+    ``delay`` seconds. The headers of each request received are stored in
+    ``requests``.
+    """
+
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.truncate = None
+        self.delay = 0
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                time.sleep(server.delay)
+                data = server.files.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                start = 0
+                match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                if server.ranges and match is not None:
+                    start = int(match.group(1))
+                    if start >= len(data):
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}"
+                    )
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(data) - start))
+                self.end_headers()
+                body = data[start:]
+                if server.truncate is not None:
+                    body = body[: server.truncate]
+                self.wfile.write(body)
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+
+    def url(self, path):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
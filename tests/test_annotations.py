@@ -8,10 +8,15 @@ import tempfile
 import os.path
 import shutil
 import pathlib
+import json
 
+import numpy as np
 import pandas
+import numcodecs
+import zarr
 
 import stdpopsim
+from stdpopsim import annotations
 from stdpopsim import utils
 import tests
 
@@ -104,6 +109,306 @@ def get_annotation_file():
     return an
 
 
+def make_annotation_zarr(path, seqids):
+    """
+    Writes an annotation zarr with one row per element of seqids to the
+    specified zip file, and returns its contents as a dataframe.
+    """
+    n = len(seqids)
+    df = pandas.DataFrame(
+        {
+            "seqid": np.array(seqids, dtype=object),
+            "source": np.array(["test"] * n, dtype=object),
+            "type": np.array(["gene", "exon"] * (n // 2) + ["gene"] * (n % 2)),
+            "start": np.arange(n) * 100 + 1,
+            # Some elements overlap or abut the next element.
+            "end": np.arange(n) * 100 + (np.arange(n) % 3) * 60 + 40,
+            "score": np.zeros(n),
+            "strand": np.array(["+"] * n, dtype=object),
+            "phase": np.array(["."] * n, dtype=object),
+        }
+    )
+    with zarr.ZipStore(str(path), mode="w") as store:
+        root = zarr.group(store=store)
+        for col in df.columns:
+            values = df[col].to_numpy()
+            kwargs = {}
+            if values.dtype == object:
+                kwargs["object_codec"] = numcodecs.VLenUTF8()
+            root.array(col, values, chunks=(7,), **kwargs)
+    return df
+
+
+class LocalAnnotationTest(tests.CacheWritingTest):
+    """
+    Base class for tests using annotations for a test species, which are
+    "downloaded" from a local zarr made with make_annotation_zarr().
+    """
+
+    seqids = ["1"] * 20 + ["2"] * 15 + ["3"] * 3 + ["1"] * 2 + ["MT"]
+
+    def setUp(self):
+        super().setUp()
+        self.zarr_dir = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.zarr_dir.name) / "annotations.zip"
+        self.df = make_annotation_zarr(path, self.seqids)
+        genome = stdpopsim.Genome(
+            chromosomes=[
+                stdpopsim.Chromosome(
+                    id=chrom_id,
+                    length=10000,
+                    recombination_rate=1e-8,
+                    mutation_rate=1e-8,
+                )
+                for chrom_id in ["1", "2", "3", "4", "MT"]
+            ]
+        )
+        self.species = stdpopsim.Species(
+            id="TesSpe",
+            ensembl_id="test_species",
+            name="Test species",
+            common_name="Testy McTestface",
+            genome=genome,
+        )
+        self.an = stdpopsim.Annotation(
+            species=self.species,
+            id="test_annotation",
+            url="http://example.com/annotation.gff.gz",
+            zarr_url=path.resolve().as_uri(),
+            zarr_sha256=utils.sha256(path),
+            description="test annotation",
+        )
+        self.species.add_annotations(self.an)
+        stdpopsim.clear_memory_cache()
+
+    def tearDown(self):
+        del self.zarr_dir
+        stdpopsim.clear_memory_cache()
+        super().tearDown()
+
+
+class TestChromosomeIndex(LocalAnnotationTest):
+    """
+    Tests for reading the annotations for a chromosome using the index.
+    """
+
+    def test_index(self):
+        self.an.download()
+        index = annotations.build_seqid_index(str(self.an.cache_path))
+        self.assertEqual(
+            index,
+            {
+                "1": [[0, 20], [38, 40]],
+                "2": [[20, 35]],
+                "3": [[35, 38]],
+                "MT": [[40, 41]],
+            },
+        )
+
+    def test_same_as_full_table(self):
+        for chrom_id in ["1", "2", "3", "MT"]:
+            df = self.an.get_chromosome_annotations(chrom_id)
+            expected = self.df[self.df.seqid == chrom_id]
+            pandas.testing.assert_frame_equal(df, expected, check_index_type=False)
+
+    def test_columns(self):
+        df = self.an.get_chromosome_annotations("2", columns=["start", "end"])
+        self.assertEqual(list(df.columns), ["start", "end"])
+        expected = self.df[self.df.seqid == "2"][["start", "end"]]
+        pandas.testing.assert_frame_equal(df, expected, check_index_type=False)
+
+    def test_genes(self):
+        genes = self.an.get_genes_from_chromosome("1")
+        expected = self.df[(self.df.seqid == "1") & (self.df.type == "gene")]
+        pandas.testing.assert_frame_equal(
+            genes, expected[["start", "end"]], check_index_type=False
+        )
+        genes = self.an.get_genes_from_chromosome("1", full_table=True)
+        pandas.testing.assert_frame_equal(genes, expected, check_index_type=False)
+
+    def test_no_annotations(self):
+        with self.assertRaises(ValueError):
+            self.an.get_chromosome_annotations("4")
+
+    def test_index_cached(self):
+        self.an.get_chromosome_annotations("1")
+        self.assertTrue(self.an.index_file.exists())
+        stdpopsim.clear_memory_cache()
+        with mock.patch(
+            "stdpopsim.annotations.build_seqid_index", autospec=True
+        ) as mocked:
+            self.an.get_chromosome_annotations("2")
+        mocked.assert_not_called()
+
+    def test_bad_index(self):
+        self.an.get_chromosome_annotations("1")
+        with open(self.an.index_file, "w") as f:
+            f.write("not an index")
+        stdpopsim.clear_memory_cache()
+        df = self.an.get_chromosome_annotations("2")
+        self.assertEqual(len(df), 15)
+        # The bad index was replaced.
+        with open(self.an.index_file) as f:
+            self.assertEqual(json.load(f)["2"], [[20, 35]])
+
+    def test_memory_cache(self):
+        df1 = self.an.get_chromosome_annotations("1")
+        with mock.patch(
+            "stdpopsim.annotations.zarr_to_dataframe", autospec=True
+        ) as mocked:
+            df2 = self.an.get_chromosome_annotations("1")
+        mocked.assert_not_called()
+        pandas.testing.assert_frame_equal(df1, df2)
+        # Modifying the returned dataframe doesn't affect the cache.
+        df2["start"] = 0
+        df3 = self.an.get_chromosome_annotations("1")
+        pandas.testing.assert_frame_equal(df1, df3)
+
+
+class TestAnnotationIntervals(LocalAnnotationTest):
+    """
+    Tests for the intervals covered by each type of annotation.
+    """
+
+    def verify_intervals(self, intervals, df):
+        self.assertEqual(intervals.dtype, np.int64)
+        self.assertEqual(intervals.shape[1], 2)
+        # The intervals are sorted, disjoint and not adjacent.
+        self.assertTrue(np.all(intervals[:, 0] < intervals[:, 1]))
+        self.assertTrue(np.all(intervals[1:, 0] > intervals[:-1, 1]))
+        covered = np.zeros(10000, dtype=bool)
+        for start, end in zip(df.start, df.end):
+            # GFF3 coordinates are one-based and inclusive.
+            covered[start - 1 : end] = True
+        expected = np.zeros(10000, dtype=bool)
+        for left, right in intervals:
+            expected[left:right] = True
+        self.assertTrue(np.array_equal(covered, expected))
+
+    def test_intervals(self):
+        for chrom_id in ["1", "2", "3", "MT"]:
+            for a_type in ["gene", "exon"]:
+                df = self.df[(self.df.seqid == chrom_id) & (self.df.type == a_type)]
+                if len(df) == 0:
+                    with self.assertRaises(ValueError):
+                        self.an.get_annotation_intervals(a_type, chrom_id)
+                else:
+                    intervals = self.an.get_annotation_intervals(a_type, chrom_id)
+                    self.verify_intervals(intervals, df)
+
+    def test_merged(self):
+        intervals = self.an.get_annotation_intervals("gene", "2")
+        self.assertLess(len(intervals), np.sum(self.df.seqid == "2"))
+
+    def test_bad_type(self):
+        with self.assertRaises(ValueError):
+            self.an.get_annotation_intervals("foo", "1")
+
+    def test_read_only(self):
+        intervals = self.an.get_annotation_intervals("gene", "1")
+        with self.assertRaises(ValueError):
+            intervals[0, 0] = 0
+
+    def test_memory_cache(self):
+        intervals1 = self.an.get_annotation_intervals("gene", "1")
+        with mock.patch(
+            "stdpopsim.annotations.build_type_intervals", autospec=True
+        ) as mocked:
+            intervals2 = self.an.get_annotation_intervals("exon", "1")
+            intervals3 = self.an.get_annotation_intervals("gene", "1")
+        mocked.assert_not_called()
+        self.assertIs(intervals1, intervals3)
+        self.assertFalse(np.array_equal(intervals1, intervals2))
+
+
+class TestAnnotationContig(LocalAnnotationTest):
+    """
+    Tests for contigs masked using the annotations.
+    """
+
+    def test_inclusion_annotation(self):
+        intervals = self.an.get_annotation_intervals("gene", "1")
+        contig = self.species.get_contig(
+            "1", inclusion_annotation=("test_annotation", "gene")
+        )
+        np.testing.assert_array_equal(contig.inclusion_mask, intervals)
+        self.assertIsNone(contig.exclusion_mask)
+        self.assertEqual(
+            contig.covered_length, np.sum(intervals[:, 1] - intervals[:, 0])
+        )
+
+    def test_exclusion_annotation(self):
+        intervals = self.an.get_annotation_intervals("exon", "2")
+        contig = self.species.get_contig(
+            "2", exclusion_annotation=["test_annotation", "exon"]
+        )
+        np.testing.assert_array_equal(contig.exclusion_mask, intervals)
+        self.assertIsNone(contig.inclusion_mask)
+        self.assertEqual(
+            contig.covered_length, 10000 - np.sum(intervals[:, 1] - intervals[:, 0])
+        )
+
+    def test_region(self):
+        contig = self.species.get_contig(
+            "1",
+            left=1000,
+            right=2000,
+            shift_coordinates=True,
+            inclusion_annotation=("test_annotation", "gene"),
+        )
+        intervals = self.an.get_annotation_intervals("gene", "1")
+        expected = np.clip(intervals, 1000, 2000)
+        expected = expected[expected[:, 1] > expected[:, 0]] - 1000
+        np.testing.assert_array_equal(contig.inclusion_mask, expected)
+
+    def test_memory_cache(self):
+        contig1 = self.species.get_contig(
+            "1", inclusion_annotation=("test_annotation", "gene")
+        )
+        with mock.patch(
+            "stdpopsim.annotations.zarr_to_dataframe", autospec=True
+        ) as mocked:
+            contig2 = self.species.get_contig(
+                "1", inclusion_annotation=("test_annotation", "gene")
+            )
+        mocked.assert_not_called()
+        self.assertIs(contig1.inclusion_mask, contig2.inclusion_mask)
+        contig3 = self.species.get_contig(
+            "1", inclusion_annotation=("test_annotation", "exon")
+        )
+        self.assertFalse(np.array_equal(contig1.inclusion_mask, contig3.inclusion_mask))
+
+    def test_bad_options(self):
+        annotation = ("test_annotation", "gene")
+        with self.assertRaises(ValueError):
+            self.species.get_contig(length=1000, inclusion_annotation=annotation)
+        with self.assertRaises(ValueError):
+            self.species.get_contig(
+                "1", inclusion_annotation=annotation, exclusion_annotation=annotation
+            )
+        with self.assertRaises(ValueError):
+            self.species.get_contig(
+                "1", inclusion_annotation=annotation, inclusion_mask=[(0, 10)]
+            )
+        with self.assertRaises(ValueError):
+            self.species.get_contig(
+                "1", exclusion_annotation=annotation, inclusion_mask=[(0, 10)]
+            )
+        with self.assertRaises(ValueError):
+            self.species.get_contig(
+                "1", inclusion_annotation=annotation, length_multiplier=2
+            )
+        for bad_annotation in ["test_annotation", ("test_annotation",)]:
+            with self.assertRaises(ValueError):
+                self.species.get_contig("1", inclusion_annotation=bad_annotation)
+        with self.assertRaises(ValueError):
+            self.species.get_contig("1", inclusion_annotation=("foo", "gene"))
+        with self.assertRaises(ValueError):
+            self.species.get_contig(
+                "1", inclusion_annotation=("test_annotation", "foo")
+            )
+
+
 class TestAnnotation(tests.CacheWritingTest):
     """
     Tests for the basic functionality of the Annotation class.
@@ -130,7 +435,7 @@ class TestAnnotationDownload(tests.CacheWritingTest):
             # The destination file will be missing.
             with self.assertRaises(FileNotFoundError):
                 an.download()
-        mocked_get.assert_called_once_with(an.zarr_url, filename=unittest.mock.ANY)
+        mocked_get.assert_called_once_with(an.zarr_url, unittest.mock.ANY, resume=True)
 
     def test_incorrect_url(self):
         an = AnnotationTestClass()
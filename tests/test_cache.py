@@ -1,12 +1,23 @@
 """
 Tests for the cache management code.
 """
+import hashlib
+import multiprocessing
 import os
 import pathlib
+import socket
+import subprocess
+import sys
 import tempfile
 import tarfile
+import threading
+import time
+import warnings
+from unittest import mock
 
 import appdirs
+import attr
+import pytest
 
 import stdpopsim
 from stdpopsim import utils
@@ -103,7 +114,793 @@ class TestCachedData(tests.CacheWritingTest):
             )
             cache.download()
             # Trick the download code into thinking there's several happening
-            # concurrently
-            cache.is_cached = lambda: False
-            with self.assertWarns(UserWarning):
+            # concurrently, by recreating the cache while it downloads.
+            download_and_untar = utils.download_and_untar
+
+            def concurrent_download(url, path):
+                sha256 = download_and_untar(url, path)
+                download_and_untar(url, cache.cache_path)
+                return sha256
+
+            with mock.patch(
+                "stdpopsim.utils.download_and_untar", side_effect=concurrent_download
+            ):
+                with self.assertWarns(UserWarning):
+                    cache.download()
+
+
+class TestCachedDataHTTP(tests.CacheWritingTest):
+    """
+    Tests for downloading cached data from a local HTTP server.
+    """
+
+    def make_tarball(self, tmpdir):
+        with utils.cd(tmpdir):
+            with open("test.foo", "wb") as f:
+                f.write(os.urandom(500000))
+            with tarfile.open("test.tgz", "w:gz") as tf:
+                tf.add("test.foo")
+            with open("test.tgz", "rb") as f:
+                return f.read()
+
+    def test_interrupted_download(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=server.url("/test.tgz"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                extract=False,
+            )
+            server.truncate = 100000
+            with pytest.raises(ConnectionError):
+                cache.download()
+            assert not cache.is_cached()
+            assert cache.partial_download_file.stat().st_size == 100000
+            server.truncate = None
+            # The checksum is computed as the file is downloaded.
+            with mock.patch("stdpopsim.utils.sha256", autospec=True) as mocked:
+                cache.download()
+            mocked.assert_not_called()
+        assert cache.is_valid()
+        with open(cache.cache_path, "rb") as f:
+            assert f.read() == data
+        assert not cache.partial_download_file.exists()
+        assert server.requests[1]["Range"] == "bytes=100000-"
+
+    def test_streaming_extraction(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=server.url("/test.tgz"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                extract=True,
+            )
+            # The tarball is neither written to disk nor read a second time.
+            with mock.patch(
+                "stdpopsim.utils.download", autospec=True
+            ) as mocked_download, mock.patch(
+                "stdpopsim.utils.sha256", autospec=True
+            ) as mocked_sha256:
+                cache.download()
+            mocked_download.assert_not_called()
+            mocked_sha256.assert_not_called()
+        assert cache.is_valid()
+        assert (cache.cache_path / "test.foo").exists()
+        assert not cache.partial_download_file.exists()
+
+    def test_streaming_extraction_bad_checksum(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=server.url("/test.tgz"),
+                sha256="1234",
+                extract=True,
+            )
+            with pytest.raises(ValueError):
                 cache.download()
+        assert not cache.is_cached()
+        # Nothing is left behind in the cache.
+        cache_dir = stdpopsim.get_cache_dir()
+        assert os.listdir(cache_dir) == ["locks"]
+
+    def test_streaming_extraction_interrupted(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=server.url("/test.tgz"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                extract=True,
+            )
+            server.truncate = 100000
+            with pytest.raises((ConnectionError, tarfile.TarError)):
+                cache.download()
+            assert not cache.is_cached()
+            server.truncate = None
+            cache.download()
+        assert cache.is_valid()
+
+    def make_multi_file_tarball(self, tmpdir):
+        with utils.cd(tmpdir):
+            os.mkdir("subdir")
+            for name in ["a.txt", "b.txt", "subdir/c.txt"]:
+                with open(name, "wb") as f:
+                    f.write(name.encode() * 1000)
+            with tarfile.open("test.tgz", "w:gz") as tf:
+                tf.add("a.txt")
+                tf.add("b.txt")
+                tf.add("subdir")
+            with open("test.tgz", "rb") as f:
+                return f.read()
+
+    def test_extract_on_demand(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_multi_file_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test/on_demand",
+                url=server.url("/test.tgz"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                extract=True,
+                extract_on_demand=True,
+            )
+            cache.download()
+        assert cache.is_valid()
+        assert cache.archive_file.exists()
+        for name in ["a.txt", "b.txt", "subdir/c.txt"]:
+            assert not (cache.cache_path / name).exists()
+        path = cache.get_member("subdir/c.txt")
+        assert path == cache.cache_path / "subdir" / "c.txt"
+        with open(path, "rb") as f:
+            assert f.read() == b"subdir/c.txt" * 1000
+        # Only the requested file is extracted.
+        assert not (cache.cache_path / "a.txt").exists()
+        assert not (cache.cache_path / "b.txt").exists()
+        assert cache.get_member("d.txt") is None
+        # Files that were already extracted are not extracted again.
+        with mock.patch("stdpopsim.utils.extract_zip_member", autospec=True) as mocked:
+            assert cache.get_member("subdir/c.txt") == path
+        mocked.assert_not_called()
+
+    def test_extract_on_demand_bad_checksum(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_multi_file_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test/on_demand",
+                url=server.url("/test.tgz"),
+                sha256="1234",
+                extract=True,
+                extract_on_demand=True,
+            )
+            with pytest.raises(ValueError):
+                cache.download()
+        assert not cache.is_cached()
+        assert cache.get_member("a.txt") is None
+
+    def test_extract_on_demand_extracted_cache(self):
+        # Files in a cache that was fully extracted by an earlier version
+        # are still found.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_multi_file_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test/on_demand",
+                url=server.url("/test.tgz"),
+                sha256=hashlib.sha256(data).hexdigest(),
+                extract=True,
+            )
+            cache.download()
+        cache = attr.evolve(cache, extract_on_demand=True)
+        assert cache.is_valid()
+        assert not cache.archive_file.exists()
+        assert cache.get_member("b.txt") == cache.cache_path / "b.txt"
+        assert cache.get_member("d.txt") is None
+
+    def test_bad_checksum(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = self.make_tarball(tmpdir)
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=server.url("/test.tgz"),
+                sha256="1234",
+                extract=False,
+            )
+            with pytest.raises(ValueError):
+                cache.download()
+        # The bad download is not resumed next time.
+        assert not cache.partial_download_file.exists()
+        assert not cache.is_cached()
+
+
+class TestLayeredCache(tests.CacheWritingTest):
+    """
+    Tests for a read-only cache directory layered under a writable one.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.read_only_dir = pathlib.Path(self.tmp_cache_dir.name) / "read_only"
+        self.writable_dir = pathlib.Path(self.tmp_cache_dir.name) / "writable"
+        with utils.cd(self.tmp_cache_dir.name):
+            for name in ["a.txt", "b.txt"]:
+                with open(name, "wb") as f:
+                    f.write(name.encode() * 1000)
+            with tarfile.open("test.tgz", "w:gz") as tf:
+                tf.add("a.txt")
+                tf.add("b.txt")
+        tarball = pathlib.Path(self.tmp_cache_dir.name) / "test.tgz"
+        self.cache = stdpopsim.CachedData(
+            namespace="test/layered",
+            url=tarball.resolve().as_uri(),
+            sha256=utils.sha256(tarball),
+            extract=True,
+            extract_on_demand=True,
+        )
+        # Populate the read-only directory.
+        stdpopsim.set_cache_dir(self.read_only_dir)
+        self.cache.download()
+        stdpopsim.set_cache_dir([self.read_only_dir, self.writable_dir])
+        # We may be running as root, which can write to any directory.
+        read_only_dir = self.read_only_dir.absolute()
+        self.is_writable_patch = mock.patch(
+            "stdpopsim.cache._is_writable",
+            side_effect=lambda path: read_only_dir
+            not in [
+                pathlib.Path(path).absolute(),
+                *pathlib.Path(path).absolute().parents,
+            ],
+        )
+        self.is_writable_patch.start()
+
+    def tearDown(self):
+        self.is_writable_patch.stop()
+        super().tearDown()
+
+    def test_set_cache_dir(self):
+        for cache_dir in [
+            f"{self.read_only_dir}{os.pathsep}{self.writable_dir}",
+            [str(self.read_only_dir), self.writable_dir],
+        ]:
+            stdpopsim.set_cache_dir(cache_dir)
+            assert stdpopsim.get_cache_dirs() == [self.read_only_dir, self.writable_dir]
+            assert stdpopsim.get_cache_dir() == self.writable_dir
+
+    def test_environment_var(self):
+        cache_dir = f"{self.writable_dir}{os.pathsep}{self.read_only_dir}"
+        with mock.patch.dict(os.environ, {"STDPOPSIM_CACHE": cache_dir}):
+            stdpopsim.set_cache_dir()
+        assert stdpopsim.get_cache_dirs() == [self.writable_dir, self.read_only_dir]
+        assert stdpopsim.get_cache_dir() == self.writable_dir
+
+    def test_no_cache_dir(self):
+        with pytest.raises(ValueError):
+            stdpopsim.set_cache_dir(os.pathsep)
+
+    def test_read_only(self):
+        assert self.cache.is_valid()
+        assert self.cache.cache_path == self.read_only_dir / "test" / "layered"
+        assert self.cache.sha256_file.parent == self.cache.cache_path
+        # Files are extracted to the writable directory.
+        path = self.cache.get_member("a.txt")
+        assert self.writable_dir in path.parents
+        assert path == self.cache.derived_path / "a.txt"
+        with open(path, "rb") as f:
+            assert f.read() == b"a.txt" * 1000
+        assert not (self.cache.cache_path / "a.txt").exists()
+        assert self.cache.get_member("a.txt") == path
+        assert self.cache.get_member("c.txt") is None
+
+    def test_download_to_writable(self):
+        assert self.cache.lock_file.parent.parent == self.writable_dir
+        assert self.cache.partial_download_file.parent.parent == self.writable_dir
+        self.cache.download()
+        assert self.cache.is_valid()
+        assert (self.writable_dir / "test" / "layered" / "_archive.zip").exists()
+        # The directories are searched in order.
+        assert self.cache.cache_path == self.read_only_dir / "test" / "layered"
+        stdpopsim.set_cache_dir([self.writable_dir, self.read_only_dir])
+        assert self.cache.cache_path == self.writable_dir / "test" / "layered"
+        assert self.cache.derived_path == self.cache.cache_path
+
+    def test_outdated_read_only(self):
+        # The data in the read-only directory doesn't match the checksum.
+        with open(self.cache.sha256_file, "w") as f:
+            print("1234", file=f)
+        assert not self.cache.is_valid()
+        assert self.cache.cache_path == self.writable_dir / "test" / "layered"
+        self.cache.download()
+        assert self.cache.is_valid()
+        assert self.cache.cache_path == self.writable_dir / "test" / "layered"
+        path = self.cache.get_member("b.txt")
+        assert path == self.cache.cache_path / "b.txt"
+
+    def test_list_derived(self):
+        self.cache.get_member("a.txt")
+        entries = stdpopsim.list_cache()
+        assert len(entries) == 1
+        assert entries[0].kind == "derived"
+        assert entries[0].path == self.cache.derived_path
+        assert entries[0].lock_file == self.cache.lock_file
+        assert len(stdpopsim.evict_cache(max_size=0)) == 1
+        assert not self.cache.derived_path.exists()
+        assert self.cache.is_valid()
+
+
+def download_if_needed(cache_dir, url, sha256):
+    stdpopsim.set_cache_dir(cache_dir)
+    cache = stdpopsim.CachedData(
+        namespace="test/lock", url=url, sha256=sha256, extract=True
+    )
+    if not cache.is_valid():
+        cache.download()
+    return cache.is_valid()
+
+
+class TestCachedDataLocking(tests.CacheWritingTest):
+    """
+    Tests that only one process downloads the data at a time.
+    """
+
+    def test_multiple_processes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data = TestCachedDataHTTP().make_tarball(tmpdir)
+        sha256 = hashlib.sha256(data).hexdigest()
+        num_processes = 6
+        with tests.LocalHTTPServer({"/test.tgz": data}) as server:
+            server.delay = 0.5
+            url = server.url("/test.tgz")
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(num_processes) as pool:
+                results = pool.starmap(
+                    download_if_needed,
+                    [(self.tmp_cache_dir.name, url, sha256)] * num_processes,
+                )
+        assert results == [True] * num_processes
+        assert len(server.requests) == 1
+
+    def test_waiting_process_downloads_if_invalid(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tar = pathlib.Path(tmpdir) / "test.tgz"
+            with open(tar, "wb") as f:
+                f.write(TestCachedDataHTTP().make_tarball(tmpdir))
+            cache = stdpopsim.CachedData(
+                namespace="test",
+                url=tar.resolve().as_uri(),
+                sha256=utils.sha256(tar),
+                extract=True,
+            )
+            lock = stdpopsim.FileLock(cache.lock_file)
+            lock.acquire()
+            thread = threading.Thread(target=cache.download)
+            thread.start()
+            time.sleep(0.3)
+            assert thread.is_alive()
+            lock.release()
+            thread.join()
+        assert cache.is_valid()
+
+    def test_timeout(self):
+        cache = stdpopsim.CachedData(
+            namespace="test", url="http://example.com/x.tgz", sha256="1", extract=True
+        )
+        with stdpopsim.FileLock(cache.lock_file):
+            with pytest.raises(TimeoutError):
+                cache.download(lock_timeout=0.2)
+
+
+class TestFileLock:
+    """
+    Tests for the cross-process file lock.
+    """
+
+    def test_acquire_release(self, tmp_path):
+        path = tmp_path / "sub" / "test.lock"
+        lock = stdpopsim.FileLock(path)
+        with lock:
+            assert path.exists()
+            assert not lock.waited
+            with open(path) as f:
+                host, pid = f.read().split()
+            assert host == socket.gethostname()
+            assert int(pid) == os.getpid()
+        assert not path.exists()
+
+    def test_timeout(self, tmp_path):
+        path = tmp_path / "test.lock"
+        with stdpopsim.FileLock(path):
+            lock = stdpopsim.FileLock(path, timeout=0.2)
+            with pytest.raises(TimeoutError):
+                lock.acquire()
+        assert not path.exists()
+
+    def test_wait(self, tmp_path):
+        path = tmp_path / "test.lock"
+        lock1 = stdpopsim.FileLock(path)
+        lock1.acquire()
+        timer = threading.Timer(0.3, lock1.release)
+        timer.start()
+        lock2 = stdpopsim.FileLock(path, timeout=10)
+        with lock2:
+            assert lock2.waited
+        timer.join()
+
+    def test_stale_dead_process(self, tmp_path):
+        path = tmp_path / "test.lock"
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        with open(path, "w") as f:
+            print(socket.gethostname(), proc.pid, file=f)
+        with stdpopsim.FileLock(path, timeout=5):
+            with open(path) as f:
+                assert int(f.read().split()[1]) == os.getpid()
+
+    def test_stale_old(self, tmp_path):
+        path = tmp_path / "test.lock"
+        with open(path, "w") as f:
+            print("some-other-host 1234", file=f)
+        lock = stdpopsim.FileLock(path, timeout=0.2, stale_after=60)
+        with pytest.raises(TimeoutError):
+            lock.acquire()
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        with lock:
+            assert not lock.waited
+
+    def test_break(self, tmp_path):
+        path = tmp_path / "test.lock"
+        with open(path, "w") as f:
+            print("some-other-host 1234", file=f)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        lock = stdpopsim.FileLock(path, stale_after=60)
+        state = lock._read_state(path)
+        assert lock._is_stale(state)
+        lock._break(state)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_break_replaced(self, tmp_path):
+        # The stale lock is replaced by a live one after it was inspected, and
+        # before it is broken.
+        path = tmp_path / "test.lock"
+        with open(path, "w") as f:
+            print("some-other-host 1234", file=f)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        lock = stdpopsim.FileLock(path, stale_after=60)
+        state = lock._read_state(path)
+        assert lock._is_stale(state)
+        os.unlink(path)
+        with stdpopsim.FileLock(path) as holder:
+            lock._break(state)
+            assert list(tmp_path.iterdir()) == [path]
+            assert lock._read_owner() == holder._owner
+        assert not path.exists()
+
+    def test_break_refreshed(self, tmp_path):
+        # The lock is refreshed by its holder after it was inspected.
+        path = tmp_path / "test.lock"
+        with open(path, "w") as f:
+            print("some-other-host 1234", file=f)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        lock = stdpopsim.FileLock(path, stale_after=60)
+        state = lock._read_state(path)
+        os.utime(path)
+        lock._break(state)
+        assert list(tmp_path.iterdir()) == [path]
+        assert not lock._is_stale(lock._read_state(path))
+
+    def test_heartbeat(self, tmp_path):
+        path = tmp_path / "test.lock"
+        with stdpopsim.FileLock(path, stale_after=0.4):
+            os.utime(path, (0, 0))
+            time.sleep(0.3)
+            assert time.time() - os.path.getmtime(path) < 0.4
+            lock = stdpopsim.FileLock(path, timeout=0.5, stale_after=0.4)
+            with pytest.raises(TimeoutError):
+                lock.acquire()
+
+
+class TestCacheManagement(tests.CacheWritingTest):
+    """
+    Tests for listing, verifying and evicting the data stored in the cache.
+    """
+
+    def setUp(self):
+        super().setUp()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with utils.cd(tmpdir):
+                with open("chr1.txt", "wb") as f:
+                    f.write(os.urandom(100000))
+                with tarfile.open("map.tgz", "w:gz") as tf:
+                    tf.add("chr1.txt")
+                with open("map.tgz", "rb") as f:
+                    map_data = f.read()
+        self.annotation_data = os.urandom(20000)
+        files = {"/map.tgz": map_data, "/annotation.zarr.zip": self.annotation_data}
+        with tests.LocalHTTPServer(files) as server:
+            self.map_cache = stdpopsim.CachedData(
+                namespace="genetic_maps/TesSpe/test_map",
+                url=server.url("/map.tgz"),
+                sha256=hashlib.sha256(map_data).hexdigest(),
+                extract=True,
+                extract_on_demand=True,
+            )
+            self.map_cache.download()
+            self.annotation_cache = stdpopsim.CachedData(
+                namespace="annotations/TesSpe",
+                url=server.url("/annotation.zarr.zip"),
+                sha256=hashlib.sha256(self.annotation_data).hexdigest(),
+                extract=False,
+            )
+            self.annotation_cache.download()
+        self.map_cache.get_member("chr1.txt")
+        self.compiled_map_dir = self.map_cache.cache_path / "compiled_1234"
+        self.compiled_map_dir.mkdir()
+        with open(self.compiled_map_dir / "chr1.position.npy", "wb") as f:
+            f.write(bytes(5000))
+
+    def set_last_access(self, path, last_access):
+        paths = [path]
+        if path.is_dir():
+            paths = [p for p in path.glob("**/*") if p.is_file()]
+        for p in paths:
+            os.utime(p, (last_access, last_access))
+
+    def entries(self):
+        return {entry.name: entry for entry in stdpopsim.list_cache()}
+
+    def test_list(self):
+        entries = self.entries()
+        assert set(entries.keys()) == {
+            "annotations/TesSpe/annotation.zarr.zip",
+            "genetic_maps/TesSpe/test_map",
+            "genetic_maps/TesSpe/test_map/compiled_1234",
+        }
+        annotation = entries["annotations/TesSpe/annotation.zarr.zip"]
+        assert annotation.kind == "annotation"
+        assert annotation.path == self.annotation_cache.cache_path
+        assert annotation.size == 20000
+        genetic_map = entries["genetic_maps/TesSpe/test_map"]
+        assert genetic_map.kind == "genetic_map"
+        # The compiled maps are not included in the size of the map.
+        expected_size = sum(
+            os.path.getsize(self.map_cache.cache_path / name)
+            for name in ["chr1.txt", "_archive.zip", "map.tgz.sha256"]
+        )
+        assert genetic_map.size == expected_size
+        compiled_map = entries["genetic_maps/TesSpe/test_map/compiled_1234"]
+        assert compiled_map.kind == "compiled_map"
+        assert compiled_map.size == 5000
+        assert compiled_map.lock_file == self.map_cache.lock_file
+        assert genetic_map.lock_file == self.map_cache.lock_file
+        assert annotation.lock_file == self.annotation_cache.lock_file
+        for entry in entries.values():
+            # The data are not in the catalog.
+            assert entry.cached_data is None
+
+    def test_list_last_access(self):
+        self.set_last_access(self.map_cache.cache_path, 1000)
+        self.set_last_access(self.compiled_map_dir, 2000)
+        entries = self.entries()
+        assert entries["genetic_maps/TesSpe/test_map/compiled_1234"].last_access == 2000
+        # Using the compiled maps counts as using the genetic map.
+        assert entries["genetic_maps/TesSpe/test_map"].last_access == 2000
+
+    def test_list_partial_download(self):
+        partial_file = stdpopsim.get_cache_dir() / "downloads" / "1234.part"
+        partial_file.parent.mkdir(exist_ok=True)
+        with open(partial_file, "wb") as f:
+            f.write(bytes(100))
+        entry = self.entries()["downloads/1234.part"]
+        assert entry.kind == "partial_download"
+        assert entry.size == 100
+
+    def test_list_catalog(self):
+        with mock.patch(
+            "stdpopsim.cache._catalog_cached_data",
+            return_value={self.annotation_cache.cache_path: self.annotation_cache},
+        ):
+            entries = self.entries()
+        entry = entries["annotations/TesSpe/annotation.zarr.zip"]
+        assert entry.cached_data is self.annotation_cache
+
+    def test_list_no_cache_dir(self):
+        stdpopsim.set_cache_dir(pathlib.Path(self.tmp_cache_dir.name) / "nonexistent")
+        assert stdpopsim.list_cache() == []
+
+    def test_verify(self):
+        results = stdpopsim.verify_cache()
+        assert len(results) == 3
+        for _, problem in results:
+            assert problem is None
+
+    def test_verify_corrupted_file(self):
+        with open(self.annotation_cache.cache_path, "r+b") as f:
+            f.write(b"x")
+        problems = {entry.name: problem for entry, problem in stdpopsim.verify_cache()}
+        assert problems["annotations/TesSpe/annotation.zarr.zip"] is not None
+        assert problems["genetic_maps/TesSpe/test_map"] is None
+
+    def test_verify_corrupted_archive(self):
+        archive_file = self.map_cache.archive_file
+        size = os.path.getsize(archive_file)
+        with open(archive_file, "r+b") as f:
+            f.seek(size // 2)
+            byte = f.read(1)
+            f.seek(size // 2)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        problems = {entry.name: problem for entry, problem in stdpopsim.verify_cache()}
+        assert "chr1.txt" in problems["genetic_maps/TesSpe/test_map"]
+
+    def test_verify_outdated(self):
+        outdated = attr.evolve(self.annotation_cache, sha256="1234")
+        with mock.patch(
+            "stdpopsim.cache._catalog_cached_data",
+            return_value={outdated.cache_path: outdated},
+        ):
+            results = stdpopsim.verify_cache(num_threads=1)
+        problems = {entry.name: problem for entry, problem in results}
+        assert problems["annotations/TesSpe/annotation.zarr.zip"] is not None
+
+    def test_evict_max_size(self):
+        self.set_last_access(self.annotation_cache.cache_path, 1000)
+        self.set_last_access(self.map_cache.cache_path, 2000)
+        entries = self.entries()
+        total_size = sum(entry.size for entry in entries.values())
+        removed = stdpopsim.evict_cache(max_size=total_size - 1)
+        assert [entry.name for entry in removed] == [
+            "annotations/TesSpe/annotation.zarr.zip"
+        ]
+        assert not self.annotation_cache.is_cached()
+        assert not self.annotation_cache.sha256_file.exists()
+        assert self.map_cache.is_valid()
+        removed = stdpopsim.evict_cache(max_size=0)
+        assert len(removed) == 2
+        assert stdpopsim.list_cache() == []
+        assert not self.map_cache.is_cached()
+
+    def test_evict_max_age(self):
+        now = time.time()
+        self.set_last_access(self.annotation_cache.cache_path, now - 1000)
+        self.set_last_access(self.map_cache.cache_path, now - 10)
+        removed = stdpopsim.evict_cache(max_age=100)
+        assert [entry.name for entry in removed] == [
+            "annotations/TesSpe/annotation.zarr.zip"
+        ]
+        assert self.map_cache.is_valid()
+
+    def test_evict_dry_run(self):
+        removed = stdpopsim.evict_cache(max_size=0, dry_run=True)
+        assert len(removed) == 3
+        assert len(stdpopsim.list_cache()) == 3
+        assert self.map_cache.is_valid()
+        assert self.annotation_cache.is_valid()
+
+    def test_evict_locked(self):
+        # Data being downloaded by another process are not removed.
+        with stdpopsim.FileLock(self.map_cache.lock_file):
+            removed = stdpopsim.evict_cache(max_size=0)
+        assert [entry.name for entry in removed] == [
+            "annotations/TesSpe/annotation.zarr.zip"
+        ]
+        assert self.map_cache.is_valid()
+
+    def test_evict_partial_download(self):
+        partial_file = stdpopsim.get_cache_dir() / "downloads" / "1234.part"
+        partial_file.parent.mkdir(exist_ok=True)
+        with open(partial_file, "wb") as f:
+            f.write(bytes(100))
+        # A download that might still be in progress is not removed.
+        stdpopsim.evict_cache(max_size=0)
+        assert partial_file.exists()
+        self.set_last_access(partial_file, time.time() - 3600)
+        removed = stdpopsim.evict_cache(max_size=0)
+        assert [entry.name for entry in removed] == ["downloads/1234.part"]
+        assert not partial_file.exists()
+
+    def test_evict_concurrent_reader(self):
+        map_file = self.map_cache.get_member("chr1.txt")
+        with open(map_file, "rb") as f:
+            data = f.read(10)
+            stdpopsim.evict_cache(max_size=0)
+            assert not map_file.exists()
+            if os.name == "posix":
+                # Open files can still be read after they are removed.
+                data += f.read()
+                assert len(data) == 100000
+        # The data are downloaded again when they are next used.
+        assert not self.map_cache.is_valid()
+        assert self.map_cache.get_member("chr1.txt") is None
+
+
+class TestMemoryCache:
+    """
+    Tests for the in-memory LRU cache.
+    """
+
+    def test_get(self):
+        cache = stdpopsim.MemoryCache(max_size=100)
+        calls = []
+
+        def build():
+            calls.append(1)
+            return "value"
+
+        assert cache.get("a", build, size=lambda x: 1) == "value"
+        assert cache.get("a", build, size=lambda x: 1) == "value"
+        assert len(calls) == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+        assert cache.size == 1
+        assert len(cache) == 1
+
+    def test_lru_eviction(self):
+        cache = stdpopsim.MemoryCache(max_size=3)
+        for key in "abc":
+            cache.get(key, lambda: key, size=lambda x: 1)
+        # Use "a", so "b" is the least recently used.
+        cache.get("a", lambda: None, size=lambda x: 1)
+        cache.get("d", lambda: "d", size=lambda x: 1)
+        assert len(cache) == 3
+        assert cache.size == 3
+        assert cache.get("b", lambda: "new b", size=lambda x: 1) == "new b"
+        assert cache.get("a", lambda: "new a", size=lambda x: 1) == "a"
+
+    def test_too_big(self):
+        cache = stdpopsim.MemoryCache(max_size=10)
+        assert cache.get("a", lambda: "a", size=lambda x: 11) == "a"
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_resize(self):
+        cache = stdpopsim.MemoryCache(max_size=10)
+        for key in "abcde":
+            cache.get(key, lambda: key, size=lambda x: 2)
+        assert cache.size == 10
+        cache.resize(5)
+        assert cache.size == 4
+        assert len(cache) == 2
+        cache.resize(0)
+        assert len(cache) == 0
+        cache.get("a", lambda: "a", size=lambda x: 1)
+        assert len(cache) == 0
+
+    def test_clear(self):
+        cache = stdpopsim.MemoryCache(max_size=10)
+        cache.get("a", lambda: "a", size=lambda x: 1)
+        cache.get("a", lambda: "a", size=lambda x: 1)
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.size == 0
+        assert cache.hits == 0
+        assert cache.misses == 0
+
+    def test_warnings_not_recorded(self):
+        cache = stdpopsim.MemoryCache(max_size=10)
+
+        def build():
+            warnings.warn("foo")
+            return "a"
+
+        with pytest.warns(UserWarning, match="foo"):
+            cache.get("a", build, size=lambda x: 1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            assert cache.get("a", build, size=lambda x: 1) == "a"
+
+    def test_global_cache(self):
+        cache = stdpopsim.get_memory_cache()
+        saved_max_size = cache.max_size
+        try:
+            stdpopsim.set_memory_cache_size(1234)
+            assert cache.max_size == 1234
+            stdpopsim.clear_memory_cache()
+            assert len(cache) == 0
+        finally:
+            stdpopsim.set_memory_cache_size(saved_max_size)
@@ -8,6 +8,8 @@ import subprocess
 import json
 import sys
 import io
+import gzip
+import shutil
 import argparse  # NOQA
 import os
 import logging
@@ -21,6 +23,8 @@ import pytest
 
 import stdpopsim
 import stdpopsim.cli as cli
+from stdpopsim import utils
+import tests
 
 
 class ExceptionForTesting(Exception):
@@ -85,6 +89,38 @@ class TestProvenance(unittest.TestCase):
         self.assertEqual(d["command"], sys.argv[0])
         self.assertEqual(d["args"], sys.argv[1:])
 
+    def test_engine_without_provenance(self):
+        # Engines whose simulate() doesn't take a provenance argument are
+        # still supported, with the provenance added as the output is written.
+        class NoProvenanceEngine(stdpopsim.Engine):
+            id = "no_provenance_engine"
+            description = "test engine"
+            citations = []
+
+            def simulate(self, demographic_model, contig, samples, seed=None):
+                return stdpopsim.get_engine("msprime").simulate(
+                    demographic_model, contig, samples, seed=seed
+                )
+
+            def get_version(self):
+                return "1.0"
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mask_file = pathlib.Path(tmpdir) / "mask.bed"
+            mask_file.write_text("Chromosome\t1000\t2000\nChromosome\t3000\t4000\n")
+            output_file = pathlib.Path(tmpdir) / "out.trees"
+            cmd = (
+                f"-q -e no_provenance_engine EscCol -c Chromosome "
+                f"--exclusion-mask {mask_file} -o {output_file} -s 1 2"
+            )
+            with mock.patch("stdpopsim.cli.setup_logging", autospec=True):
+                with mock.patch.dict(stdpopsim.engines._registered_engines):
+                    stdpopsim.register_engine(NoProvenanceEngine())
+                    capture_output(cli.stdpopsim_main, cmd.split())
+            ts = tskit.load(str(output_file))
+        record = json.loads(ts.provenance(ts.num_provenances - 1).record)
+        self.assertEqual(record["software"]["name"], "stdpopsim")
+
 
 class TestDownloadGeneticMapsArgumentParser(unittest.TestCase):
     """
@@ -119,6 +155,20 @@ class TestDownloadGeneticMapsArgumentParser(unittest.TestCase):
         self.assertEqual(args.species, "some_species")
         self.assertEqual(args.genetic_maps, ["map1", "map2"])
 
+    def test_precompile(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["download-genetic-maps"])
+        self.assertFalse(args.precompile)
+        args = parser.parse_args(["download-genetic-maps", "--precompile"])
+        self.assertTrue(args.precompile)
+
+    def test_num_threads(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["download-genetic-maps"])
+        self.assertEqual(args.num_threads, 4)
+        args = parser.parse_args(["download-genetic-maps", "--num-threads", "2"])
+        self.assertEqual(args.num_threads, 2)
+
     def test_verbosity(self):
         parser = cli.stdpopsim_cli_parser()
         cmd = "download-genetic-maps"
@@ -190,6 +240,19 @@ class TestHomoSapiensArgumentParser(unittest.TestCase):
         self.assertEqual(args.samples, [2])
         self.assertEqual(args.cache_dir, "/some/cache_dir")
 
+    def test_region(self):
+        parser = cli.stdpopsim_cli_parser()
+        cmd = "HomSap"
+        args = parser.parse_args([cmd, "2"])
+        self.assertEqual(args.left, None)
+        self.assertEqual(args.right, None)
+        args = parser.parse_args([cmd, "-c", "chr1", "--left", "1e6", "2"])
+        self.assertEqual(args.left, 1e6)
+        self.assertEqual(args.right, None)
+        args = parser.parse_args([cmd, "--right", "2000", "-c", "chr1", "2"])
+        self.assertEqual(args.left, None)
+        self.assertEqual(args.right, 2000)
+
     def test_bibtex(self):
         parser = cli.stdpopsim_cli_parser()
         cmd = "HomSap"
@@ -243,6 +306,10 @@ class TestEndToEnd(unittest.TestCase):
         cmd = "HomSap -c chr1 -l0.01 -d OutOfAfricaArchaicAdmixture_5R19 10"
         self.verify(cmd, num_samples=10)
 
+    def test_homsap_region(self):
+        cmd = "HomSap -c chr20 --left 1000000 --right 1100000 20"
+        self.verify(cmd, num_samples=20)
+
     def test_dromel_constant(self):
         cmd = "DroMel -c 2L -l0.001 4"
         self.verify(cmd, num_samples=4)
@@ -264,6 +331,106 @@ class TestEndToEnd(unittest.TestCase):
         self.verify(cmd, num_samples=2)
 
 
+class TestReplicates(unittest.TestCase):
+    """
+    Tests for simulating replicates from the CLI.
+    """
+
+    def run_replicates(self, cmd):
+        with mock.patch("stdpopsim.cli.setup_logging", autospec=True):
+            return capture_output(cli.stdpopsim_main, cmd.split())
+
+    def test_replicates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = pathlib.Path(tmpdir) / "rep{replicate}.trees"
+            cmd = (
+                f"-q HomSap -c chr22 -l 0.001 -o {output} -s 1 "
+                "--num-replicates 3 --num-workers 2 4"
+            )
+            self.run_replicates(cmd)
+            filenames = sorted(os.listdir(tmpdir))
+            self.assertEqual(filenames, [f"rep{j}.trees" for j in range(3)])
+            tables = []
+            for j, filename in enumerate(filenames):
+                ts = tskit.load(str(pathlib.Path(tmpdir) / filename))
+                self.assertEqual(ts.num_samples, 4)
+                provenance = json.loads(ts.provenance(ts.num_provenances - 1).record)
+                self.assertEqual(provenance["software"]["name"], "stdpopsim")
+                self.assertEqual(provenance["parameters"]["replicate"], j)
+                tables.append(ts.tables)
+            self.assertNotEqual(tables[0].edges, tables[1].edges)
+
+    def test_bad_output(self):
+        for output in ["", "-o out.trees"]:
+            cmd = f"HomSap -c chr22 -l 0.001 {output} --num-replicates 2 4"
+            with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+                mocked_exit.side_effect = ExceptionForTesting
+                with self.assertRaises(ExceptionForTesting):
+                    self.run_replicates(cmd)
+            mocked_exit.assert_called_once()
+
+    def test_parser(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["HomSap", "2"])
+        self.assertEqual(args.num_replicates, 1)
+        self.assertEqual(args.num_workers, 1)
+        args = parser.parse_args(
+            ["HomSap", "--num-replicates", "5", "--num-workers", "3", "2"]
+        )
+        self.assertEqual(args.num_replicates, 5)
+        self.assertEqual(args.num_workers, 3)
+
+
+class TestAllAutosomes(unittest.TestCase):
+    """
+    Tests for simulating all autosomes from the CLI.
+    """
+
+    def run_autosomes(self, cmd):
+        with mock.patch("stdpopsim.cli.setup_logging", autospec=True):
+            return capture_output(cli.stdpopsim_main, cmd.split())
+
+    def test_all_autosomes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = pathlib.Path(tmpdir) / "out"
+            cmd = f"-q EscCol --all-autosomes -o {output_dir} -s 2 2"
+            self.run_autosomes(cmd)
+            self.assertEqual(
+                sorted(os.listdir(output_dir)), ["Chromosome.trees", "manifest.json"]
+            )
+            with open(output_dir / "manifest.json") as f:
+                manifest = json.load(f)
+            self.assertEqual(manifest["species"], "EscCol")
+            self.assertEqual(manifest["seed"], 2)
+            ts = tskit.load(str(output_dir / "Chromosome.trees"))
+            self.assertEqual(ts.num_samples, 2)
+            provenance = json.loads(ts.provenance(ts.num_provenances - 1).record)
+            self.assertEqual(provenance["software"]["name"], "stdpopsim")
+
+    def test_bad_options(self):
+        for options in [
+            "",
+            "-o out -c Chromosome",
+            "-o out -l 0.1",
+            "-o out -L 1000",
+            "-o out --left 10",
+            "-o out --num-replicates 2",
+        ]:
+            cmd = f"EscCol --all-autosomes {options} 2"
+            with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+                mocked_exit.side_effect = ExceptionForTesting
+                with self.assertRaises(ExceptionForTesting):
+                    self.run_autosomes(cmd)
+            mocked_exit.assert_called_once()
+
+    def test_parser(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["HomSap", "2"])
+        self.assertFalse(args.all_autosomes)
+        args = parser.parse_args(["HomSap", "--all-autosomes", "2"])
+        self.assertTrue(args.all_autosomes)
+
+
 class TestEndToEndSubprocess(TestEndToEnd):
     """
     Run the commands in a subprocess so that we can verify the provenance is
@@ -295,11 +462,75 @@ class TestWriteOutput(unittest.TestCase):
         ts = msprime.simulate(10, random_seed=2)
         parser = cli.stdpopsim_cli_parser()
         args = parser.parse_args(["AraTha", "2"])
-        with mock.patch("shutil.copyfileobj", autospec=True) as mocked_copy:
-            with mock.patch("sys.stdout", autospec=True) as stdout:
-                stdout.buffer = open(os.devnull, "wb")
+        with mock.patch("sys.stdout", autospec=True) as stdout:
+            stdout.buffer = io.BytesIO()
+            cli.write_output(ts, args)
+        with tempfile.TemporaryFile() as f:
+            f.write(stdout.buffer.getvalue())
+            f.seek(0)
+            ts_out = tskit.load(f)
+        ts.tables.assert_equals(ts_out.tables)
+
+    def test_no_table_copy(self):
+        ts = msprime.simulate(10, random_seed=2)
+        parser = cli.stdpopsim_cli_parser()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_file = pathlib.Path(tmpdir) / "out.trees"
+            args = parser.parse_args(["HomSap", "2", "-o", str(output_file)])
+            with mock.patch(
+                "tskit.TreeSequence.dump_tables", autospec=True
+            ) as mocked_dump_tables:
                 cli.write_output(ts, args)
-                mocked_copy.assert_called_once()
+            mocked_dump_tables.assert_not_called()
+
+    def test_provenance(self):
+        ts = msprime.simulate(10, random_seed=2)
+        provenance = cli.get_provenance_dict()
+        parser = cli.stdpopsim_cli_parser()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_file = pathlib.Path(tmpdir) / "out.trees"
+            args = parser.parse_args(["HomSap", "2", "-o", str(output_file)])
+            with mock.patch(
+                "tskit.TableCollection.tree_sequence", autospec=True
+            ) as mocked_tree_sequence:
+                cli.write_output(ts, args, provenance=provenance)
+            mocked_tree_sequence.assert_not_called()
+            ts_out = tskit.load(str(output_file))
+        record = json.loads(ts_out.provenance(ts_out.num_provenances - 1).record)
+        self.assertEqual(record, provenance)
+        ts.tables.assert_equals(ts_out.tables, ignore_provenance=True)
+
+    def test_stdout_no_tempfile(self):
+        ts = msprime.simulate(10, random_seed=2)
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["AraTha", "2"])
+        with mock.patch("sys.stdout", autospec=True) as stdout:
+            stdout.buffer = io.BytesIO()
+            with mock.patch("tempfile.mkstemp", autospec=True) as mkstemp:
+                with mock.patch("tempfile.mkdtemp", autospec=True) as mkdtemp:
+                    cli.write_output(ts, args)
+            mkstemp.assert_not_called()
+            mkdtemp.assert_not_called()
+        self.assertGreater(len(stdout.buffer.getvalue()), 0)
+
+    def test_compress(self):
+        ts = msprime.simulate(10, random_seed=2)
+        parser = cli.stdpopsim_cli_parser()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_file = pathlib.Path(tmpdir) / "out.trees.gz"
+            args = parser.parse_args(["HomSap", "2", "-o", str(output_file)])
+            self.assertFalse(args.compress)
+            args = parser.parse_args(
+                ["HomSap", "2", "-o", str(output_file), "--compress"]
+            )
+            self.assertTrue(args.compress)
+            cli.write_output(ts, args)
+            uncompressed_file = pathlib.Path(tmpdir) / "out.trees"
+            with gzip.open(output_file) as f_in:
+                with open(uncompressed_file, "wb") as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            ts_out = tskit.load(str(uncompressed_file))
+        ts.tables.assert_equals(ts_out.tables, ignore_provenance=True)
 
     def test_to_file(self):
         ts = msprime.simulate(10, random_seed=2)
@@ -329,8 +560,10 @@ class TestRedirection(unittest.TestCase):
         with kastore.load(filename1) as store1, kastore.load(filename2) as store2:
             self.assertEqual(set(store1.keys()), set(store2.keys()))
 
-    def verify(self, cmd):
+    def verify(self, cmd, compress=False):
 
+        if compress:
+            cmd += " --compress"
         with tempfile.TemporaryDirectory() as tmpdir:
             filename1 = pathlib.Path(tmpdir) / "output1.trees"
             full_cmd = f"{sys.executable} -m stdpopsim {cmd} -o {filename1}"
@@ -354,6 +587,12 @@ class TestRedirection(unittest.TestCase):
                     stderr=subprocess.PIPE,
                 )
 
+            if compress:
+                for filename in [filename1, filename2]:
+                    with gzip.open(filename) as f:
+                        data = f.read()
+                    with open(filename, "wb") as f:
+                        f.write(data)
             self.verify_files(filename1, filename2)
 
     def test_quiet(self):
@@ -364,6 +603,10 @@ class TestRedirection(unittest.TestCase):
         cmd = "HomSap -s 3 10 -c chr20 -l 0.001"
         self.verify(cmd)
 
+    def test_compress(self):
+        cmd = "-q HomSap -s 4 10 -c chr20 -l 0.001"
+        self.verify(cmd, compress=True)
+
 
 class TestArgumentParsing(unittest.TestCase):
     """
@@ -582,6 +825,103 @@ class TestHelp(unittest.TestCase):
             self.run_stdpopsim(f"{species} --help-genetic-maps")
 
 
+class TestLazySpeciesParsers:
+    """
+    Tests that species subparsers are only built when they are needed.
+    """
+
+    def run_main(self, arg_list):
+        with pytest.raises(SystemExit):
+            cli.stdpopsim_main(arg_list)
+
+    def test_parsers_not_built(self):
+        with mock.patch(
+            "stdpopsim.cli.add_simulate_species_parser", autospec=True
+        ) as mocked:
+            cli.stdpopsim_cli_parser(species_ids=["HomSap"])
+        assert mocked.call_count == 1
+        assert mocked.call_args[0][1].id == "HomSap"
+
+    def test_parsed_species_ids(self):
+        assert cli.get_parsed_species_ids(["HomSap", "2"]) == ["HomSap"]
+        assert cli.get_parsed_species_ids(["-q", "HomSap", "-h"]) == ["HomSap"]
+        assert cli.get_parsed_species_ids(["--version"]) == []
+        assert cli.get_parsed_species_ids(["cache", "--help"]) == []
+        assert cli.get_parsed_species_ids(["download-genetic-maps"]) == []
+        assert cli.get_parsed_species_ids(["download-genetic-maps", "AraTha"]) == [
+            "AraTha"
+        ]
+        # The top-level help describes every species.
+        for help_option in ["-h", "--help", "--he"]:
+            assert cli.get_parsed_species_ids([help_option]) is None
+            assert cli.get_parsed_species_ids([help_option, "HomSap"]) is None
+
+    def test_top_level_help(self):
+        stdout, _ = capture_output(self.run_main, ["--help"])
+        for species in stdpopsim.all_species():
+            assert f"Run simulations for {species.name}." in stdout
+
+    def test_other_species_not_parsed(self):
+        parser = cli.stdpopsim_cli_parser(species_ids=["HomSap"])
+        args = parser.parse_args(["HomSap", "-c", "chr22", "-o", "out.trees", "2"])
+        assert args.species == "HomSap"
+        assert args.chromosome == "chr22"
+        assert args.output == "out.trees"
+        with mock.patch(
+            "argparse.ArgumentParser.exit",
+            side_effect=ExceptionForTesting,
+            autospec=True,
+        ):
+            with pytest.raises(ExceptionForTesting):
+                capture_output(parser.parse_args, ["AraTha", "2"])
+
+    def test_same_as_full_parser(self):
+        cmd = ["HomSap", "-d", "OutOfAfrica_3G09", "-g", "HapMapII_GRCh37", "2", "3"]
+        args1 = cli.stdpopsim_cli_parser(species_ids=["HomSap"]).parse_args(cmd)
+        args2 = cli.stdpopsim_cli_parser().parse_args(cmd)
+        vars1 = {k: v for k, v in vars(args1).items() if k != "runner"}
+        vars2 = {k: v for k, v in vars(args2).items() if k != "runner"}
+        assert vars1 == vars2
+
+    def test_bad_model_choice(self):
+        parser = cli.stdpopsim_cli_parser(species_ids=["HomSap"])
+        with mock.patch(
+            "argparse.ArgumentParser.exit",
+            side_effect=ExceptionForTesting,
+            autospec=True,
+        ):
+            with pytest.raises(ExceptionForTesting):
+                capture_output(parser.parse_args, ["HomSap", "-d", "XXX", "2"])
+
+    def test_version_does_not_load_catalog(self):
+        # Guards against regressions in startup time: printing the version
+        # must not load any species or build any demographic models.
+        code = (
+            "import sys; import stdpopsim.cli\n"
+            "try:\n"
+            "    stdpopsim.cli.stdpopsim_main(['--version'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "loaded = [m for m in sys.modules if m.startswith('stdpopsim.catalog.')]\n"
+            "assert loaded == ['stdpopsim.catalog.ensembl_info'], loaded\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+
+    def test_simulation_builds_only_requested_model(self):
+        code = (
+            "import sys; import stdpopsim.cli\n"
+            "stdpopsim.cli.stdpopsim_main(\n"
+            "    ['-q', 'HomSap', '-D', '-L', '1000', '-d', 'Africa_1T12', '2'])\n"
+            "loaded = [m for m in sys.modules if m.startswith('stdpopsim.catalog.')]\n"
+            "assert 'stdpopsim.catalog.HomSap' in loaded, loaded\n"
+            "assert 'stdpopsim.catalog.DroMel' not in loaded, loaded\n"
+            "species = stdpopsim.get_species('HomSap')\n"
+            "built = [model.id for model in species._demographic_models]\n"
+            "assert built == ['Africa_1T12'], built\n"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+
+
 class TestWriteBibtex(unittest.TestCase):
     """
     Test that citations are able to be converted to bibtex
@@ -734,6 +1074,122 @@ class TestCacheDir(unittest.TestCase):
         self.check_cache_dir_set(cmd, cache_dir)
 
 
+class TestCacheArgumentParser(unittest.TestCase):
+    """
+    Tests for the cache parser.
+    """
+
+    def test_list(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["cache", "list"])
+        self.assertEqual(args.runner, cli.run_cache_list)
+
+    def test_verify(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["cache", "verify"])
+        self.assertEqual(args.runner, cli.run_cache_verify)
+        self.assertEqual(args.num_threads, 4)
+        args = parser.parse_args(["cache", "verify", "--num-threads", "2"])
+        self.assertEqual(args.num_threads, 2)
+
+    def test_evict(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["cache", "evict", "--max-size", "10G"])
+        self.assertEqual(args.runner, cli.run_cache_evict)
+        self.assertEqual(args.max_size, 10 * 1024 ** 3)
+        self.assertIsNone(args.max_age)
+        self.assertFalse(args.dry_run)
+        args = parser.parse_args(["cache", "evict", "--max-age", "30", "--dry-run"])
+        self.assertIsNone(args.max_size)
+        self.assertEqual(args.max_age, 30)
+        self.assertTrue(args.dry_run)
+
+    def test_no_command(self):
+        parser = cli.stdpopsim_cli_parser()
+        with mock.patch("argparse.ArgumentParser.exit", side_effect=TypeError):
+            with self.assertRaises(TypeError):
+                parser.parse_args(["cache"])
+
+    def test_parse_size(self):
+        self.assertEqual(cli.parse_size("1000"), 1000)
+        self.assertEqual(cli.parse_size("2K"), 2048)
+        self.assertEqual(cli.parse_size("1.5M"), 1.5 * 1024 ** 2)
+        self.assertEqual(cli.parse_size("1GiB"), 1024 ** 3)
+        self.assertEqual(cli.parse_size("3t"), 3 * 1024 ** 4)
+        for bad in ["", "G", "1X", "1..2G", "-1"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                cli.parse_size(bad)
+
+
+class TestCache(tests.CacheWritingTest):
+    """
+    Tests for the cache subcommand.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = stdpopsim.get_cache_dir()
+        self.data_file = self.cache_dir / "annotations" / "TesSpe" / "test.zip"
+        self.data_file.parent.mkdir(parents=True)
+        with open(self.data_file, "wb") as f:
+            f.write(bytes(2000))
+        with open(f"{self.data_file}.sha256", "w") as f:
+            print(utils.sha256(self.data_file), file=f)
+
+    def run_cache(self, cmd):
+        with mock.patch("sys.stdout", new=io.StringIO()) as stdout:
+            cli.stdpopsim_main(["--cache-dir", str(self.cache_dir), "cache"] + cmd)
+        return stdout.getvalue()
+
+    def test_list(self):
+        output = self.run_cache(["list"])
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 2)
+        name, kind, size, _ = lines[0].split("\t")
+        self.assertEqual(name, "annotations/TesSpe/test.zip")
+        self.assertEqual(kind, "annotation")
+        self.assertEqual(size, "2.0 KiB")
+
+    def test_verify(self):
+        output = self.run_cache(["verify"])
+        self.assertEqual(output, "annotations/TesSpe/test.zip\tOK\n")
+
+    def test_verify_failed(self):
+        with open(self.data_file, "wb") as f:
+            f.write(bytes(1000))
+        with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+            output = self.run_cache(["verify"])
+        mocked_exit.assert_called_once()
+        self.assertIn("FAILED", output)
+
+    def test_verify_bad_num_threads(self):
+        with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+            mocked_exit.side_effect = ExceptionForTesting
+            with self.assertRaises(ExceptionForTesting):
+                self.run_cache(["verify", "--num-threads", "0"])
+        mocked_exit.assert_called_once()
+
+    def test_evict(self):
+        output = self.run_cache(["evict", "--max-size", "1K", "--dry-run"])
+        self.assertIn("Would remove 1 cache entries", output)
+        self.assertTrue(self.data_file.exists())
+        output = self.run_cache(["evict", "--max-size", "1K"])
+        self.assertIn("Removed 1 cache entries", output)
+        self.assertFalse(self.data_file.exists())
+
+    def test_evict_max_age(self):
+        output = self.run_cache(["evict", "--max-age", "1"])
+        self.assertIn("Removed 0 cache entries", output)
+        self.assertTrue(self.data_file.exists())
+
+    def test_evict_no_limit(self):
+        with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+            mocked_exit.side_effect = ExceptionForTesting
+            with self.assertRaises(ExceptionForTesting):
+                self.run_cache(["evict"])
+        mocked_exit.assert_called_once()
+
+
 class TestDownloadGeneticMaps(unittest.TestCase):
     """
     Tests for the download genetic maps function.
@@ -766,6 +1222,42 @@ class TestDownloadGeneticMaps(unittest.TestCase):
             args = " ".join(maps[: j + 1])
             self.run_download("HomSap " + args, j + 1)
 
+    def test_num_threads(self):
+        num_maps = sum(len(species.genetic_maps) for species in stdpopsim.all_species())
+        for num_threads in [1, 3]:
+            self.run_download(f"--num-threads {num_threads}", num_maps)
+
+    def test_bad_num_threads(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["download-genetic-maps", "--num-threads", "0"])
+        with mock.patch("stdpopsim.cli.exit", autospec=True) as mocked_exit:
+            mocked_exit.side_effect = ExceptionForTesting
+            with self.assertRaises(ExceptionForTesting):
+                cli.run_download_genetic_maps(args)
+        mocked_exit.assert_called_once()
+
+    def test_download_error(self):
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["download-genetic-maps", "HomSap"])
+        with mock.patch(
+            "stdpopsim.GeneticMap.download", autospec=True
+        ) as mocked_download:
+            mocked_download.side_effect = OSError("no network")
+            with self.assertRaises(OSError):
+                cli.run_download_genetic_maps(args)
+
+    def test_precompile(self):
+        species = stdpopsim.get_species("HomSap")
+        num_maps = len(species.genetic_maps)
+        parser = cli.stdpopsim_cli_parser()
+        args = parser.parse_args(["download-genetic-maps", "--precompile", "HomSap"])
+        with mock.patch("stdpopsim.GeneticMap.download", autospec=True):
+            with mock.patch(
+                "stdpopsim.GeneticMap.precompile", autospec=True
+            ) as mocked_precompile:
+                cli.run_download_genetic_maps(args)
+        self.assertEqual(mocked_precompile.call_count, num_maps)
+
 
 class TestSearchWrappers(unittest.TestCase):
     """
@@ -844,6 +1336,7 @@ class TestMsprimeEngine(unittest.TestCase):
             "--msprime-change-model 30 dtwf "
             "--msprime-change-model 40 hudson"
         )
+        self.docmd("--msprime-premask")
 
     def test_invalid_CLI_parameters(self):
         with self.assertRaises(SystemExit):
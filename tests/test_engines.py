@@ -1,10 +1,17 @@
 """
 Tests for simulation engine infrastructure.
 """
+import json
+import os
+import pathlib
+import tempfile
 import unittest
+from unittest import mock
 
 import stdpopsim
 import msprime
+import numpy as np
+import tskit
 
 
 class TestEngineAPI(unittest.TestCase):
@@ -90,6 +97,70 @@ class TestBehaviour(unittest.TestCase):
         )
         assert any(msprime.NODE_IS_RE_EVENT == sim_arg.tables.nodes.flags)
 
+    def test_msprime_premask(self):
+        species = stdpopsim.get_species("HomSap")
+        model = stdpopsim.PiecewiseConstantSize(1000)
+        samples = model.get_samples(4)
+        contig = species.get_contig(length=100000)
+        contig.mutation_rate = 1e-7
+        engine = stdpopsim.get_engine("msprime")
+        for inclusion_mask, exclusion_mask in [
+            (np.array([[20000, 30000], [60000, 70000]]), None),
+            (None, np.array([[0, 20000], [30000, 60000], [70000, 100000]])),
+        ]:
+            contig.inclusion_mask = inclusion_mask
+            contig.exclusion_mask = exclusion_mask
+            ts = engine.simulate(model, contig, samples, seed=1, msprime_premask=True)
+            self.assertEqual(ts.sequence_length, 100000)
+            self.assertGreater(ts.num_sites, 0)
+            for site in ts.sites():
+                self.assertTrue(
+                    20000 <= site.position < 30000 or 60000 <= site.position < 70000
+                )
+            # The masked regions are empty, as without premasking.
+            ts_postmask = engine.simulate(model, contig, samples, seed=1)
+            for tree_sequence in [ts, ts_postmask]:
+                for tree in tree_sequence.trees():
+                    left, right = tree.interval
+                    if right <= 20000 or 30000 <= left < 60000 or left >= 70000:
+                        self.assertEqual(tree.num_edges, 0)
+                    else:
+                        self.assertGreater(tree.num_edges, 0)
+
+    def test_msprime_premask_distribution(self):
+        # The diversity in the kept region should have the same distribution
+        # with and without premasking.
+        species = stdpopsim.get_species("HomSap")
+        model = stdpopsim.PiecewiseConstantSize(1000)
+        samples = model.get_samples(10)
+        contig = species.get_contig(length=10000)
+        contig.mutation_rate = 1e-6
+        contig.inclusion_mask = np.array([[4000, 6000]])
+        engine = stdpopsim.get_engine("msprime")
+        num_replicates = 200
+        num_sites = {}
+        for premask in [False, True]:
+            num_sites[premask] = np.array(
+                [
+                    ts.num_sites
+                    for ts in engine.simulate_replicates(
+                        model,
+                        contig,
+                        samples,
+                        num_replicates,
+                        seed=2,
+                        msprime_premask=premask,
+                    )
+                ]
+            )
+        # The expected number of segregating sites is
+        # 4 * N * mu * L * sum(1 / i for i in range(1, 20)) ~= 28.
+        mean = (num_sites[False].mean() + num_sites[True].mean()) / 2
+        self.assertGreater(mean, 20)
+        self.assertLess(mean, 36)
+        se = np.sqrt((num_sites[False].var() + num_sites[True].var()) / num_replicates)
+        self.assertLess(abs(num_sites[False].mean() - num_sites[True].mean()), 4 * se)
+
     def test_msprime_seed(self):
         species = stdpopsim.get_species("HomSap")
         model = species.get_demographic_model("AshkSub_7G19")
@@ -101,3 +172,451 @@ class TestBehaviour(unittest.TestCase):
         sim_seed = engine.simulate(model, contig, samples, seed=1)
         sim_random_seed = engine.simulate(model, contig, samples, random_seed=1)
         self.assertEquals(sim_seed.tables.edges, sim_random_seed.tables.edges)
+
+
+class SeedEngine(stdpopsim.Engine):
+    """
+    An engine whose "simulations" return the seed, for testing replicates.
+    """
+
+    id = "seed-engine"
+    description = "Seed engine"
+    citations = []
+
+    def simulate(self, demographic_model, contig, samples, *, seed=None):
+        return seed
+
+
+class TestSimulateReplicates(unittest.TestCase):
+    """
+    Tests for simulating replicates.
+    """
+
+    species = stdpopsim.get_species("HomSap")
+    model = stdpopsim.PiecewiseConstantSize(1000)
+    contig = species.get_contig("chr22", length_multiplier=0.001)
+    samples = model.get_samples(4)
+
+    def simulate_replicates(self, engine_id="msprime", **kwargs):
+        engine = stdpopsim.get_engine(engine_id)
+        return engine.simulate_replicates(
+            self.model, self.contig, self.samples, **kwargs
+        )
+
+    def assert_replicates_equal(self, replicates1, replicates2):
+        self.assertEqual(len(replicates1), len(replicates2))
+        for ts1, ts2 in zip(replicates1, replicates2):
+            ts1.tables.assert_equals(ts2.tables, ignore_provenance=True)
+
+    def test_replicates(self):
+        replicates = list(self.simulate_replicates(num_replicates=5, seed=1))
+        self.assertEqual(len(replicates), 5)
+        for ts in replicates:
+            self.assertIsInstance(ts, tskit.TreeSequence)
+            self.assertEqual(ts.num_samples, 4)
+            self.assertGreater(ts.num_sites, 0)
+        positions = {tuple(ts.tables.sites.position) for ts in replicates}
+        self.assertEqual(len(positions), 5)
+
+    def test_deterministic(self):
+        replicates1 = list(self.simulate_replicates(num_replicates=3, seed=2))
+        replicates2 = list(self.simulate_replicates(num_replicates=3, seed=2))
+        self.assert_replicates_equal(replicates1, replicates2)
+        replicates3 = list(self.simulate_replicates(num_replicates=3, seed=3))
+        self.assertNotEqual(replicates1[0].tables.edges, replicates3[0].tables.edges)
+
+    def test_num_workers(self):
+        for batch_size in [1, 2]:
+            replicates1 = list(
+                self.simulate_replicates(
+                    num_replicates=5, seed=4, batch_size=batch_size
+                )
+            )
+            replicates2 = list(
+                self.simulate_replicates(
+                    num_replicates=5, seed=4, batch_size=batch_size, num_workers=2
+                )
+            )
+            self.assert_replicates_equal(replicates1, replicates2)
+
+    def test_batches(self):
+        replicates = list(
+            self.simulate_replicates(num_replicates=5, seed=5, batch_size=3)
+        )
+        self.assertEqual(len(replicates), 5)
+        edges = {replicates[j].tables.edges.left.tobytes() for j in range(5)}
+        self.assertEqual(len(edges), 5)
+
+    def test_citations(self):
+        # The citations for the msprime model are added in this process, even
+        # if the replicates are simulated by workers.
+        engine = stdpopsim.engines._MsprimeEngine()
+        dtwf_citations = engine.model_citations["dtwf"]
+        for _ in range(2):
+            replicates = engine.simulate_replicates(
+                self.model,
+                self.contig,
+                self.samples,
+                num_replicates=2,
+                num_workers=2,
+                seed=6,
+                msprime_model="dtwf",
+            )
+            self.assertEqual(len(list(replicates)), 2)
+            self.assertEqual(
+                engine.citations,
+                stdpopsim.engines._MsprimeEngine.citations + dtwf_citations,
+            )
+        for citation in dtwf_citations:
+            self.assertNotIn(citation, stdpopsim.engines._MsprimeEngine.citations)
+
+    def test_default_batch_size(self):
+        engine = stdpopsim.get_engine("msprime")
+        self.assertEqual(engine._default_batch_size(1), 1)
+        self.assertEqual(engine._default_batch_size(199), 1)
+        self.assertEqual(engine._default_batch_size(1000), 10)
+        self.assertEqual(engine._default_batch_size(10 ** 6), 100)
+        self.assertEqual(stdpopsim.Engine()._default_batch_size(1000), 1)
+
+    def test_replicates_match_simulate(self):
+        # Each replicate is simulated as by simulate(), with the seed that is
+        # derived for the replicate.
+        engine = stdpopsim.get_engine("msprime")
+        replicates = list(
+            self.simulate_replicates(num_replicates=3, seed=6, batch_size=3)
+        )
+        seeds = stdpopsim.engines._replicate_seeds(6, 3)
+        self.assertEqual(len(set(seeds)), 3)
+        for ts, seed in zip(replicates, seeds):
+            self.assertNotEqual(seed, 6)
+            ts2 = engine.simulate(self.model, self.contig, self.samples, seed=seed)
+            ts.tables.assert_equals(ts2.tables, ignore_provenance=True)
+
+    def test_num_replicates(self):
+        # The replicates don't depend on the number of replicates, or on the
+        # batches they are simulated in.
+        replicates1 = list(self.simulate_replicates(num_replicates=2, seed=11))
+        for num_replicates, batch_size in [(3, None), (5, 2), (250, None)]:
+            replicates2 = self.simulate_replicates(
+                num_replicates=num_replicates, seed=11, batch_size=batch_size
+            )
+            replicates2 = [next(replicates2) for _ in range(2)]
+            self.assert_replicates_equal(replicates1, replicates2)
+
+    def test_replicate_seeds(self):
+        seeds = stdpopsim.engines._replicate_seeds(1, 100)
+        self.assertEqual(len(set(seeds)), 100)
+        self.assertEqual(seeds[:10], stdpopsim.engines._replicate_seeds(1, 10))
+        self.assertNotEqual(seeds[:10], stdpopsim.engines._replicate_seeds(2, 10))
+        for seed in seeds:
+            self.assertIsInstance(seed, int)
+            self.assertTrue(1 <= seed < 2 ** 31)
+
+    def test_output(self):
+        replicates = list(self.simulate_replicates(num_replicates=3, seed=7))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "rep_{replicate}.trees")
+            filenames = self.simulate_replicates(
+                num_replicates=3, seed=7, output=output, num_workers=2
+            )
+            self.assertEqual(filenames, [output.format(replicate=j) for j in range(3)])
+            self.assert_replicates_equal(
+                replicates, [tskit.load(filename) for filename in filenames]
+            )
+
+    def test_close_early(self):
+        replicates = self.simulate_replicates(
+            num_replicates=20, seed=8, num_workers=2, batch_size=1
+        )
+        ts = next(replicates)
+        self.assertIsInstance(ts, tskit.TreeSequence)
+        replicates.close()
+
+    def test_generic_engine(self):
+        engine = SeedEngine()
+        seeds1 = list(
+            engine.simulate_replicates(
+                self.model, self.contig, self.samples, num_replicates=10, seed=9
+            )
+        )
+        self.assertEqual(len(set(seeds1)), 10)
+        seeds2 = list(
+            engine.simulate_replicates(
+                self.model,
+                self.contig,
+                self.samples,
+                num_replicates=10,
+                seed=9,
+                num_workers=3,
+            )
+        )
+        self.assertEqual(seeds1, seeds2)
+
+    def test_kwargs(self):
+        (ts,) = self.simulate_replicates(
+            num_replicates=1, seed=10, record_full_arg=True
+        )
+        assert any(msprime.NODE_IS_RE_EVENT == ts.tables.nodes.flags)
+
+    def test_bad_arguments(self):
+        for kwargs in [
+            dict(num_replicates=0),
+            dict(num_replicates=2, num_workers=0),
+            dict(num_replicates=2, batch_size=0),
+            dict(num_replicates=2, output="no_template.trees"),
+        ]:
+            with self.assertRaises(ValueError):
+                self.simulate_replicates(**kwargs)
+
+
+class TestProvenance(unittest.TestCase):
+    """
+    Tests for the provenance records added by the engines.
+    """
+
+    species = stdpopsim.get_species("HomSap")
+    model = stdpopsim.PiecewiseConstantSize(1000)
+    samples = model.get_samples(4)
+    provenance = {"software": {"name": "test"}, "parameters": {"x": 1}}
+
+    def last_record(self, ts):
+        return json.loads(ts.provenance(ts.num_provenances - 1).record)
+
+    def test_simulate(self):
+        engine = stdpopsim.get_engine("msprime")
+        contig = self.species.get_contig("chr22", length_multiplier=0.001)
+        ts1 = engine.simulate(self.model, contig, self.samples, seed=1)
+        ts2 = engine.simulate(
+            self.model, contig, self.samples, seed=1, provenance=self.provenance
+        )
+        self.assertEqual(ts2.num_provenances, ts1.num_provenances + 1)
+        self.assertEqual(self.last_record(ts2), self.provenance)
+        ts1.tables.assert_equals(ts2.tables, ignore_provenance=True)
+
+    def test_simulate_masked(self):
+        engine = stdpopsim.get_engine("msprime")
+        contig = self.species.get_contig("chr22", length_multiplier=0.001)
+        contig.exclusion_mask = np.array([[1000, 20000]])
+        ts = engine.simulate(
+            self.model, contig, self.samples, seed=2, provenance=self.provenance
+        )
+        self.assertEqual(self.last_record(ts), self.provenance)
+        for site in ts.sites():
+            self.assertFalse(1000 <= site.position < 20000)
+
+    def test_simulate_replicates(self):
+        engine = stdpopsim.get_engine("msprime")
+        contig = self.species.get_contig("chr22", length_multiplier=0.0001)
+        replicates = engine.simulate_replicates(
+            self.model,
+            contig,
+            self.samples,
+            5,
+            seed=3,
+            batch_size=2,
+            provenance=self.provenance,
+        )
+        for j, ts in enumerate(replicates):
+            record = self.last_record(ts)
+            self.assertEqual(record["software"], self.provenance["software"])
+            self.assertEqual(record["parameters"], {"x": 1, "replicate": j})
+        # The record passed in is not modified.
+        self.assertEqual(self.provenance["parameters"], {"x": 1})
+
+    def test_records_provenance(self):
+        engine = stdpopsim.get_engine("msprime")
+        contig = self.species.get_contig("chr22", length_multiplier=0.001)
+        self.assertFalse(engine.records_provenance(contig))
+        contig.exclusion_mask = np.array([[1000, 20000]])
+        self.assertTrue(engine.records_provenance(contig))
+        engine = stdpopsim.get_engine("slim")
+        contig = self.species.get_contig("chr22", length_multiplier=0.001)
+        self.assertTrue(engine.records_provenance(contig))
+
+    def test_records_provenance_no_argument(self):
+        class NoProvenanceEngine(stdpopsim.Engine):
+            id = "no_provenance_engine"
+            description = "test engine"
+            citations = []
+
+            def simulate(self, demographic_model, contig, samples, seed=None):
+                return None
+
+        engine = NoProvenanceEngine()
+        contig = self.species.get_contig("chr22", length_multiplier=0.001)
+        contig.exclusion_mask = np.array([[1000, 20000]])
+        self.assertFalse(engine.records_provenance(contig))
+
+    def test_simulate_replicates_output(self):
+        # Without masks, the provenance is added as the replicates are written,
+        # rather than by the engine.
+        engine = stdpopsim.get_engine("msprime")
+        contig = self.species.get_contig("chr22", length_multiplier=0.0001)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch(
+                "stdpopsim.utils.finalise_tree_sequence",
+                wraps=stdpopsim.utils.finalise_tree_sequence,
+            ) as mocked_finalise:
+                files = engine.simulate_replicates(
+                    self.model,
+                    contig,
+                    self.samples,
+                    3,
+                    seed=3,
+                    output=os.path.join(tmpdir, "{replicate}.trees"),
+                    provenance=self.provenance,
+                )
+            self.assertEqual(mocked_finalise.call_count, 3)
+            for call in mocked_finalise.call_args_list:
+                self.assertIsNone(call.kwargs["provenance"])
+            for j, filename in enumerate(files):
+                record = self.last_record(tskit.load(filename))
+                self.assertEqual(record["parameters"], {"x": 1, "replicate": j})
+
+    def test_generic_engine(self):
+        class ProvenanceEngine(stdpopsim.Engine):
+            id = "provenance_engine"
+            description = "test engine"
+            citations = []
+
+            def simulate(self, *args, seed=None, provenance=None, **kwargs):
+                return provenance
+
+        engine = ProvenanceEngine()
+        contig = self.species.get_contig("chr22", length_multiplier=0.0001)
+        replicates = engine.simulate_replicates(
+            self.model,
+            contig,
+            self.samples,
+            3,
+            seed=1,
+            provenance=self.provenance,
+        )
+        self.assertEqual(
+            [record["parameters"]["replicate"] for record in replicates], [0, 1, 2]
+        )
+
+
+class TestSimulateAutosomes(unittest.TestCase):
+    """
+    Tests for simulating all autosomes of a species.
+    """
+
+    genome = stdpopsim.Genome(
+        chromosomes=[
+            stdpopsim.Chromosome(
+                id=id, length=length, recombination_rate=1e-8, mutation_rate=1e-7
+            )
+            for id, length in [
+                ("1", 20000),
+                ("2", 50000),
+                ("3", 30000),
+                ("X", 40000),
+                ("MT", 1000),
+            ]
+        ]
+    )
+    species = stdpopsim.Species(
+        id="TesSpe",
+        ensembl_id="test_species",
+        name="Test species",
+        common_name="Testy McTestface",
+        genome=genome,
+    )
+    model = stdpopsim.PiecewiseConstantSize(1000)
+    samples = model.get_samples(4)
+
+    def simulate_autosomes(self, output_dir, **kwargs):
+        engine = stdpopsim.get_engine("msprime")
+        return engine.simulate_autosomes(
+            self.model, self.species, self.samples, output_dir, **kwargs
+        )
+
+    def test_output(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_dir = pathlib.Path(tmpdir) / "out"
+            manifest = self.simulate_autosomes(output_dir, seed=1)
+            self.assertEqual(
+                sorted(os.listdir(output_dir)),
+                ["1.trees", "2.trees", "3.trees", "manifest.json"],
+            )
+            with open(output_dir / "manifest.json") as f:
+                self.assertEqual(json.load(f), manifest)
+            self.assertEqual(manifest["species"], "TesSpe")
+            self.assertEqual(manifest["engine"], "msprime")
+            self.assertEqual(manifest["seed"], 1)
+            entries = manifest["chromosomes"]
+            self.assertEqual([entry["id"] for entry in entries], ["1", "2", "3"])
+            self.assertEqual(len({entry["seed"] for entry in entries}), 3)
+            for entry, chrom in zip(entries, self.genome.autosomes):
+                ts = tskit.load(output_dir / entry["file"])
+                self.assertEqual(ts.sequence_length, chrom.length)
+                self.assertEqual(entry["length"], chrom.length)
+                self.assertEqual(entry["mutation_rate"], chrom.mutation_rate)
+                self.assertEqual(entry["num_sites"], ts.num_sites)
+                self.assertEqual(entry["num_samples"], 4)
+                self.assertGreater(ts.num_sites, 0)
+
+    def test_largest_first(self):
+        engine = stdpopsim.get_engine("msprime")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch.object(engine, "simulate", wraps=engine.simulate) as mocked:
+                self.simulate_autosomes(tmpdir, seed=2)
+        lengths = [
+            call[0][1].recombination_map.sequence_length
+            for call in mocked.call_args_list
+        ]
+        self.assertEqual(lengths, [50000, 30000, 20000])
+
+    def test_num_workers(self):
+        tables = []
+        for num_workers in [1, 3]:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                manifest = self.simulate_autosomes(
+                    tmpdir, seed=3, num_workers=num_workers
+                )
+                tables.append(
+                    [
+                        tskit.load(os.path.join(tmpdir, entry["file"])).tables
+                        for entry in manifest["chromosomes"]
+                    ]
+                )
+        for tables1, tables2 in zip(*tables):
+            tables1.assert_equals(tables2, ignore_provenance=True)
+
+    def test_mutation_rate(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = self.simulate_autosomes(tmpdir, mutation_rate=0)
+            for entry in manifest["chromosomes"]:
+                self.assertEqual(entry["mutation_rate"], 0)
+                self.assertEqual(entry["num_sites"], 0)
+
+    def test_provenance(self):
+        provenance = {"software": {"name": "test"}}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = self.simulate_autosomes(tmpdir, provenance=provenance)
+            for entry in manifest["chromosomes"]:
+                ts = tskit.load(os.path.join(tmpdir, entry["file"]))
+                record = ts.provenance(ts.num_provenances - 1).record
+                self.assertEqual(json.loads(record), provenance)
+
+    def test_bad_num_workers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                self.simulate_autosomes(tmpdir, num_workers=0)
+
+    def test_citations(self):
+        engine = stdpopsim.engines._MsprimeEngine()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine.simulate_autosomes(
+                self.model,
+                self.species,
+                self.samples,
+                tmpdir,
+                num_workers=2,
+                msprime_model="dtwf",
+            )
+        self.assertEqual(
+            engine.citations,
+            stdpopsim.engines._MsprimeEngine.citations + engine.model_citations["dtwf"],
+        )
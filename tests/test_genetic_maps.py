@@ -2,6 +2,8 @@
 Tests for the genetic maps management.
 """
 import unittest
+import warnings
+import concurrent.futures
 from unittest import mock
 import tarfile
 import tempfile
@@ -11,6 +13,7 @@ import pytest
 import re
 
 import msprime
+import numpy as np
 
 import stdpopsim
 from stdpopsim import utils
@@ -107,6 +110,52 @@ def get_genetic_map_tarball():
     return tarball
 
 
+class LocalGeneticMapTest(tests.CacheWritingTest):
+    """
+    Base class for tests using a genetic map for a test species, which is
+    "downloaded" from a local tarball made with get_genetic_map_tarball().
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tarball_dir = tempfile.TemporaryDirectory()
+        tarball = pathlib.Path(self.tarball_dir.name) / "genetic_map.tar.gz"
+        with open(tarball, "wb") as f:
+            f.write(get_genetic_map_tarball())
+        genome = stdpopsim.Genome(
+            chromosomes=[
+                stdpopsim.Chromosome(
+                    id=f"chr{j}",
+                    length=100000,
+                    recombination_rate=1e-8,
+                    mutation_rate=1e-8,
+                )
+                for j in range(1, 11)
+            ]
+        )
+        self.species = stdpopsim.Species(
+            id="TesSpe",
+            ensembl_id="test_species",
+            name="Test species",
+            common_name="Testy McTestface",
+            genome=genome,
+        )
+        self.genetic_map = stdpopsim.GeneticMap(
+            species=self.species,
+            id="test_map",
+            url=tarball.resolve().as_uri(),
+            sha256=utils.sha256(tarball),
+            file_pattern="prefix_{id}.txt",
+        )
+        self.species.add_genetic_map(self.genetic_map)
+        stdpopsim.clear_memory_cache()
+
+    def tearDown(self):
+        del self.tarball_dir
+        stdpopsim.clear_memory_cache()
+        super().tearDown()
+
+
 class TestGeneticMapTarball(unittest.TestCase):
     """
     Tests that we correctly encode a genetic map in the tarball test function.
@@ -153,9 +202,11 @@ class TestGeneticMapDownload(tests.CacheWritingTest):
 
     def test_correct_url(self):
         gm = GeneticMapTestClass()
-        with mock.patch("stdpopsim.utils.download", autospec=True) as mocked_get:
-            # The destination file will be missing.
-            with self.assertRaises(FileNotFoundError):
+        with mock.patch(
+            "stdpopsim.utils.download_tar_as_zip", autospec=True
+        ) as mocked_get:
+            # The mocked download gives the wrong checksum.
+            with self.assertRaises(ValueError):
                 gm.download()
         mocked_get.assert_called_once_with(gm.url, unittest.mock.ANY)
 
@@ -182,6 +233,250 @@ class TestGeneticMapDownload(tests.CacheWritingTest):
             gm._cache.is_cached = saved
 
 
+class TestCompiledMaps(LocalGeneticMapTest):
+    """
+    Tests for the binary copies of the chromosome maps stored in the cache.
+    """
+
+    def test_compiled_map_dir(self):
+        gm = self.genetic_map
+        assert gm.compiled_map_dir.parent == gm.map_cache_dir
+        assert gm.sha256 in gm.compiled_map_dir.name
+
+    def test_compiled_on_first_read(self):
+        gm = self.genetic_map
+        position_file, rate_file = gm._compiled_map_files("chr1")
+        assert not position_file.exists()
+        cm1 = gm.get_chromosome_map("chr1")
+        assert position_file.exists()
+        assert rate_file.exists()
+        stdpopsim.clear_memory_cache()
+        with mock.patch("msprime.RateMap.read_hapmap", autospec=True) as mocked:
+            cm2 = gm.get_chromosome_map("chr1")
+        mocked.assert_not_called()
+        assert np.array_equal(cm1.position, cm2.position)
+        assert np.array_equal(cm1.rate, cm2.rate, equal_nan=True)
+
+    def test_extract_on_demand(self):
+        gm = self.genetic_map
+        gm.get_chromosome_map("chr1")
+        assert (gm.map_cache_dir / "prefix_chr1.txt").exists()
+        for j in range(2, 10):
+            assert not (gm.map_cache_dir / f"prefix_chr{j}.txt").exists()
+
+    def test_compiled_map_not_extracted(self):
+        gm = self.genetic_map
+        gm.get_chromosome_map("chr1")
+        map_file = gm.map_cache_dir / "prefix_chr1.txt"
+        map_file.unlink()
+        stdpopsim.clear_memory_cache()
+        with mock.patch.object(gm, "_get_map_file", autospec=True) as mocked:
+            gm.get_chromosome_map("chr1")
+        mocked.assert_not_called()
+        assert not map_file.exists()
+
+    def test_same_as_hapmap(self):
+        gm = self.genetic_map
+        gm.precompile()
+        map_file = gm.map_cache_dir / "prefix_chr2.txt"
+        cm1 = msprime.RateMap.read_hapmap(map_file, rate_col=2)
+        position, rate = (np.load(f) for f in gm._compiled_map_files("chr2"))
+        assert np.array_equal(cm1.position, position)
+        assert np.array_equal(cm1.rate, rate, equal_nan=True)
+
+    def test_precompile(self):
+        gm = self.genetic_map
+        gm.precompile()
+        for j in range(1, 10):
+            for path in gm._compiled_map_files(f"chr{j}"):
+                assert path.exists()
+        # No map for chr10.
+        for path in gm._compiled_map_files("chr10"):
+            assert not path.exists()
+
+    def test_redownload_invalidates(self):
+        gm = self.genetic_map
+        gm.precompile()
+        gm.download()
+        for path in gm._compiled_map_files("chr1"):
+            assert not path.exists()
+
+    def test_bad_compiled_map(self):
+        gm = self.genetic_map
+        cm1 = gm.get_chromosome_map("chr1")
+        position_file, _ = gm._compiled_map_files("chr1")
+        with open(position_file, "w") as f:
+            f.write("not a numpy file")
+        stdpopsim.clear_memory_cache()
+        cm2 = gm.get_chromosome_map("chr1")
+        assert np.array_equal(cm1.position, cm2.position)
+        # The bad file was replaced.
+        assert np.array_equal(np.load(position_file), cm1.position[:-1])
+
+    def test_unwritable_cache(self):
+        gm = self.genetic_map
+        with mock.patch.object(
+            gm, "_write_compiled_map", autospec=True, side_effect=PermissionError
+        ):
+            cm = gm.get_chromosome_map("chr1")
+        assert isinstance(cm, msprime.RateMap)
+
+    def test_read_only_cache(self):
+        gm = self.genetic_map
+        gm.download()
+        read_only_dir = stdpopsim.get_cache_dir()
+        writable_dir = pathlib.Path(self.tarball_dir.name) / "writable"
+        stdpopsim.set_cache_dir([read_only_dir, writable_dir])
+        with mock.patch(
+            "stdpopsim.cache._is_writable",
+            side_effect=lambda path: pathlib.Path(path) != read_only_dir,
+        ):
+            assert gm.is_cached()
+            assert read_only_dir in gm.map_cache_dir.parents
+            gm.get_chromosome_map("chr1")
+            # The map file and compiled map are written to the writable
+            # directory.
+            assert writable_dir in gm.compiled_map_dir.parents
+            for path in gm._compiled_map_files("chr1"):
+                assert path.exists()
+            assert not (gm.map_cache_dir / "prefix_chr1.txt").exists()
+
+
+class TestRegionContig(LocalGeneticMapTest):
+    """
+    Tests for contigs restricted to a region of a chromosome with a genetic map.
+    """
+
+    def test_region(self):
+        cm = self.genetic_map.get_chromosome_map("chr1")
+        contig = self.species.get_contig(
+            "chr1", genetic_map=self.genetic_map.id, left=60000, right=85000
+        )
+        rm = contig.recombination_map
+        assert rm.sequence_length == cm.sequence_length
+        assert np.isnan(rm.get_rate(0))
+        assert np.isnan(rm.get_rate(85000))
+        x = np.arange(60000, 85000, 100)
+        np.testing.assert_array_equal(rm.get_rate(x), cm.get_rate(x))
+        assert contig.genetic_map is self.genetic_map
+
+    def test_region_shift_coordinates(self):
+        cm = self.genetic_map.get_chromosome_map("chr1")
+        contig = self.species.get_contig(
+            "chr1",
+            genetic_map=self.genetic_map.id,
+            left=60000,
+            right=85000,
+            shift_coordinates=True,
+        )
+        rm = contig.recombination_map
+        assert rm.sequence_length == 25000
+        x = np.arange(0, 25000, 100)
+        np.testing.assert_array_equal(rm.get_rate(x), cm.get_rate(x + 60000))
+
+    def test_tiling(self):
+        cm = self.genetic_map.get_chromosome_map("chr1")
+        contigs = [
+            self.species.get_contig(
+                "chr1",
+                genetic_map=self.genetic_map.id,
+                left=left,
+                right=left + 10000,
+                shift_coordinates=True,
+            )
+            # The map is missing before position 55550.
+            for left in range(50000, 100000, 10000)
+        ]
+        total_mass = sum(c.recombination_map.total_mass for c in contigs)
+        assert total_mass == pytest.approx(cm.total_mass)
+
+
+class TestChromosomeMapMemoryCache(LocalGeneticMapTest):
+    """
+    Tests that chromosome maps are kept in memory.
+    """
+
+    def test_hit(self):
+        gm = self.genetic_map
+        memory_cache = stdpopsim.get_memory_cache()
+        cm1 = gm.get_chromosome_map("chr1")
+        assert memory_cache.misses == 1
+        assert memory_cache.hits == 0
+        with mock.patch.object(gm, "_read_chromosome_map", autospec=True) as mocked:
+            cm2 = gm.get_chromosome_map("chr1")
+        mocked.assert_not_called()
+        assert cm1 is cm2
+        assert memory_cache.hits == 1
+        gm.get_chromosome_map("chr2")
+        assert memory_cache.misses == 2
+
+    def test_contig_map_replaced(self):
+        contig1 = self.species.get_contig("chr1", genetic_map="test_map")
+        # Replace the map with one of the same ID, but with different rates.
+        tarball = pathlib.Path(self.tarball_dir.name) / "genetic_map2.tar.gz"
+        with tempfile.TemporaryDirectory() as map_dir:
+            map_file = pathlib.Path(map_dir) / "prefix_chr1.txt"
+            with open(map_file, "w") as f:
+                print("Chromosome  Position(bp)    Rate(cM/Mb)     Map(cM)", file=f)
+                print("chr1        1000    1.000000        0.000000", file=f)
+                print("chr1        2000    0               0.001000", file=f)
+            with tarfile.open(tarball, mode="w:gz") as tar_file:
+                tar_file.add(map_file, arcname=map_file.name)
+        genetic_map = stdpopsim.GeneticMap(
+            species=self.species,
+            id="test_map",
+            url=tarball.resolve().as_uri(),
+            sha256=utils.sha256(tarball),
+            file_pattern="prefix_{id}.txt",
+        )
+        self.species.genetic_maps[0] = genetic_map
+        contig2 = self.species.get_contig("chr1", genetic_map="test_map")
+        assert contig2.genetic_map is genetic_map
+        assert contig2.recombination_map != contig1.recombination_map
+        assert stdpopsim.get_memory_cache().hits == 0
+
+    def test_read_only(self):
+        cm = self.genetic_map.get_chromosome_map("chr1")
+        with pytest.raises(ValueError):
+            cm.position[0] = 1
+        with pytest.raises(ValueError):
+            cm.rate[0] = 1
+
+    def test_warning_repeated(self):
+        # There's no map for chr10.
+        for _ in range(2):
+            with pytest.warns(UserWarning, match="Recombination map not found"):
+                self.genetic_map.get_chromosome_map("chr10")
+        assert stdpopsim.get_memory_cache().hits == 1
+
+    def test_contig_warning_repeated(self):
+        for _ in range(2):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                self.species.get_contig("chr10", genetic_map="test_map")
+            messages = [str(w.message) for w in caught]
+            assert len(messages) == 1
+            assert messages[0].startswith("Recombination map not found")
+        # The second contig was retrieved from the cache.
+        assert stdpopsim.get_memory_cache().hits == 1
+
+    def test_warnings_in_threads(self):
+        # The warnings for each map are returned with it, rather than being
+        # recorded with warnings.catch_warnings(), which isn't thread safe.
+        gm = self.genetic_map
+        gm.precompile()
+        with mock.patch("warnings.catch_warnings", autospec=True) as mocked:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(
+                    executor.map(
+                        gm._get_chromosome_map, [f"chr{j}" for j in range(1, 11)] * 2
+                    )
+                )
+        mocked.assert_not_called()
+        for j, (_, messages) in enumerate(results):
+            assert len(messages) == (1 if j % 10 == 9 else 0)
+
+
 class TestAllGeneticMaps(tests.CacheReadingTest):
     """
     Tests if the all_genetic_maps() function works correctly.
@@ -1,30 +1,45 @@
 """
 Tests for the genetic maps management.
 """
+import gzip
+import os
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
 import stdpopsim.utils
 import msprime
 import numpy as np
-import os
-import sys
 
 IS_WINDOWS = sys.platform.startswith("win")
 
 
+def write_bed(path, intervals_in):
+    with open(path, "w+") as fout:
+        for c, i in intervals_in.items():
+            for (l, r) in i:
+                fout.write(f"{c}\t{l}\t{r}\n")
+
+
 class TestMasking(unittest.TestCase):
+    # The bed files are written to a temporary directory for each test, so
+    # that tests running in parallel do not overwrite each other's files.
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.bed_file = os.path.join(self.tmpdir.name, "mask.bed")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
     def test_load_intervals(self):
         intervals_in = {
             "chr1": [(10, 10000)],
             "chr22": [(100, 1000), (2000, 5000), (6000, 9000)],
         }
-        with open("temp_file.bed", "w+") as fout:
-            for c, i in intervals_in.items():
-                for (l, r) in i:
-                    fout.write(f"{c}\t{l}\t{r}\n")
-        intervals_chr1 = stdpopsim.utils.read_bed("temp_file.bed", "chr1")
-        intervals_chr22 = stdpopsim.utils.read_bed("temp_file.bed", "chr22")
-        os.remove("temp_file.bed")
+        write_bed(self.bed_file, intervals_in)
+        intervals_chr1 = stdpopsim.utils.read_bed(self.bed_file, "chr1")
+        intervals_chr22 = stdpopsim.utils.read_bed(self.bed_file, "chr22")
         for interval in intervals_chr1:
             self.assertTrue(tuple(interval) in intervals_in["chr1"])
         for interval in intervals_chr22:
@@ -51,13 +66,9 @@ class TestMasking(unittest.TestCase):
             return intervals
 
         intervals_in = {"chr1": [(0, 10), (100, 1000), (2000, 5000), (6000, 10000)]}
-        with open("temp_file.bed", "w+") as fout:
-            for c, i in intervals_in.items():
-                for (l, r) in i:
-                    fout.write(f"{c}\t{l}\t{r}\n")
-        intervals_test = intervals_to_keep_test_func("temp_file.bed", "chr1")
-        intervals_utils = stdpopsim.utils.read_bed("temp_file.bed", "chr1")
-        os.remove("temp_file.bed")
+        write_bed(self.bed_file, intervals_in)
+        intervals_test = intervals_to_keep_test_func(self.bed_file, "chr1")
+        intervals_utils = stdpopsim.utils.read_bed(self.bed_file, "chr1")
         for i1, i2 in zip(intervals_utils, intervals_test):
             self.assertTrue(i1[0] == i2[0])
             self.assertTrue(i1[1] == i2[1])
@@ -82,18 +93,95 @@ class TestMasking(unittest.TestCase):
 
     def test_read_masks_from_bed(self):
         intervals_in = {"chr1": [(0, 10), (100, 1000), (2000, 5000), (6000, 10000)]}
-        with open("temp_file.bed", "w+") as fout:
-            for c, i in intervals_in.items():
-                for (l, r) in i:
-                    fout.write(f"{c}\t{l}\t{r}\n")
+        write_bed(self.bed_file, intervals_in)
         species = stdpopsim.get_species("HomSap")
-        contig = species.get_contig("chr1", inclusion_mask="temp_file.bed")
+        contig = species.get_contig("chr1", inclusion_mask=self.bed_file)
         self.assertTrue(contig.exclusion_mask is None)
         self.assertTrue(len(contig.inclusion_mask) == 4)
-        contig = species.get_contig("chr1", exclusion_mask="temp_file.bed")
+        contig = species.get_contig("chr1", exclusion_mask=self.bed_file)
         self.assertTrue(contig.inclusion_mask is None)
         self.assertTrue(contig.exclusion_mask[1][0] == 100)
-        os.remove("temp_file.bed")
+
+    def test_read_bed_merges_overlaps(self):
+        intervals_in = {
+            "chr1": [(500, 600), (0, 10), (5, 20), (100, 200), (200, 300)],
+            "chr2": [(0, 1000)],
+        }
+        write_bed(self.bed_file, intervals_in)
+        intervals = stdpopsim.utils.read_bed(self.bed_file, "chr1")
+        self.assertEqual(intervals.dtype, np.int64)
+        np.testing.assert_array_equal(intervals, [[0, 20], [100, 300], [500, 600]])
+
+    def test_read_bed_gzip(self):
+        intervals_in = {"chr1": [(0, 10), (100, 1000)], "chr2": [(5, 50)]}
+        write_bed(self.bed_file, intervals_in)
+        with open(self.bed_file, "rb") as f:
+            data = f.read()
+        gz_file = self.bed_file + ".gz"
+        # Bgzip files are concatenated gzip members.
+        with open(gz_file, "wb") as f:
+            f.write(gzip.compress(data[:10]))
+            f.write(gzip.compress(data[10:]))
+        for chrom, intervals_chrom in intervals_in.items():
+            np.testing.assert_array_equal(
+                stdpopsim.utils.read_bed(gz_file, chrom), intervals_chrom
+            )
+
+    def test_read_bed_filters_chromosome(self):
+        with open(self.bed_file, "w") as f:
+            print("# a comment", file=f)
+            print('track name="mask"', file=f)
+            print("chr1\t0\t10\tname\t0\t+", file=f)
+            print("", file=f)
+            print("chr10\t20\t30", file=f)
+            print("chr1 10 20", file=f)
+            print("chr1\t40\t50", end="", file=f)
+        # Lines are split across blocks when the block size is small.
+        # Lines that are not tab-delimited are ignored.
+        for block_size in [1, 7, 1 << 22]:
+            with mock.patch("stdpopsim.utils._BED_BLOCK_SIZE", block_size):
+                intervals = stdpopsim.utils.read_bed(self.bed_file, "chr1")
+                np.testing.assert_array_equal(intervals, [[0, 10], [40, 50]])
+                intervals = stdpopsim.utils.read_bed(self.bed_file, "chr10")
+                np.testing.assert_array_equal(intervals, [[20, 30]])
+                intervals = stdpopsim.utils.read_bed(self.bed_file, "chr2")
+                self.assertEqual(intervals.shape, (0, 2))
+
+    def test_read_bed_bad_lines(self):
+        for line in ["chr1\t10", "chr1\tx\t10", "chr1\t10\t5", "chr1\t-1\t5"]:
+            with open(self.bed_file, "w") as f:
+                print("chr1\t0\t1", file=f)
+                print(line, file=f)
+            for block_size in [1, 7, 1 << 22]:
+                with mock.patch("stdpopsim.utils._BED_BLOCK_SIZE", block_size):
+                    with self.assertRaisesRegex(ValueError, "mask.bed:2:"):
+                        stdpopsim.utils.read_bed(self.bed_file, "chr1")
+            # Bad lines for other chromosomes are not parsed.
+            np.testing.assert_array_equal(
+                stdpopsim.utils.read_bed(self.bed_file, "chr2"), np.empty((0, 2))
+            )
+
+    def test_bed_mask_cache(self):
+        species = stdpopsim.get_species("HomSap")
+        write_bed(self.bed_file, {"chr22": [(0, 10), (100, 1000)]})
+        with mock.patch(
+            "stdpopsim.utils.read_bed", wraps=stdpopsim.utils.read_bed
+        ) as mocked_read_bed:
+            c1 = species.get_contig("chr22", inclusion_mask=self.bed_file)
+            c2 = species.get_contig(
+                "chr22", inclusion_mask=self.bed_file, left=0, right=500
+            )
+            self.assertEqual(mocked_read_bed.call_count, 1)
+            np.testing.assert_array_equal(c1.inclusion_mask, [[0, 10], [100, 1000]])
+            np.testing.assert_array_equal(c2.inclusion_mask, [[0, 10], [100, 500]])
+            # Changing the file invalidates the cached intervals.
+            write_bed(self.bed_file, {"chr22": [(0, 10), (100, 1000), (2000, 3000)]})
+            st = os.stat(self.bed_file)
+            os.utime(self.bed_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            c3 = species.get_contig("chr22", inclusion_mask=self.bed_file)
+            self.assertEqual(mocked_read_bed.call_count, 2)
+            self.assertEqual(len(c3.inclusion_mask), 3)
+            self.assertFalse(c3.inclusion_mask.flags.writeable)
 
     def test_mask_tree_sequence(self):
         intervals = np.array([[0, 10], [100, 200], [500, 1000]])
@@ -2,6 +2,7 @@
 Tests for SLiM simulation engine.
 """
 import os
+import copy
 import re
 import io
 import sys
@@ -9,11 +10,16 @@ import itertools
 import unittest
 import tempfile
 import math
+import subprocess
+import threading
+import warnings
 from unittest import mock
+from time import sleep
 
 import tskit
 import pyslim
 import msprime
+import numpy as np
 
 import stdpopsim
 import stdpopsim.cli
@@ -30,19 +36,13 @@ def slim_simulate_no_recap(seed=1234, **kwargs):
     engine = stdpopsim.get_engine("slim")
     out, _ = capture_output(engine.simulate, **kwargs)
 
-    # Find the name of the temporary trees_file in the script.
-    match = re.search(r'"trees_file",\s*"([^"]*)"', out)
-    assert match is not None
-    tmp_trees_file = match.group(1)
-
     with tempfile.TemporaryDirectory() as tmpdir:
         script_file = os.path.join(tmpdir, "script.slim")
         trees_file = os.path.join(tmpdir, "out.trees")
-        # Write out the script with a new location for the trees_file.
-        out = out.replace(tmp_trees_file, trees_file)
         with open(script_file, "w") as f:
             f.write(out)
-        engine._run_slim(script_file, seed=seed)
+        # The script doesn't define the trees_file.
+        engine._run_slim(script_file, seed=seed, constants={"trees_file": trees_file})
         ts = pyslim.load(trees_file)
     return ts
 
@@ -211,6 +211,112 @@ class TestAPI(unittest.TestCase):
             engine._assert_min_version("3.5", engine.slim_path())
             engine._assert_min_version("3.6", None)
 
+    def test_version_cache(self):
+        engine = stdpopsim.get_engine("slim")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            slim_path = os.path.join(tmpdir, "slim")
+            log_file = os.path.join(tmpdir, "log")
+
+            def write_slim(version):
+                with open(slim_path, "w") as f:
+                    print("#!/bin/sh", file=f)
+                    print(f"echo run >> {log_file}", file=f)
+                    print(f'echo "SLiM version {version}, built Jan 1 2021"', file=f)
+                os.chmod(slim_path, 0o755)
+
+            def num_runs():
+                with open(log_file) as f:
+                    return len(f.readlines())
+
+            write_slim("3.7.1")
+            self.assertEqual(engine.get_version(slim_path), "3.7.1")
+            self.assertEqual(engine.get_version(slim_path), "3.7.1")
+            engine._assert_min_version("3.6", slim_path)
+            self.assertEqual(num_runs(), 1)
+            # A different executable is run again.
+            st = os.stat(slim_path)
+            write_slim("3.7.10")
+            os.utime(slim_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            self.assertEqual(engine.get_version(slim_path), "3.7.10")
+            self.assertEqual(engine.get_version(slim_path), "3.7.10")
+            self.assertEqual(num_runs(), 2)
+
+
+@unittest.skipIf(IS_WINDOWS, "SLiM not available on windows")
+class TestSimulateJobs(unittest.TestCase):
+    species = stdpopsim.get_species("HomSap")
+    model = stdpopsim.PiecewiseConstantSize(1000)
+    samples = model.get_samples(4)
+
+    def make_jobs(self, num_jobs):
+        contig = self.species.get_contig(length=1000)
+        return [(self.model, contig, self.samples, seed) for seed in range(num_jobs)]
+
+    @mock.patch("stdpopsim.slim_engine._SLiMEngine.get_version", return_value="64.64")
+    def test_jobs(self, mocked_get_version):
+        engine = stdpopsim.get_engine("slim")
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def simulate(demographic_model, contig, samples, **kwargs):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            # Later jobs finish first.
+            sleep(0.01 * (20 - kwargs["seed"]))
+            with lock:
+                running[0] -= 1
+            return kwargs
+
+        jobs = self.make_jobs(10)
+        jobs[3] += ([stdpopsim.ext.MutationType()], [])
+        with mock.patch.object(engine, "simulate", side_effect=simulate):
+            results = list(
+                engine.simulate_jobs(
+                    jobs, num_workers=3, slim_path="slim", slim_burn_in=0
+                )
+            )
+        mocked_get_version.assert_called_once_with("slim")
+        self.assertEqual(sorted(index for index, _ in results), list(range(10)))
+        self.assertNotEqual([index for index, _ in results], list(range(10)))
+        self.assertLessEqual(running[1], 3)
+        self.assertGreater(running[1], 1)
+        for index, kwargs in results:
+            self.assertEqual(kwargs["seed"], index)
+            self.assertEqual(kwargs["slim_path"], "slim")
+            self.assertEqual(kwargs["slim_burn_in"], 0)
+            if index == 3:
+                self.assertEqual(len(kwargs["mutation_types"]), 1)
+                self.assertEqual(kwargs["extended_events"], [])
+            else:
+                self.assertIsNone(kwargs["mutation_types"])
+                self.assertIsNone(kwargs["extended_events"])
+
+    @mock.patch("stdpopsim.slim_engine._SLiMEngine.get_version", return_value="64.64")
+    def test_error(self, _mocked_get_version):
+        engine = stdpopsim.get_engine("slim")
+
+        def simulate(demographic_model, contig, samples, **kwargs):
+            if kwargs["seed"] == 2:
+                raise stdpopsim.SLiMException("failed")
+            return kwargs["seed"]
+
+        with mock.patch.object(engine, "simulate", side_effect=simulate):
+            with self.assertRaises(stdpopsim.SLiMException):
+                list(engine.simulate_jobs(self.make_jobs(5), num_workers=2))
+            with self.assertRaises(ValueError):
+                list(engine.simulate_jobs([(self.model,)]))
+
+    def test_bad_arguments(self):
+        engine = stdpopsim.get_engine("slim")
+        jobs = self.make_jobs(2)
+        with self.assertRaises(ValueError):
+            list(engine.simulate_jobs(jobs, num_workers=0))
+        with self.assertRaises(ValueError):
+            list(engine.simulate_jobs(jobs, slim_script=True))
+        with self.assertRaises(ValueError):
+            list(engine.simulate_jobs(jobs, dry_run=True))
+
 
 @unittest.skipIf(IS_WINDOWS, "SLiM not available on windows")
 class TestCLI(unittest.TestCase):
@@ -289,6 +395,148 @@ class TestCLI(unittest.TestCase):
             self.docmd(f"HomSap --dry-run -o {f.name}")
             self.assertEqual(os.stat(f.name).st_size, 0)
 
+    @mock.patch("stdpopsim.slim_engine._SLiMEngine.get_version", return_value="64.64")
+    def test_script_on_stdin(self, _mocked_get_version):
+        engine = stdpopsim.get_engine("slim")
+        species = stdpopsim.get_species("HomSap")
+        contig = species.get_contig("chr22", length_multiplier=0.001)
+        model = stdpopsim.PiecewiseConstantSize(species.population_size)
+        samples = model.get_samples(10)
+        with mock.patch("subprocess.Popen", autospec=True) as mocked_popen:
+            proc = mocked_popen.return_value.__enter__.return_value
+            proc.returncode = 0
+            proc.stdout = io.StringIO()
+            proc.stderr = io.StringIO()
+            with tempfile.TemporaryDirectory() as tmpdir:
+                engine.simulate(
+                    model,
+                    contig,
+                    samples,
+                    seed=1,
+                    slim_scratch_dir=tmpdir,
+                    dry_run=True,
+                )
+                # The scratch directory is cleaned up.
+                self.assertEqual(os.listdir(tmpdir), [])
+        mocked_popen.assert_called_once()
+        slim_cmd = mocked_popen.call_args[0][0]
+        # No script file is given, so SLiM reads the script from stdin.
+        self.assertEqual(slim_cmd[1:5], ["-s", "1", "-d", "dry_run=T"])
+        self.assertEqual(slim_cmd[5], "-d")
+        match = re.fullmatch(r'trees_file="([^"]*)"', slim_cmd[6])
+        self.assertTrue(match.group(1).startswith(tmpdir))
+        self.assertEqual(slim_cmd[7], "-d")
+        match = re.fullmatch(r'recombination_map_file="([^"]*)"', slim_cmd[8])
+        self.assertTrue(match.group(1).startswith(tmpdir))
+        self.assertEqual(len(slim_cmd), 9)
+        self.assertEqual(mocked_popen.call_args[1]["stdin"], subprocess.PIPE)
+        proc.stdin.write.assert_called_once()
+        script = proc.stdin.write.call_args[0][0]
+        self.assertIn("initialize()", script)
+        # The trees file is defined on the command line.
+        self.assertNotIn(tmpdir, script)
+        proc.stdin.close.assert_called_once()
+
+    @mock.patch("stdpopsim.slim_engine._SLiMEngine.get_version", return_value="64.64")
+    def test_script_cache(self, _mocked_get_version):
+        engine = stdpopsim.get_engine("slim")
+        species = stdpopsim.get_species("HomSap")
+        contig = species.get_contig("chr22", length_multiplier=0.001)
+        model = stdpopsim.PiecewiseConstantSize(species.population_size)
+
+        def run(samples, **kwargs):
+            with mock.patch("subprocess.Popen", autospec=True) as mocked_popen:
+                proc = mocked_popen.return_value.__enter__.return_value
+                proc.returncode = 0
+                proc.stdout = io.StringIO()
+                proc.stderr = io.StringIO()
+                engine.simulate(model, contig, samples, dry_run=True, **kwargs)
+            return (
+                mocked_popen.call_args[0][0],
+                proc.stdin.write.call_args[0][0],
+            )
+
+        stdpopsim.clear_memory_cache()
+        with mock.patch(
+            "stdpopsim.slim_engine.slim_makescript",
+            wraps=stdpopsim.slim_engine.slim_makescript,
+        ) as mocked_makescript:
+            cmd1, script1 = run(model.get_samples(10), seed=1)
+            cmd2, script2 = run(model.get_samples(10), seed=2)
+            self.assertEqual(mocked_makescript.call_count, 1)
+            self.assertEqual(script1, script2)
+            self.assertEqual(cmd1[1:3], ["-s", "1"])
+            self.assertEqual(cmd2[1:3], ["-s", "2"])
+            # Each run writes to its own trees file.
+            self.assertNotEqual(cmd1[-1], cmd2[-1])
+            # Changing the parameters gives a new script.
+            _, script3 = run(model.get_samples(10), seed=1, slim_burn_in=2)
+            self.assertEqual(mocked_makescript.call_count, 2)
+            self.assertNotEqual(script1, script3)
+            _, script4 = run(model.get_samples(12), seed=1)
+            self.assertEqual(mocked_makescript.call_count, 3)
+            self.assertNotEqual(script1, script4)
+            # The model's id is in the header of the script.
+            model = copy.copy(model)
+            model.id = "renamed_model"
+            _, script5 = run(model.get_samples(10), seed=1)
+            self.assertEqual(mocked_makescript.call_count, 4)
+            self.assertIn("renamed_model", script5)
+            model = copy.copy(model)
+            model.description = "A new description"
+            _, script6 = run(model.get_samples(10), seed=1)
+            self.assertEqual(mocked_makescript.call_count, 5)
+            self.assertIn("A new description", script6)
+            # Warnings are issued once each time, including for cached scripts.
+            for _ in range(2):
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always")
+                    run(model.get_samples(11), seed=1)
+                odd_sample_warnings = [
+                    w
+                    for w in caught
+                    if issubclass(w.category, stdpopsim.SLiMOddSampleWarning)
+                ]
+                self.assertEqual(len(odd_sample_warnings), 1)
+            self.assertEqual(mocked_makescript.call_count, 6)
+
+    def test_script_trees_file_undefined(self):
+        # The printed script is run after simulate() returns, so it doesn't
+        # refer to the scratch directory.
+        engine = stdpopsim.get_engine("slim")
+        species = stdpopsim.get_species("HomSap")
+        contig = species.get_contig("chr22", length_multiplier=0.001)
+        model = stdpopsim.PiecewiseConstantSize(species.population_size)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out, _ = capture_output(
+                engine.simulate,
+                model,
+                contig,
+                model.get_samples(10),
+                slim_script=True,
+                slim_scratch_dir=tmpdir,
+            )
+            self.assertEqual(os.listdir(tmpdir), [])
+        self.assertNotIn(tmpdir, out)
+        self.assertIsNone(re.search(r'defineConstant\("trees_file"', out))
+        self.assertIn('stop("ERROR: trees_file must be defined with -d");', out)
+
+    def test_default_scratch_dir(self):
+        with mock.patch("os.statvfs") as mocked_statvfs:
+            mocked_statvfs.return_value.f_frsize = 4096
+            mocked_statvfs.return_value.f_bavail = 1 << 20
+            with mock.patch("os.path.isdir", return_value=True), mock.patch(
+                "os.access", return_value=True
+            ):
+                self.assertEqual(
+                    stdpopsim.slim_engine._default_scratch_dir(), "/dev/shm"
+                )
+            # Too little free space.
+            mocked_statvfs.return_value.f_bavail = 10
+            self.assertEqual(
+                stdpopsim.slim_engine._default_scratch_dir(), tempfile.gettempdir()
+            )
+
     def test_bad_slim_environ_var(self):
         saved_slim_env = os.environ.get("SLIM")
 
@@ -519,6 +767,288 @@ class TestWarningsAndErrors(unittest.TestCase):
                 capture_output(stdpopsim.cli.stdpopsim_main, cmd.split())
 
 
+class TestRecombinationMap(unittest.TestCase):
+    """
+    Tests for passing the recombination map to SLiM.
+    """
+
+    def rate_map(self, num_intervals):
+        rng = np.random.default_rng(num_intervals)
+        # The maps all have the same length, which appears in the script.
+        breaks = rng.choice(
+            np.arange(1, 10 ** 7), size=num_intervals - 1, replace=False
+        )
+        position = np.concatenate([[0], np.sort(breaks), [10 ** 7]])
+        rate = rng.uniform(0, 1e-8, size=num_intervals)
+        rate[0] = np.nan
+        return msprime.RateMap(position=position, rate=rate)
+
+    def test_msprime_rm_to_slim_rm(self):
+        rate_map = self.rate_map(100)
+        rates, ends = stdpopsim.slim_engine.msprime_rm_to_slim_rm(rate_map)
+        self.assertEqual(rates[0], 0)
+        np.testing.assert_array_equal(rates[1:], rate_map.rate[1:])
+        self.assertEqual(ends.dtype, np.int64)
+        self.assertEqual(ends.tolist(), [int(x) - 1 for x in rate_map.position[1:]])
+
+    def test_recombination_map_text(self):
+        rate_map = self.rate_map(100)
+        text = stdpopsim.slim_engine.recombination_map_text(rate_map)
+        lines = text.splitlines()
+        self.assertEqual(len(lines), 2)
+        rates, ends = stdpopsim.slim_engine.msprime_rm_to_slim_rm(rate_map)
+        # The values are written exactly.
+        self.assertEqual([float(x) for x in lines[0].split()], rates.tolist())
+        self.assertEqual([int(x) for x in lines[1].split()], ends.tolist())
+
+    @mock.patch("stdpopsim.slim_engine._SLiMEngine.get_version", return_value="64.64")
+    def test_map_file(self, _mocked_get_version):
+        engine = stdpopsim.get_engine("slim")
+        model = stdpopsim.PiecewiseConstantSize(1000)
+        samples = model.get_samples(4)
+        scripts = []
+        for num_intervals in [10, 10000]:
+            contig = stdpopsim.Contig(
+                recombination_map=self.rate_map(num_intervals), mutation_rate=1e-8
+            )
+            map_files = []
+
+            def popen(slim_cmd, **kwargs):
+                # The map file is removed after the simulation.
+                for arg in slim_cmd:
+                    match = re.fullmatch(r'recombination_map_file="([^"]*)"', arg)
+                    if match is not None:
+                        with open(match.group(1)) as f:
+                            map_files.append(f.read())
+                return mock.DEFAULT
+
+            with mock.patch(
+                "subprocess.Popen", autospec=True, side_effect=popen
+            ) as mocked_popen:
+                proc = mocked_popen.return_value.__enter__.return_value
+                proc.returncode = 0
+                proc.stdout = io.StringIO()
+                proc.stderr = io.StringIO()
+                engine.simulate(model, contig, samples, dry_run=True)
+            scripts.append(proc.stdin.write.call_args[0][0])
+            self.assertEqual(
+                map_files,
+                [
+                    stdpopsim.slim_engine.recombination_map_text(
+                        contig.recombination_map
+                    )
+                ],
+            )
+            self.assertIn("readFile(recombination_map_file)", scripts[-1])
+        # The script does not depend on the size of the map.
+        self.assertEqual(len(scripts[0]), len(scripts[1]))
+
+    def test_inline_map(self):
+        # Scripts that are written out include the map.
+        engine = stdpopsim.get_engine("slim")
+        model = stdpopsim.PiecewiseConstantSize(1000)
+        contig = stdpopsim.Contig(
+            recombination_map=self.rate_map(10), mutation_rate=1e-8
+        )
+        out, _ = capture_output(
+            engine.simulate, model, contig, model.get_samples(4), slim_script=True
+        )
+        self.assertNotIn("recombination_map_file", out)
+        match = re.search(r"_recombination_ends = c\(([^)]*)\)", out)
+        ends = [int(x) for x in match.group(1).split(",")]
+        self.assertEqual(ends, [int(x) - 1 for x in contig.recombination_map.right])
+
+
+class TestRecapAndRescale(unittest.TestCase):
+    """
+    Tests for the post-processing of SLiM's output, using a tree sequence
+    simulated with msprime and annotated as if it came from SLiM.
+    """
+
+    def slim_ts(self, seed=1):
+        ts = msprime.sim_ancestry(
+            samples=100,
+            population_size=100,
+            sequence_length=10 ** 5,
+            recombination_rate=1e-8,
+            end_time=50,
+            random_seed=seed,
+        )
+        tables = pyslim.annotate_defaults(
+            ts, model_type="WF", slim_generation=50
+        ).dump_tables()
+        flags = np.full(tables.individuals.num_rows, pyslim.INDIVIDUAL_ALIVE)
+        # Remember individuals in decreasing order, so that the order of the
+        # sample nodes differs from their order in the tables.
+        self.remembered = np.arange(20, 0, -2)
+        flags[self.remembered] |= pyslim.INDIVIDUAL_REMEMBERED
+        tables.individuals.flags = flags.astype(np.uint32)
+        return pyslim.SlimTreeSequence.load_tables(tables)
+
+    def recap_and_rescale(self, ts, contig=None, **kwargs):
+        engine = stdpopsim.get_engine("slim")
+        model = stdpopsim.PiecewiseConstantSize(100)
+        if contig is None:
+            contig = stdpopsim.Contig(
+                recombination_map=msprime.RateMap.uniform(ts.sequence_length, 1e-8),
+                mutation_rate=1e-7,
+            )
+        return engine.recap_and_rescale(
+            ts, model, contig, model.get_samples(10), seed=1, **kwargs
+        )
+
+    def test_remembered_nodes(self):
+        ts = self.slim_ts()
+        engine = stdpopsim.get_engine("slim")
+        nodes = engine._remembered_nodes(ts.dump_tables())
+        self.assertEqual(
+            nodes.tolist(),
+            [node for j in sorted(self.remembered) for node in ts.individual(j).nodes],
+        )
+
+    def test_recap_and_rescale(self):
+        ts = self.slim_ts()
+        ts2 = self.recap_and_rescale(ts, slim_scaling_factor=10)
+        self.assertIsInstance(ts2, pyslim.SlimTreeSequence)
+        generation = ts2.metadata["SLiM"]["generation"]
+        self.assertEqual(generation, 10 * ts.metadata["SLiM"]["generation"])
+        self.assertEqual(ts2.num_samples, 2 * len(self.remembered))
+        self.assertEqual(ts2.num_populations, ts.num_populations)
+        for tree in ts2.trees():
+            self.assertEqual(tree.num_roots, 1)
+        times = ts2.tables.nodes.time
+        self.assertGreater(np.sum(times > generation), 0)
+        # Mutations are added above and below the start of the recapitation.
+        mutation_times = ts2.tables.mutations.time
+        self.assertGreater(np.sum(mutation_times < generation), 0)
+        self.assertGreater(np.sum(mutation_times > generation), 0)
+
+    def test_no_unary_nodes(self):
+        # The roots of the SLiM trees, from which recapitation starts, are
+        # kept by the first simplification, and removed by the last one.
+        # Here, they are all unary after recapitation.
+        ts = self.slim_ts()
+        generation = ts.metadata["SLiM"]["generation"]
+        ts2 = self.recap_and_rescale(ts)
+        self.assertEqual(np.sum(ts2.tables.nodes.time == generation), 0)
+        simplified = ts2.simplify(filter_populations=False)
+        self.assertEqual(ts2.num_nodes, simplified.num_nodes)
+        self.assertEqual(ts2.num_edges, simplified.num_edges)
+
+    def test_region(self):
+        # SLiM only simulates the region that the contig is restricted to,
+        # and the coordinates are shifted back afterwards.
+        ts = self.slim_ts()
+        left, right = 10 ** 6, 10 ** 6 + ts.sequence_length
+        species = stdpopsim.get_species("HomSap")
+        contig = species.get_contig("chr22", left=left, right=right)
+        contig.mutation_rate = 1e-7
+        ts2 = self.recap_and_rescale(ts, contig=contig)
+        self.assertEqual(ts2.sequence_length, contig.recombination_map.sequence_length)
+        self.assertGreater(ts2.num_sites, 0)
+        self.assertTrue(np.all(ts2.tables.edges.left >= left))
+        self.assertTrue(np.all(ts2.tables.edges.right <= right))
+        self.assertTrue(np.all(ts2.tables.sites.position >= left))
+        self.assertTrue(np.all(ts2.tables.sites.position < right))
+        for tree in ts2.trees():
+            if left <= tree.interval[0] < right:
+                self.assertEqual(tree.num_roots, 1)
+            else:
+                self.assertEqual(tree.num_edges, 0)
+
+    def test_seed(self):
+        ts = self.slim_ts()
+        tables1 = self.recap_and_rescale(ts).dump_tables()
+        tables2 = self.recap_and_rescale(ts).dump_tables()
+        tables1.assert_equals(tables2, ignore_provenance=True)
+
+    def test_log_stages(self):
+        ts = self.slim_ts()
+        with self.assertLogs("stdpopsim.slim_engine", level="INFO") as logs:
+            self.recap_and_rescale(ts)
+        stages = [record.getMessage().split(":")[0] for record in logs.records]
+        self.assertEqual(
+            stages, ["Rescale and simplify", "Recapitate", "Add mutations", "Finalise"]
+        )
+
+
+class TestContigFlanks(unittest.TestCase):
+    """
+    Tests for the flanks outside of the region that a contig is restricted to.
+    """
+
+    species = stdpopsim.get_species("HomSap")
+
+    def test_region(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig("chr22", left=100, right=200)
+        flanks = stdpopsim.slim_engine.contig_flanks(contig)
+        self.assertEqual(flanks.tolist(), [[0, 100], [200, chrom.length]])
+        contig = self.species.get_contig("chr22", left=100)
+        flanks = stdpopsim.slim_engine.contig_flanks(contig)
+        self.assertEqual(flanks.tolist(), [[0, 100]])
+
+    def test_slim_region(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        for kwargs, region in [
+            (dict(left=100, right=200), (100, 200)),
+            (dict(left=100), (100, chrom.length)),
+            (dict(right=200), (0, 200)),
+            (dict(left=100, right=200, shift_coordinates=True), (0, 100)),
+            (dict(), (0, chrom.length)),
+        ]:
+            contig = self.species.get_contig("chr22", **kwargs)
+            self.assertEqual(stdpopsim.slim_engine.slim_region(contig), region)
+
+    def test_script_region(self):
+        # The SLiM script is generated for the region of the chromosome that
+        # the contig is restricted to, and not for the whole chromosome.
+        contig = self.species.get_contig("chr22", left=1e6, right=1.01e6)
+        model = stdpopsim.PiecewiseConstantSize(100)
+        engine = stdpopsim.get_engine("slim")
+        out, _ = capture_output(
+            engine.simulate, model, contig, model.get_samples(4), slim_script=True
+        )
+        match = re.search(r'"chromosome_length",\s*([0-9]+)', out)
+        self.assertIsNotNone(match)
+        self.assertEqual(int(match.group(1)), 10000)
+        # The recombination map isn't modified.
+        self.assertEqual(
+            contig.recombination_map.sequence_length,
+            self.species.genome.get_chromosome("chr22").length,
+        )
+
+    def test_no_flanks(self):
+        for contig in [
+            self.species.get_contig("chr22"),
+            self.species.get_contig("chr22", length_multiplier=0.1),
+            self.species.get_contig(length=1000),
+            self.species.get_contig(
+                "chr22", left=100, right=200, shift_coordinates=True
+            ),
+            self.species.get_contig("chr22", right=200, shift_coordinates=True),
+        ]:
+            flanks = stdpopsim.slim_engine.contig_flanks(contig)
+            self.assertEqual(flanks.shape, (0, 2))
+
+
+@unittest.skipIf(IS_WINDOWS, "SLiM not available on windows")
+class TestSimulateRegion(unittest.TestCase):
+    def test_simulate_region(self):
+        engine = stdpopsim.get_engine("slim")
+        species = stdpopsim.get_species("HomSap")
+        contig = species.get_contig("chr22", left=1e6, right=1.01e6)
+        contig.mutation_rate = 1e-7
+        model = stdpopsim.PiecewiseConstantSize(100)
+        samples = model.get_samples(4)
+        ts = engine.simulate(model, contig, samples, seed=1)
+        self.assertEqual(ts.sequence_length, contig.recombination_map.sequence_length)
+        self.assertTrue(all(ts.tables.edges.left >= 1e6))
+        self.assertTrue(all(ts.tables.edges.right <= 1.01e6))
+        self.assertTrue(all(ts.tables.sites.position >= 1e6))
+        self.assertTrue(all(ts.tables.sites.position < 1.01e6))
+
+
 class TestSlimAvailable(unittest.TestCase):
     """
     Checks whether SLiM is available or not on platforms that support it.
@@ -3,7 +3,11 @@ Tests for the generic species interface.
 """
 import unittest
 import math
+import subprocess
+import sys
+import textwrap
 import numpy as np
+import pytest
 
 import msprime
 
@@ -88,6 +92,128 @@ class TestSpecies(unittest.TestCase):
             species.add_annotations(an)
 
 
+class TestLazyCatalog:
+    """
+    Tests for lazily loading species and demographic models from the catalog.
+    """
+
+    def make_species(self):
+        genome = stdpopsim.Genome(
+            chromosomes=[
+                stdpopsim.Chromosome(
+                    id="1", length=1000, recombination_rate=1e-8, mutation_rate=1e-8
+                )
+            ]
+        )
+        return stdpopsim.Species(
+            id="TesSpe",
+            name="Test species",
+            common_name="Test species",
+            genome=genome,
+            ensembl_id="test_species",
+        )
+
+    def make_factory(self, id, calls):
+        def factory():
+            calls.append(id)
+            return stdpopsim.PiecewiseConstantSize(100)
+
+        def named_factory():
+            model = factory()
+            model.id = id
+            return model
+
+        return named_factory
+
+    def test_import_does_not_load_catalog(self):
+        code = textwrap.dedent(
+            """
+            import sys
+            import stdpopsim
+            loaded = [m for m in sys.modules if m.startswith("stdpopsim.catalog.")]
+            assert loaded == ["stdpopsim.catalog.ensembl_info"], loaded
+            species = stdpopsim.get_species("EscCol")
+            assert "stdpopsim.catalog.HomSap" not in sys.modules
+            assert "stdpopsim.catalog.EscCol" in sys.modules
+            """
+        )
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    def test_model_factory_called_once(self):
+        species = self.make_species()
+        calls = []
+        species.add_demographic_model_factory(
+            "A_1X01", self.make_factory("A_1X01", calls)
+        )
+        species.add_demographic_model_factory(
+            "B_1X01", self.make_factory("B_1X01", calls)
+        )
+        assert calls == []
+        model = species.get_demographic_model("B_1X01")
+        assert model.id == "B_1X01"
+        assert calls == ["B_1X01"]
+        assert species.get_demographic_model("B_1X01") is model
+        assert calls == ["B_1X01"]
+        # Registration order is kept.
+        assert [m.id for m in species.demographic_models] == ["A_1X01", "B_1X01"]
+        assert calls == ["B_1X01", "A_1X01"]
+
+    def test_model_factory_wrong_id(self):
+        species = self.make_species()
+        species.add_demographic_model_factory("A_1X01", self.make_factory("B_1X01", []))
+        with pytest.raises(ValueError, match="returned a model with ID"):
+            species.get_demographic_model("A_1X01")
+
+    def test_model_factory_error(self):
+        species = self.make_species()
+        calls = []
+        factory = self.make_factory("A_1X01", calls)
+        failures = [ValueError("failed")]
+
+        def failing_factory():
+            if failures:
+                raise failures.pop()
+            return factory()
+
+        species.add_demographic_model_factory("A_1X01", failing_factory)
+        with pytest.raises(ValueError, match="failed"):
+            species.get_demographic_model("A_1X01")
+        # The model is still registered, and is built by the next request.
+        assert species.demographic_model_ids == ["A_1X01"]
+        assert species.get_demographic_model("A_1X01").id == "A_1X01"
+        assert calls == ["A_1X01"]
+
+    def test_add_duplicate_model_factory(self):
+        species = self.make_species()
+        factory = self.make_factory("A_1X01", [])
+        species.add_demographic_model_factory("A_1X01", factory)
+        with pytest.raises(ValueError, match="already in catalog"):
+            species.add_demographic_model_factory("A_1X01", factory)
+        with pytest.raises(ValueError, match="already in catalog"):
+            species.add_demographic_model(factory())
+
+    def test_qc_model_factory(self):
+        species = self.make_species()
+        calls = []
+        species.add_demographic_model_factory("A_1X01", self.make_factory("A_1X01", []))
+        species.add_qc_model_factory("A_1X01", self.make_factory("QC-A_1X01", calls))
+        assert calls == []
+        model = species.get_demographic_model("A_1X01")
+        assert model.qc_model.id == "QC-A_1X01"
+        # QC models can also be registered for models that are already built.
+        species.add_demographic_model_factory("B_1X01", self.make_factory("B_1X01", []))
+        model = species.get_demographic_model("B_1X01")
+        species.add_qc_model_factory("B_1X01", self.make_factory("QC-B_1X01", calls))
+        assert model.qc_model.id == "QC-B_1X01"
+        with pytest.raises(ValueError, match="not in catalog"):
+            species.add_qc_model_factory("C_1X01", self.make_factory("C_1X01", []))
+
+    def test_catalog_species_ids(self):
+        ids = [species.id for species in stdpopsim.all_species()]
+        for id in stdpopsim.catalog.__all__:
+            assert id in ids
+
+
 class SpeciesTestBase:
     """
     Base class for testing individual species properties.
@@ -227,6 +353,203 @@ class TestGetContig(unittest.TestCase):
                 "chr1", genetic_map="HapMapII_GRCh37", length_multiplier=2
             )
 
+    def test_region(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig("chr22", left=1e6, right=2e6)
+        rm = contig.recombination_map
+        assert rm.sequence_length == chrom.length
+        np.testing.assert_array_equal(rm.position, [0, 1e6, 2e6, chrom.length])
+        np.testing.assert_array_equal(
+            rm.rate, [np.nan, chrom.recombination_rate, np.nan]
+        )
+        assert contig.original_coordinates == (chrom.id, 1e6, 2e6)
+        assert contig.mutation_rate == chrom.mutation_rate
+
+    def test_region_default_bounds(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig("chr22", left=1e6)
+        np.testing.assert_array_equal(
+            contig.recombination_map.position, [0, 1e6, chrom.length]
+        )
+        assert contig.original_coordinates == (chrom.id, 1e6, chrom.length)
+        contig = self.species.get_contig("chr22", right=1e6)
+        np.testing.assert_array_equal(
+            contig.recombination_map.position, [0, 1e6, chrom.length]
+        )
+        assert contig.original_coordinates == (chrom.id, 0, 1e6)
+
+    def test_region_shift_coordinates(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig(
+            "chr22", left=1e6, right=2e6, shift_coordinates=True
+        )
+        rm = contig.recombination_map
+        np.testing.assert_array_equal(rm.position, [0, 1e6])
+        np.testing.assert_array_equal(rm.rate, [chrom.recombination_rate])
+        assert contig.original_coordinates == (chrom.id, 1e6, 2e6)
+
+    def test_whole_chromosome_coordinates(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig("chr22", shift_coordinates=True)
+        assert contig.recombination_map.sequence_length == chrom.length
+        assert contig.original_coordinates == (chrom.id, 0, chrom.length)
+        contig = self.species.get_contig("chr22", length_multiplier=0.5)
+        assert contig.original_coordinates is None
+        contig = self.species.get_contig(length=1000)
+        assert contig.original_coordinates is None
+
+    def test_region_masks(self):
+        mask = [(0, 10), (90, 110), (150, 160), (190, 300)]
+        for shift, expected in [
+            (False, [(100, 110), (150, 160), (190, 200)]),
+            (True, [(0, 10), (50, 60), (90, 100)]),
+        ]:
+            contig = self.species.get_contig(
+                "chr22",
+                left=100,
+                right=200,
+                inclusion_mask=mask,
+                shift_coordinates=shift,
+            )
+            np.testing.assert_array_equal(contig.inclusion_mask, expected)
+            assert contig.exclusion_mask is None
+            contig = self.species.get_contig(
+                "chr22",
+                left=100,
+                right=200,
+                exclusion_mask=mask,
+                shift_coordinates=shift,
+            )
+            np.testing.assert_array_equal(contig.exclusion_mask, expected)
+            assert contig.inclusion_mask is None
+
+    def test_covered_length(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        contig = self.species.get_contig("chr22")
+        assert contig.covered_length == chrom.length
+        mask = [(0, 10), (90, 110), (150, 160), (190, 300)]
+        contig = self.species.get_contig("chr22", inclusion_mask=mask)
+        assert contig.covered_length == 150
+        contig = self.species.get_contig("chr22", exclusion_mask=mask)
+        assert contig.covered_length == chrom.length - 150
+        # The recombination rate is missing outside of the region.
+        for shift in [False, True]:
+            contig = self.species.get_contig(
+                "chr22", left=100, right=200, shift_coordinates=shift
+            )
+            assert contig.covered_length == 100
+            contig = self.species.get_contig(
+                "chr22",
+                left=100,
+                right=200,
+                exclusion_mask=mask,
+                shift_coordinates=shift,
+            )
+            assert contig.covered_length == 70
+        contig = self.species.get_contig(length=1000)
+        assert contig.covered_length == 1000
+
+    def test_masked_rate_maps(self):
+        contig = self.species.get_contig(length=1000)
+        contig.mutation_rate = 1e-8
+        recomb_map, mutation_rate = contig.masked_rate_maps()
+        assert recomb_map is contig.recombination_map
+        assert mutation_rate == 1e-8
+        contig.inclusion_mask = np.array([[100, 200], [150, 300], [500, 600]])
+        recomb_map, mutation_map = contig.masked_rate_maps()
+        np.testing.assert_array_equal(recomb_map.position, [0, 100, 600, 1000])
+        assert np.all(np.isnan(recomb_map.rate[[0, 2]]))
+        assert recomb_map.rate[1] == contig.recombination_map.rate[0]
+        np.testing.assert_array_equal(
+            mutation_map.position, [0, 100, 300, 500, 600, 1000]
+        )
+        np.testing.assert_array_equal(mutation_map.rate, [0, 1e-8, 0, 1e-8, 0])
+        contig.inclusion_mask = None
+        contig.exclusion_mask = np.array([[0, 100], [400, 500]])
+        recomb_map, mutation_map = contig.masked_rate_maps()
+        np.testing.assert_array_equal(recomb_map.position, [0, 100, 1000])
+        np.testing.assert_array_equal(mutation_map.position, [0, 100, 400, 500, 1000])
+        np.testing.assert_array_equal(mutation_map.rate, [0, 1e-8, 0, 1e-8])
+        # Nothing is kept, so the recombination map is unchanged.
+        contig.exclusion_mask = np.array([[0, 1000]])
+        recomb_map, mutation_map = contig.masked_rate_maps()
+        assert recomb_map is contig.recombination_map
+        np.testing.assert_array_equal(mutation_map.rate, [0])
+
+    def test_region_mask_outside(self):
+        contig = self.species.get_contig(
+            "chr22", left=100, right=200, exclusion_mask=[(0, 10), (300, 400)]
+        )
+        assert contig.exclusion_mask.shape == (0, 2)
+
+    def test_bad_region(self):
+        chrom = self.species.genome.get_chromosome("chr22")
+        for left, right in [
+            (-1, 100),
+            (100, 100),
+            (200, 100),
+            (0, chrom.length + 1),
+            (chrom.length, None),
+        ]:
+            with pytest.raises(ValueError, match="Invalid region"):
+                self.species.get_contig("chr22", left=left, right=right)
+
+    def test_region_generic_contig(self):
+        with pytest.raises(ValueError, match="generic contig"):
+            self.species.get_contig(length=1000, left=10)
+        with pytest.raises(ValueError, match="generic contig"):
+            self.species.get_contig(length=1000, right=10)
+
+    def test_region_length_multiplier(self):
+        with pytest.raises(ValueError, match="length multiplier"):
+            self.species.get_contig("chr22", length_multiplier=0.5, left=10)
+
+    def test_simulate_region(self):
+        contig = self.species.get_contig("chr22", left=1e6, right=1.1e6)
+        contig.mutation_rate = 1e-7
+        model = stdpopsim.PiecewiseConstantSize(1000)
+        samples = model.get_samples(4)
+        engine = stdpopsim.get_engine("msprime")
+        ts = engine.simulate(model, contig, samples, seed=1)
+        assert ts.sequence_length == contig.recombination_map.sequence_length
+        assert np.all(ts.tables.edges.left >= 1e6)
+        assert np.all(ts.tables.edges.right <= 1.1e6)
+        assert ts.num_sites > 0
+        assert np.all(ts.tables.sites.position >= 1e6)
+        assert np.all(ts.tables.sites.position < 1.1e6)
+
+    def test_memory_cache(self):
+        stdpopsim.clear_memory_cache()
+        memory_cache = stdpopsim.get_memory_cache()
+        contig1 = self.species.get_contig("chr22", inclusion_mask=[(0, 100)])
+        contig2 = self.species.get_contig("chr22", inclusion_mask=[(0, 100)])
+        assert memory_cache.hits == 1
+        # Each call returns a separate contig, sharing the read-only data.
+        assert contig1 is not contig2
+        assert contig1.recombination_map is contig2.recombination_map
+        assert contig1.inclusion_mask is contig2.inclusion_mask
+        with self.assertRaises(ValueError):
+            contig1.inclusion_mask[0, 0] = 1
+        contig1.mutation_rate = 1
+        contig3 = self.species.get_contig("chr22", inclusion_mask=[(0, 100)])
+        assert contig3.mutation_rate == contig2.mutation_rate
+        assert memory_cache.hits == 2
+
+    def test_memory_cache_keys(self):
+        stdpopsim.clear_memory_cache()
+        memory_cache = stdpopsim.get_memory_cache()
+        self.species.get_contig("chr22")
+        self.species.get_contig("chr22", length_multiplier=0.5)
+        self.species.get_contig("chr22", mutation_rate=1e-9)
+        self.species.get_contig("chr22", inclusion_mask=[(0, 100)])
+        self.species.get_contig("chr22", inclusion_mask=[(0, 101)])
+        self.species.get_contig("chr22", exclusion_mask=[(0, 101)])
+        self.species.get_contig("chr21")
+        self.species.get_contig("chr22", left=100)
+        self.species.get_contig("chr22", left=100, shift_coordinates=True)
+        assert memory_cache.hits == 0
+        assert memory_cache.misses == 9
+
     def test_genetic_map(self):
         # TODO we should use a different map here so we're not hitting the cache.
         contig = self.species.get_contig("chr22", genetic_map="HapMapII_GRCh37")
@@ -262,6 +585,25 @@ class TestGetContig(unittest.TestCase):
                 "chr22", exclusion_mask=[(0, 100)], length_multiplier=0.1
             )
 
+    def test_autosomes(self):
+        autosomes = self.species.genome.autosomes
+        self.assertEqual(
+            [chrom.id for chrom in autosomes], [str(j) for j in range(1, 23)]
+        )
+
+    def test_catalog_non_autosomes(self):
+        for species_id, chrom_id in [
+            ("AnaPla", "Z"),
+            ("AraTha", "Pt"),
+            ("AraTha", "Mt"),
+            ("CaeEle", "MtDNA"),
+            ("DroMel", "mitochondrion_genome"),
+        ]:
+            species = stdpopsim.get_species(species_id)
+            self.assertNotIn(chrom_id, [c.id for c in species.genome.autosomes])
+            with self.assertWarns(stdpopsim.NonAutosomalWarning):
+                species.get_contig(chrom_id)
+
     def test_generic_contig(self):
         L = 1e6
         contig = self.species.get_contig(length=L)
@@ -2,13 +2,25 @@
 Tests for the utils module.
 """
 import unittest
+import gzip
+import hashlib
+import io
+import json
+import logging
 import os
 import pathlib
 import tarfile
 import tempfile
+import zipfile
+from unittest import mock
+
+import msprime
+import numpy as np
+import tskit
 
 from stdpopsim import utils
 from stdpopsim import Chromosome, Genome
+import tests
 
 
 class TestValidDemographicModelId(unittest.TestCase):
@@ -218,6 +230,86 @@ class TestDownload(unittest.TestCase):
                 self.assertFalse(output_filename.exists())
 
 
+class TestDownloadHTTP(unittest.TestCase):
+    """
+    Tests for downloading from a local HTTP server.
+    """
+
+    data = bytes(range(256)) * 4000
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmpdir.name) / "download"
+        self.expected_sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    def test_download(self):
+        with tests.LocalHTTPServer({"/data": self.data}) as server:
+            sha256 = utils.download(server.url("/data"), self.filename)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+        self.assertNotIn("Range", server.requests[0])
+
+    def test_not_found(self):
+        with tests.LocalHTTPServer({}) as server:
+            with self.assertRaises(OSError):
+                utils.download(server.url("/data"), self.filename)
+        self.assertFalse(self.filename.exists())
+
+    def test_resume(self):
+        with open(self.filename, "wb") as f:
+            f.write(self.data[:1000])
+        with tests.LocalHTTPServer({"/data": self.data}) as server:
+            sha256 = utils.download(server.url("/data"), self.filename, resume=True)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+        self.assertEqual(server.requests[0]["Range"], "bytes=1000-")
+
+    def test_no_resume(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"garbage")
+        with tests.LocalHTTPServer({"/data": self.data}) as server:
+            sha256 = utils.download(server.url("/data"), self.filename)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+        self.assertNotIn("Range", server.requests[0])
+
+    def test_resume_unsupported(self):
+        with open(self.filename, "wb") as f:
+            f.write(self.data[:1000])
+        with tests.LocalHTTPServer({"/data": self.data}, ranges=False) as server:
+            sha256 = utils.download(server.url("/data"), self.filename, resume=True)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+
+    def test_resume_complete(self):
+        with open(self.filename, "wb") as f:
+            f.write(self.data)
+        with tests.LocalHTTPServer({"/data": self.data}) as server:
+            sha256 = utils.download(server.url("/data"), self.filename, resume=True)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+
+    def test_interrupted(self):
+        with tests.LocalHTTPServer({"/data": self.data}) as server:
+            url = server.url("/data")
+            server.truncate = 300000
+            with self.assertRaises(ConnectionError):
+                utils.download(url, self.filename, resume=True)
+            self.assertEqual(self.read(), self.data[:300000])
+            server.truncate = None
+            sha256 = utils.download(url, self.filename, resume=True)
+        self.assertEqual(sha256, self.expected_sha256)
+        self.assertEqual(self.read(), self.data)
+        self.assertEqual(server.requests[1]["Range"], "bytes=300000-")
+
+
 class TestSha256(unittest.TestCase):
     # These tests are not intended to comprehensively test sha256
     # calculations, as we assume the Python standard library tests
@@ -265,6 +357,30 @@ class TestCd(unittest.TestCase):
             self.assertEqual(pathlib.Path.cwd().resolve(), old_cwd)
 
 
+class TestLogStage(unittest.TestCase):
+    def test_max_rss(self):
+        with mock.patch("stdpopsim.utils._resource_module_available", False):
+            self.assertIsNone(utils.max_rss())
+        if utils._resource_module_available:
+            self.assertGreater(utils.max_rss(), 0)
+
+    def test_log_stage(self):
+        logger = logging.getLogger("stdpopsim.test")
+        with self.assertLogs(logger, level="INFO") as logs:
+            with utils.log_stage(logger, "Stage name"):
+                pass
+        self.assertEqual(len(logs.records), 1)
+        self.assertRegex(logs.records[0].getMessage(), r"^Stage name: \d+\.\d\ds")
+
+    def test_exception(self):
+        logger = logging.getLogger("stdpopsim.test")
+        with mock.patch.object(logger, "info") as mocked_info:
+            with self.assertRaises(ValueError):
+                with utils.log_stage(logger, "Stage name"):
+                    raise ValueError()
+        mocked_info.assert_not_called()
+
+
 def rm_f(filename):
     try:
         os.unlink(filename)
@@ -323,7 +439,7 @@ class TestUntar(unittest.TestCase):
                 rm_f(filename)
                 rm_f(tar)
 
-            for name in ("../nonexistant", "/nonexistant"):
+            for name in ("../nonexistant", "/nonexistant", "a/../../nonexistant"):
                 tar = tmpdir / "path-traversal.tgz"
                 filename = tmpdir / "test-thing"
                 with open(filename, "w") as f:
@@ -375,6 +491,221 @@ class TestUntar(unittest.TestCase):
                 rm_f(tar)
 
 
+class TestMergeIntervals(unittest.TestCase):
+    """
+    Tests for merging intervals.
+    """
+
+    def test_empty(self):
+        merged = utils.merge_intervals(np.zeros((0, 2)))
+        self.assertEqual(merged.shape, (0, 2))
+        self.assertEqual(merged.dtype, np.int64)
+        self.assertEqual(utils.merge_intervals([]).shape, (0, 2))
+
+    def test_disjoint(self):
+        intervals = np.array([[0, 10], [20, 30], [40, 50]])
+        merged = utils.merge_intervals(intervals)
+        self.assertTrue(np.array_equal(merged, intervals))
+        self.assertEqual(merged.dtype, np.int64)
+
+    def test_unsorted(self):
+        merged = utils.merge_intervals([[40, 50], [0, 10], [20, 30]])
+        self.assertTrue(np.array_equal(merged, [[0, 10], [20, 30], [40, 50]]))
+
+    def test_overlapping(self):
+        merged = utils.merge_intervals([[0, 10], [5, 15], [12, 20], [30, 40]])
+        self.assertTrue(np.array_equal(merged, [[0, 20], [30, 40]]))
+
+    def test_adjacent(self):
+        merged = utils.merge_intervals([[0, 10], [10, 20], [21, 30]])
+        self.assertTrue(np.array_equal(merged, [[0, 20], [21, 30]]))
+
+    def test_contained(self):
+        merged = utils.merge_intervals([[0, 100], [10, 20], [30, 40], [90, 110]])
+        self.assertTrue(np.array_equal(merged, [[0, 110]]))
+
+    def test_random(self):
+        rng = np.random.default_rng(1)
+        left = rng.integers(0, 1000, size=200)
+        intervals = np.column_stack([left, left + rng.integers(1, 20, size=200)])
+        merged = utils.merge_intervals(intervals)
+        covered = np.zeros(1100, dtype=bool)
+        for a, b in intervals:
+            covered[a:b] = True
+        expected = np.zeros(1100, dtype=bool)
+        for a, b in merged:
+            expected[a:b] = True
+        self.assertTrue(np.array_equal(covered, expected))
+        self.assertTrue(np.all(merged[1:, 0] > merged[:-1, 1]))
+
+
+class TestDownloadAndUntar(unittest.TestCase):
+    """
+    Tests for extracting tarballs as they are downloaded.
+    """
+
+    def make_tarball(self, tmpdir, mode="w:gz", filt=None):
+        with utils.cd(tmpdir):
+            os.mkdir("subdir")
+            for name in ["foo", "subdir/bar"]:
+                with open(name, "wb") as f:
+                    f.write(name.encode() * 1000)
+            with tarfile.open("test.tar", mode) as tf:
+                tf.add("foo", filter=filt)
+                tf.add("subdir", filter=filt)
+            with open("test.tar", "rb") as f:
+                return f.read()
+
+    def verify(self, data, dest):
+        with tests.LocalHTTPServer({"/test.tar": data}) as server:
+            sha256 = utils.download_and_untar(server.url("/test.tar"), dest)
+        self.assertEqual(sha256, hashlib.sha256(data).hexdigest())
+        for name in ["foo", "subdir/bar"]:
+            with open(dest / name, "rb") as f:
+                self.assertEqual(f.read(), name.encode() * 1000)
+
+    def test_gzip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir)
+            dest = tmpdir / "dest"
+            dest.mkdir()
+            self.verify(data, dest)
+
+    def test_uncompressed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir, mode="w")
+            dest = tmpdir / "dest"
+            dest.mkdir()
+            self.verify(data, dest)
+
+    def test_trailing_data(self):
+        # All the data are included in the checksum, even those after the end
+        # of the tar archive.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir, mode="w") + bytes(100000)
+            dest = tmpdir / "dest"
+            dest.mkdir()
+            self.verify(data, dest)
+
+    def test_bad_member(self):
+        def filt(info):
+            if info.name == "subdir/bar":
+                info.type = tarfile.FIFOTYPE
+            return info
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir, filt=filt)
+            dest = tmpdir / "dest"
+            dest.mkdir()
+            with tests.LocalHTTPServer({"/test.tar": data}) as server:
+                with self.assertRaises(ValueError):
+                    utils.download_and_untar(server.url("/test.tar"), dest)
+            self.assertFalse((dest / "subdir" / "bar").exists())
+
+    def test_path_traversal(self):
+        for prefix in ["../", "subdir/../../", "/tmp/"]:
+
+            def filt(info):
+                info.name = prefix + info.name
+                return info
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                tmpdir = pathlib.Path(tmpdir)
+                data = self.make_tarball(tmpdir, filt=filt)
+                dest = tmpdir / "dest"
+                dest.mkdir()
+                with tests.LocalHTTPServer({"/test.tar": data}) as server:
+                    with self.assertRaises(ValueError):
+                        utils.download_and_untar(server.url("/test.tar"), dest)
+                self.assertEqual(os.listdir(dest), [])
+
+    def test_links(self):
+        for type_ in [tarfile.SYMTYPE, tarfile.LNKTYPE]:
+
+            def filt(info):
+                if info.name == "foo":
+                    info.type = type_
+                    info.linkname = "../outside"
+                    info.size = 0
+                return info
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                tmpdir = pathlib.Path(tmpdir)
+                data = self.make_tarball(tmpdir, filt=filt)
+                dest = tmpdir / "dest"
+                dest.mkdir()
+                with tests.LocalHTTPServer({"/test.tar": data}) as server:
+                    with self.assertRaises(ValueError):
+                        utils.download_and_untar(server.url("/test.tar"), dest)
+                self.assertEqual(os.listdir(dest), [])
+
+    def test_symlinked_dest(self):
+        # A symbolic link within the destination can't be used to write
+        # outside of it.
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir)
+            dest = tmpdir / "dest"
+            dest.mkdir()
+            (tmpdir / "outside").mkdir()
+            (dest / "subdir").symlink_to(tmpdir / "outside")
+            with tests.LocalHTTPServer({"/test.tar": data}) as server:
+                with self.assertRaises(ValueError):
+                    utils.download_and_untar(server.url("/test.tar"), dest)
+            self.assertEqual(os.listdir(tmpdir / "outside"), [])
+
+
+class TestDownloadTarAsZip(unittest.TestCase):
+    """
+    Tests for repackaging tarballs into zip files as they are downloaded.
+    """
+
+    def make_tarball(self, tmpdir):
+        with utils.cd(tmpdir):
+            os.mkdir("subdir")
+            for name in ["foo", "subdir/bar"]:
+                with open(name, "wb") as f:
+                    f.write(name.encode() * 1000)
+            with tarfile.open("test.tar", "w:gz") as tf:
+                tf.add("foo", arcname="./foo")
+                tf.add("subdir")
+            with open("test.tar", "rb") as f:
+                return f.read()
+
+    def test_download_and_extract(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            data = self.make_tarball(tmpdir)
+            zip_file = tmpdir / "test.zip"
+            with tests.LocalHTTPServer({"/test.tar": data}) as server:
+                sha256 = utils.download_tar_as_zip(server.url("/test.tar"), zip_file)
+            self.assertEqual(sha256, hashlib.sha256(data).hexdigest())
+            with zipfile.ZipFile(zip_file) as zf:
+                self.assertEqual(sorted(zf.namelist()), ["foo", "subdir/bar"])
+            dest = tmpdir / "dest"
+            for name in ["foo", "subdir/bar"]:
+                path = utils.extract_zip_member(zip_file, name, dest)
+                self.assertEqual(path, dest / name)
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), name.encode() * 1000)
+            self.assertIsNone(utils.extract_zip_member(zip_file, "baz", dest))
+            self.assertEqual(sorted(os.listdir(dest)), ["foo", "subdir"])
+
+    def test_bad_member(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            zip_file = tmpdir / "test.zip"
+            with zipfile.ZipFile(zip_file, "w") as zf:
+                zf.writestr("foo", b"foo")
+            for name in ["../foo", "/foo", "subdir/../../foo"]:
+                with self.assertRaises(ValueError):
+                    utils.extract_zip_member(zip_file, name, tmpdir / "dest")
+
+
 class TestSynonyms(unittest.TestCase):
     def test_add_digit_autosomes(self):
         chroms = [
@@ -434,3 +765,137 @@ class TestSynonyms(unittest.TestCase):
         utils.append_common_synonyms(genome)
         self.assertTrue("chr1" in genome.chromosomes[0].synonyms)
         self.assertEqual(len(genome.chromosomes[0].synonyms), 1)
+
+
+class TestDumpTreeSequence(unittest.TestCase):
+    """
+    Tests for writing tree sequences to file objects.
+    """
+
+    def setUp(self):
+        self.ts = msprime.simulate(10, mutation_rate=1, random_seed=1)
+
+    def verify(self, data):
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(0)
+            ts = tskit.load(f)
+        self.ts.tables.assert_equals(ts.tables)
+
+    def test_file(self):
+        with tempfile.TemporaryFile() as f:
+            utils.dump_tree_sequence(self.ts, f)
+            f.seek(0)
+            self.verify(f.read())
+
+    def test_bytes_io(self):
+        buff = io.BytesIO()
+        utils.dump_tree_sequence(self.ts, buff)
+        self.verify(buff.getvalue())
+
+    def test_compress(self):
+        buff = io.BytesIO()
+        utils.dump_tree_sequence(self.ts, buff, compress=True)
+        self.verify(gzip.decompress(buff.getvalue()))
+
+    def test_compress_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = pathlib.Path(tmpdir) / "out.trees.gz"
+            with open(filename, "wb") as f:
+                utils.dump_tree_sequence(self.ts, f, compress=True)
+            with gzip.open(filename) as f:
+                self.verify(f.read())
+
+    def test_provenance(self):
+        provenance = {"software": {"name": "test"}}
+        buff = io.BytesIO()
+        with mock.patch(
+            "tskit.TableCollection.tree_sequence", autospec=True
+        ) as mocked_tree_sequence:
+            utils.dump_tree_sequence(self.ts, buff, provenance=provenance)
+        mocked_tree_sequence.assert_not_called()
+        with tempfile.TemporaryFile() as f:
+            f.write(buff.getvalue())
+            f.seek(0)
+            ts = tskit.load(f)
+        self.assertEqual(ts.num_provenances, self.ts.num_provenances + 1)
+        record = ts.provenance(ts.num_provenances - 1).record
+        self.assertEqual(json.loads(record), provenance)
+        self.ts.tables.assert_equals(ts.tables, ignore_provenance=True)
+
+    def test_write_error(self):
+        class BadFile(io.RawIOBase):
+            def writable(self):
+                return True
+
+            def write(self, data):
+                raise OSError("write failed")
+
+        with self.assertRaises(OSError):
+            utils.dump_tree_sequence(self.ts, BadFile())
+
+
+class TestReplicateProvenance(unittest.TestCase):
+    def test_replicate_provenance(self):
+        provenance = {"software": {"name": "test"}, "parameters": {"x": [1]}}
+        record = utils.replicate_provenance(provenance, 3)
+        self.assertEqual(record["parameters"], {"x": [1], "replicate": 3})
+        self.assertEqual(record["software"], provenance["software"])
+        # The original record is not modified.
+        record["parameters"]["x"].append(2)
+        self.assertEqual(provenance["parameters"], {"x": [1]})
+
+
+class TestFinaliseTreeSequence(unittest.TestCase):
+    """
+    Tests for finalising the tree sequence output by the engines.
+    """
+
+    def setUp(self):
+        self.ts = msprime.simulate(
+            10, length=100, recombination_rate=0.1, mutation_rate=0.1, random_seed=1
+        )
+
+    def test_nothing_to_do(self):
+        with mock.patch("tskit.TreeSequence.dump_tables", autospec=True) as mocked:
+            ts = utils.finalise_tree_sequence(self.ts, flanks=np.zeros((0, 2)))
+            mocked.assert_not_called()
+        self.assertIs(ts, self.ts)
+
+    def test_masks(self):
+        inclusion_mask = np.array([[10, 60]])
+        exclusion_mask = np.array([[20, 30]])
+        ts = utils.finalise_tree_sequence(
+            self.ts, inclusion_mask=inclusion_mask, exclusion_mask=exclusion_mask
+        )
+        expected = utils.mask_tree_sequence(self.ts, inclusion_mask, False)
+        expected = utils.mask_tree_sequence(expected, exclusion_mask, True)
+        ts.tables.assert_equals(expected.tables, ignore_provenance=True)
+
+    def test_flanks(self):
+        flanks = np.array([[0, 10], [90, 100]])
+        ts = utils.finalise_tree_sequence(self.ts, flanks=flanks)
+        expected = self.ts.delete_intervals(flanks, simplify=False)
+        ts.tables.assert_equals(expected.tables, ignore_provenance=True)
+        self.assertEqual(ts.num_nodes, self.ts.num_nodes)
+
+    def test_shift_tables(self):
+        tables = self.ts.dump_tables()
+        utils.shift_tables(tables, 50, 200)
+        ts = tables.tree_sequence()
+        self.assertEqual(ts.sequence_length, 200)
+        self.assertTrue(np.all(ts.tables.edges.left >= 50))
+        self.assertTrue(np.all(ts.tables.edges.right <= 150))
+        self.assertTrue(
+            np.array_equal(ts.tables.sites.position, self.ts.tables.sites.position + 50)
+        )
+        self.assertEqual(ts.num_trees, self.ts.num_trees + 2)
+        self.assertEqual(ts.at(75).parent_dict, self.ts.at(25).parent_dict)
+
+    def test_provenance(self):
+        provenance = {"software": {"name": "test"}}
+        ts = utils.finalise_tree_sequence(self.ts, provenance=provenance)
+        self.assertEqual(ts.num_provenances, self.ts.num_provenances + 1)
+        record = ts.provenance(ts.num_provenances - 1).record
+        self.assertEqual(json.loads(record), provenance)
+        ts.tables.assert_equals(self.ts.tables, ignore_provenance=True)